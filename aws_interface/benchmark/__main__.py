@@ -0,0 +1,106 @@
+"""
+End to end benchmark of abstracted_handler against a local backend.
+Run from the aws_interface directory:
+    python -m benchmark --backend memory --workloads query_items_3 get_items_paging --json result.json
+The aws backend runs AWSResource against moto, the AWS API calls of each workload are counted.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from benchmark.harness import AWSCallCounter, BackendCallCounter, run_workload
+from benchmark.workloads import get_workloads
+from resource import get_resource
+
+# moto accepts any credential, they are set so boto3 never looks for real ones
+MOTO_ENVIRON = {
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'AWS_SESSION_TOKEN': 'benchmark',
+    'AWS_DEFAULT_REGION': 'ap-northeast-2',
+}
+
+
+def mock_aws():
+    try:
+        from moto import mock_aws
+    except ImportError:
+        print('moto is required to benchmark the aws backend, pip install "moto[dynamodb,s3]"')
+        raise
+    os.environ.update(MOTO_ENVIRON)
+    return mock_aws()
+
+
+def create_aws_resource(app_id):
+    """
+    Create the table and bucket of app_id in moto like AWSResourceAllocator does.
+    :return: resource, AWSCallCounter of its session
+    """
+    import boto3
+    from resource.wrapper.boto3_wrapper import DynamoDB, S3
+    boto3_session = boto3.Session()
+    aws_counter = AWSCallCounter(boto3_session)
+    DynamoDB(boto3_session).init_table(app_id)
+    S3(boto3_session).init_bucket(app_id)
+    return get_resource('aws', None, app_id, boto3_session), aws_counter
+
+
+def main():
+    workloads = get_workloads()
+    parser = argparse.ArgumentParser(description='Benchmark cloud modules through abstracted_handler')
+    parser.add_argument('--backend', choices=['memory', 'sqlite', 'aws'], default='memory')
+    parser.add_argument('--workloads', nargs='*', choices=[workload.name for workload in workloads],
+                        help='workloads to run, all by default')
+    parser.add_argument('--iterations', type=int, default=None, help='override the iterations of every workload')
+    parser.add_argument('--items', type=int, default=None,
+                        help='items of the queried partition, 2000 by default and 100 on aws '
+                             'where moto copies the table on every transaction')
+    parser.add_argument('--json', default=None, help='write the results to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    credential = {'sqlite': {'directory': directory}}
+    app_id = 'benchmark-{}'.format(int(time.time()))
+    mock = mock_aws() if args.backend == 'aws' else contextlib.suppress()
+
+    results = []
+    try:
+        with mock:
+            aws_counter = None
+            if args.backend == 'aws':
+                resource, aws_counter = create_aws_resource(app_id)
+            else:
+                resource = get_resource(args.backend, credential, app_id)
+            counter = BackendCallCounter(resource)
+            context = {'resource': resource, 'item_count': args.items or (100 if aws_counter else 2000)}
+            print('{:<18} {:>8} {:>12} {:>10} {:>10} {:>14} {:>14}'.format(
+                'workload', 'ops', 'ops/sec', 'p50 ms', 'p99 ms', 'calls/op', 'aws calls/op'))
+            for workload in workloads:
+                if args.workloads and workload.name not in args.workloads:
+                    continue
+                result = run_workload(workload, context, counter, args.iterations, aws_counter)
+                results.append(result)
+                print('{workload:<18} {iterations:>8} {ops_per_sec:>12.1f} {p50_ms:>10.3f} {p99_ms:>10.3f} '
+                      '{backend_calls_per_op:>14.1f} {aws_calls_text:>14}'.format(
+                          aws_calls_text='-' if aws_counter is None else '{:.1f}'.format(result['aws_calls_per_op']),
+                          **result))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({
+                'backend': args.backend,
+                'python': platform.python_version(),
+                'time': int(time.time()),
+                'results': results,
+            }, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import functools
+import threading
+import time
+from collections import Counter
+
+from resource.base import Resource
+
+BACKEND_METHOD_PREFIXES = ('db_', 'file_', 'sl_')
+
+
+class BackendCallCounter:
+    """
+    Count the calls a resource makes to its backend.
+    Only methods implemented by the backend class are counted, so composite methods of Resource
+    like db_query count the backend reads they are made of instead of themselves.
+    """
+    def __init__(self, resource):
+        self.resource = resource
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        for name in dir(type(resource)):
+            if not name.startswith(BACKEND_METHOD_PREFIXES):
+                continue
+            method = getattr(type(resource), name)
+            if not callable(method) or getattr(Resource, name, None) is method:
+                continue
+            setattr(resource, name, self._wrap(name, getattr(resource, name)))
+
+    def _wrap(self, name, method):
+        @functools.wraps(method)
+        def counted(*args, **kwargs):
+            with self._lock:
+                self.counts[name] += 1
+            return method(*args, **kwargs)
+        return counted
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+class AWSCallCounter:
+    """
+    Count the AWS API calls made through a boto3 session, by service and operation.
+    Clients copy the handlers of the session when they are created, so it must be made before them.
+    """
+    def __init__(self, boto3_session):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        boto3_session.events.register('before-call.*.*', self._count)
+
+    def _count(self, model, **kwargs):
+        with self._lock:
+            self.counts['{}.{}'.format(model.service_model.service_name, model.name)] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+def percentile(sorted_values, ratio):
+    """Nearest rank percentile of sorted_values, ratio in [0, 1]"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(ratio * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run_workload(workload, context, counter, iterations=None, aws_counter=None):
+    """
+    Run workload.setup once then workload.run iterations times, only runs are measured.
+    :param aws_counter: AWSCallCounter of the session of an AWS resource, None for other backends
+    :return: dict of ops/sec, p50/p99 latency in milliseconds, backend calls and AWS API calls per op
+    """
+    iterations = iterations or workload.iterations
+    workload.setup(context)
+    counter.reset()
+    if aws_counter:
+        aws_counter.reset()
+    latencies = []
+    started_at = time.perf_counter()
+    for idx in range(iterations):
+        op_started_at = time.perf_counter()
+        workload.run(context, idx)
+        latencies.append(time.perf_counter() - op_started_at)
+    elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    return {
+        'workload': workload.name,
+        'iterations': iterations,
+        'ops_per_sec': iterations / elapsed if elapsed else None,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'backend_calls_per_op': counter.total() / iterations,
+        'backend_calls': dict(counter.counts.most_common()),
+        'aws_calls_per_op': aws_counter.total() / iterations if aws_counter else None,
+        'aws_calls': dict(aws_counter.counts.most_common()) if aws_counter else None,
+    }
@@ -0,0 +1,156 @@
+import base64
+import os
+
+from cloud.lambda_function import abstracted_handler
+
+
+class Workload:
+    """
+    One benchmarked operation.
+    setup(context) prepares data once, run(context, idx) is the measured operation.
+    """
+    def __init__(self, name, setup, run, iterations):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.iterations = iterations
+
+
+def call(context, module_name, **params):
+    params['module_name'] = module_name
+    if context.get('session_id', None):
+        params['session_id'] = context['session_id']
+    response = abstracted_handler(params, context['resource'])
+    body = response.get('body', {})
+    if response.get('statusCode', 200) != 200 or body.get('success', True) is False:
+        raise BaseException('{} failed: {}'.format(module_name, body))
+    return body
+
+
+def ensure_session(context):
+    if context.get('session_id', None):
+        return
+    email = 'benchmark@example.com'
+    call(context, 'cloud.auth.register', email=email, password='password')
+    context['session_id'] = call(context, 'cloud.auth.login', email=email, password='password')['session_id']
+
+
+def setup_nothing(context):
+    pass
+
+
+def run_register_login(context, idx):
+    email = 'user-{}@example.com'.format(idx)
+    call(context, 'cloud.auth.register', email=email, password='password')
+    call(context, 'cloud.auth.login', email=email, password='password')
+
+
+def setup_create_item(context):
+    ensure_session(context)
+    context['resource'].db_create_partition('benchmark-create')
+
+
+def run_create_item(context, idx):
+    call(context, 'cloud.database.create_item', partition='benchmark-create',
+         item={'number': idx, 'parity': idx % 2}, read_groups=['owner'], write_groups=['owner'])
+
+
+def setup_items(context):
+    ensure_session(context)
+    if context.get('items_ready', False):
+        return
+    resource = context['resource']
+    resource.db_create_partition('benchmark')
+    for idx in range(context.get('item_count', 2000)):
+        item = {
+            'mod2': idx % 2,
+            'mod3': idx % 3,
+            'mod5': idx % 5,
+            'mod7': idx % 7,
+            'number': idx,
+            'name': 'name-{:05d}'.format(idx),
+            'read_groups': ['user', 'admin'],
+            'write_groups': ['admin'],
+        }
+        resource.db_put_item('benchmark', item, creation_date=1000000 + idx // 10)
+    context['items_ready'] = True
+
+
+QUERIES = {
+    1: [
+        {'option': None, 'field': 'mod7', 'condition': 'eq', 'value': 3},
+    ],
+    3: [
+        {'option': None, 'field': 'mod2', 'condition': 'eq', 'value': 1},
+        {'option': 'and', 'field': 'mod3', 'condition': 'eq', 'value': 2},
+        {'option': 'and', 'field': 'number', 'condition': 'gt', 'value': 500},
+    ],
+    5: [
+        {'option': None, 'field': 'mod2', 'condition': 'eq', 'value': 0},
+        {'option': 'and', 'field': 'mod5', 'condition': 'eq', 'value': 4},
+        {'option': 'or', 'field': 'mod7', 'condition': 'eq', 'value': 6},
+        {'option': 'and', 'field': 'number', 'condition': 'ls', 'value': 1500},
+        {'option': 'and', 'field': 'name', 'condition': 'ge', 'value': 'name-00100'},
+    ],
+}
+
+
+def query_items_runner(instruction_count):
+    def run(context, idx):
+        call(context, 'cloud.database.query_items', partition='benchmark', query=QUERIES[instruction_count],
+             limit=50)
+    return run
+
+
+def run_get_items_paging(context, idx):
+    """Walk the whole partition page by page"""
+    start_key = None
+    while True:
+        body = call(context, 'cloud.database.get_items', partition='benchmark', start_key=start_key, limit=100)
+        start_key = body.get('end_key', None)
+        if not start_key:
+            return
+
+
+def file_runner(megabytes):
+    part_size = 1024 * 1024 * 8  # Parts but the last must be at least 5 MB
+
+    def setup(context):
+        ensure_session(context)
+        context['file_bin'] = os.urandom(megabytes * 1024 * 1024)
+
+    def run(context, idx):
+        """Multipart upload then download of the chunks of the manifest, by byte ranges of part_size"""
+        file_bin = context['file_bin']
+        upload = call(context, 'cloud.storage.create_multipart_upload', file_name='benchmark',
+                      read_groups=['owner'], write_groups=['owner'])
+        file_id = upload['file_id']
+        parts = []
+        for part_number, start in enumerate(range(0, len(file_bin), part_size), 1):
+            file_b64 = base64.b64encode(file_bin[start:start + part_size]).decode('utf-8')
+            etag = call(context, 'cloud.storage.upload_part_b64', file_id=file_id, part_number=part_number,
+                        file_b64=file_b64)['etag']
+            parts.append({'part_number': part_number, 'etag': etag})
+        call(context, 'cloud.storage.complete_upload', file_id=file_id, parts=parts)
+
+        manifest = call(context, 'cloud.storage.get_file_manifest', file_id=file_id)
+        for chunk in manifest['chunks']:
+            for start in range(0, chunk['size'], part_size):
+                end = min(start + part_size, chunk['size']) - 1
+                call(context, 'cloud.storage.download_b64', file_id=chunk['file_id'], start=start, end=end)
+    return setup, run
+
+
+def get_workloads():
+    workloads = [
+        Workload('register_login', setup_nothing, run_register_login, 200),
+        Workload('create_item', setup_create_item, run_create_item, 500),
+    ]
+    for instruction_count in sorted(QUERIES):
+        workloads.append(Workload('query_items_{}'.format(instruction_count), setup_items,
+                                  query_items_runner(instruction_count), 200))
+    workloads.append(Workload('get_items_paging', setup_items, run_get_items_paging, 20))
+    for megabytes, iterations in ((1, 20), (10, 5), (100, 1)):
+        setup, run = file_runner(megabytes)
+        workloads.append(Workload('file_{}mb'.format(megabytes), setup, run, iterations))
+    return workloads
@@ -1,5 +1,6 @@
 
 from cloud.response import Response
+import cloud.auth.get_me as get_me
 
 
 # Define the input output format of the function.
@@ -20,5 +21,7 @@ def do(data, resource):
 
     session_ids = params.get('session_ids', [])
     success = resource.db_delete_item_batch(session_ids)
+    for session_id in session_ids:
+        get_me.invalidate_session(resource, session_id)
     body['success'] = success
     return Response(body)
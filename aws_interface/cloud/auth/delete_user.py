@@ -1,5 +1,6 @@
 
 from cloud.response import Response
+import cloud.auth.get_me as get_me
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -20,5 +21,6 @@ def do(data, resource):
     params = data['params']
     user_id = params.get('user_id', None)
     success = resource.db_delete_item(user_id)
+    get_me.invalidate_user(resource, user_id)
     body['success'] = success
     return Response(body)
@@ -1,5 +1,6 @@
 
 from cloud.response import Response
+import cloud.auth.get_me as get_me
 
 
 # Define the input output format of the function.
@@ -28,4 +29,5 @@ def do(data, resource):
         groups.pop(name)
     body['groups'] = groups
     resource.db_put_item('meta-info', item, 'user_groups')
+    get_me.invalidate_app(resource)
     return Response(body)
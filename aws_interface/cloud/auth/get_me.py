@@ -1,5 +1,15 @@
 
+
+import os
 from cloud.response import Response
+from cloud.cache import TTLCache
+
+# Resolved users by (app_id, session_id). Entries are dropped on logout in this container,
+# a logout or user change in another container is seen here after at most ttl seconds.
+session_cache = TTLCache(
+    max_size=int(os.environ.get('AWS_INTERFACE_SESSION_CACHE_SIZE', 1024)),
+    ttl=int(os.environ.get('AWS_INTERFACE_SESSION_CACHE_TTL', 60)),
+)
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -21,10 +31,29 @@ info = {
 }
 
 
+def invalidate_session(resource, session_id):
+    session_cache.pop((resource.app_id, session_id))
+
+
+def invalidate_user(resource, user_id):
+    app_id = resource.app_id
+    session_cache.pop_if(lambda key, user: key[0] == app_id and user.get('id', None) == user_id)
+
+
+def invalidate_app(resource):
+    app_id = resource.app_id
+    session_cache.pop_if(lambda key, user: key[0] == app_id)
+
+
 def do(data, resource):
     body = {}
     params = data['params']
     session_id = params.get('session_id', None)
+    if session_id:
+        user = session_cache.get((resource.app_id, session_id), None)
+        if user:
+            body['item'] = user
+            return Response(body)
     try:
         item = resource.db_get_item(session_id)
     except BaseException as ex:
@@ -32,10 +61,14 @@ def do(data, resource):
         body['message'] = 'permission denied'
         return Response(body)
 
-    user_id = item.get('userId', None)
+    user_id = None
+    if item:
+        user_id = item.get('userId', None)
     if user_id:
         user = resource.db_get_item(user_id)
         body['item'] = user
+        if user:
+            session_cache.set((resource.app_id, session_id), user)
     else:
         body['item'] = None
     return Response(body)
@@ -29,8 +29,11 @@ def do(data, resource):
     start_key = params.get('start_key', None)
     limit = params.get('limit', 100)
     partition = 'user'
+    # Password hashes and salts are never listed
+    projection = ['id', 'creationDate', 'email', 'groups', 'extra', 'loginMethod']
 
-    items, end_key = resource.db_get_items_in_partition(partition, exclusive_start_key=start_key, limit=limit)
+    items, end_key = resource.db_get_items_in_partition(partition, exclusive_start_key=start_key, limit=limit,
+                                                        projection=projection)
     body['items'] = items
     body['end_key'] = end_key
     return Response(body)
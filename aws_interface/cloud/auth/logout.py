@@ -1,5 +1,6 @@
 
 from cloud.response import Response
+import cloud.auth.get_me as get_me
 
 
 # Define the input output format of the function.
@@ -20,5 +21,6 @@ def do(data, resource):
 
     session_id = params.get('session_id', None)
     resource.db_delete_item(session_id)
+    get_me.invalidate_session(resource, session_id)
     body['message'] = '로그아웃 되었습니다.'
     return Response(body)
@@ -1,5 +1,6 @@
 
 from cloud.response import Response
+import cloud.auth.get_me as get_me
 
 
 # Define the input output format of the function.
@@ -32,6 +33,7 @@ def do(data, resource):
 
     item['groups'] = groups
     resource.db_put_item('meta-info', item, 'user_groups')
+    get_me.invalidate_app(resource)
 
     body['success'] = True
     return Response(body)
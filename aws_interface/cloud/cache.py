@@ -0,0 +1,58 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    In-container cache bounded by size (least recently used entries are evicted first)
+    and by age (entries older than ttl seconds are treated as missing).
+    """
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._items.get(key, None)
+            if entry is None:
+                return default
+            expire_at, value = entry
+            if expire_at < time.time():
+                self._items.pop(key)
+                return default
+            self._items.move_to_end(key)
+            return copy.deepcopy(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.time() + self.ttl, copy.deepcopy(value))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._items.pop(key, None)
+        if entry:
+            return entry[1]
+        return None
+
+    def pop_if(self, predicate):
+        """
+        Remove every entry satisfying predicate
+        :param predicate: function(key, value) -> bool
+        :return: number of removed entries
+        """
+        with self._lock:
+            keys = [key for key, (_, value) in self._items.items() if predicate(key, value)]
+            for key in keys:
+                self._items.pop(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,27 @@
+
+from cloud.response import Response
+
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+        'partition': 'str',
+        'field': 'str',
+    },
+    'output_format': {
+        'success': 'bool'
+    }
+}
+
+
+def do(data, resource):
+    body = {}
+    params = data['params']
+    partition = params.get('partition', None)
+    field = params.get('field', None)
+    success = resource.db_create_range_index(partition, field)
+
+    body['success'] = success
+    return Response(body)
@@ -1,7 +1,6 @@
 
 from cloud.response import Response
 from cloud.util import has_read_permission
-import json
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -10,14 +9,16 @@ info = {
         'session_id': 'str',
         'partition': 'str',
         'query': 'list',
-        'start_key': 'dict',
+        'start_key': 'str',
         'limit': 'int=100',
+        'explain': 'bool=False',
     },
     'output_format': {
         'items': 'list',
         'end_key': 'str',
         'success': 'bool',
         'message': 'str?',
+        'explain': 'dict?',
     }
 }
 
@@ -31,12 +32,13 @@ def do(data, resource):
     query_instructions = params.get('query', None)
     start_key = params.get('start_key', None)
     limit = params.get('limit', 100)
-
-    if type(start_key) is str:
-        start_key = json.loads(start_key)
+    explain = params.get('explain', False)
 
     if resource.db_get_item(partition):
-        items, end_key = resource.db_query(partition, query_instructions, start_key, limit)
+        plan = None
+        if explain:
+            plan = resource.db_query_plan(partition, query_instructions, limit)
+        items, end_key = resource.db_query(partition, query_instructions, start_key, limit, plan)
 
         filtered = []
         for item in items:
@@ -46,6 +48,8 @@ def do(data, resource):
         body['items'] = filtered
         body['end_key'] = end_key
         body['success'] = True
+        if explain:
+            body['explain'] = plan
         return Response(body)
     else:
         body['items'] = []
@@ -1,8 +1,12 @@
+import copy
 import importlib
+import os
 import cloud.auth.get_me as get_me
 import cloud.log.create_log as create_log
+import cloud.logic as logic
+import resource.trace as trace
+from concurrent.futures import ThreadPoolExecutor
 from resource import get_resource
-import sys
 
 
 CALLABLE_MODULE_WHITE_LIST = {
@@ -31,47 +35,234 @@ CALLABLE_MODULE_WHITE_LIST = {
     'cloud.database.update_item',
     # log
     'cloud.log.create_log',
+    'cloud.log.create_logs',
     # logic
+    'cloud.logic.get_job',
     'cloud.logic.run_function',
+    'cloud.logic.run_functions',
     # storage
+    'cloud.storage.abort_upload',
+    'cloud.storage.complete_upload',
+    'cloud.storage.create_multipart_upload',
     'cloud.storage.delete_b64',
     'cloud.storage.download_b64',
+    'cloud.storage.get_download_url',
+    'cloud.storage.get_file_manifest',
+    'cloud.storage.get_upload_part_urls',
+    'cloud.storage.get_upload_url',
     'cloud.storage.upload_b64',
+    'cloud.storage.upload_part_b64',
 }
 
 
-# AWS Lambda handler
-def aws_handler(event, context):
+# Callable module name -> do function, built once per container so invocations skip the import machinery.
+# Modules without do function are left out and answered like modules outside the white list.
+DISPATCH_TABLE = {}
+for _module_name in CALLABLE_MODULE_WHITE_LIST:
+    _do = getattr(importlib.import_module(_module_name), 'do', None)
+    if _do:
+        DISPATCH_TABLE[_module_name] = _do
+
+# Batch envelopes: {'module_name': 'batch', 'session_id': str, 'operations': [{'module_name': str, 'params': dict}],
+#                   'sequential': bool}
+BATCH_MODULE_NAME = 'batch'
+BATCH_MAX_OPERATIONS = int(os.environ.get('AWS_INTERFACE_BATCH_MAX_OPERATIONS', 25))
+BATCH_MAX_WORKERS = int(os.environ.get('AWS_INTERFACE_BATCH_MAX_WORKERS', 8))
+# Shared by every batch of the container, so its threads keep their pooled boto3 resources between invocations
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS)
+
+# When enabled, requests of admin sessions with 'trace': true get a summary of their backend calls
+# in body['debug']['trace'], traces are appended to AWS_INTERFACE_TRACE_EXPORT_PATH as JSON lines when it is set.
+TRACE_ENABLED = os.environ.get('AWS_INTERFACE_TRACE_ENABLED', 'false').lower() == 'true'
+TRACE_EXPORT_PATH = os.environ.get('AWS_INTERFACE_TRACE_EXPORT_PATH', None)
+
+# Shared by every invocation of the container, set up by init_aws_resource
+_aws_resource = None
+
+
+def init_aws_resource():
+    """
+    Read the app id and create the session, resource and clients of the container once.
+    It runs on import inside Lambda so it is part of the cold start, not of the first invocation.
+    """
+    global _aws_resource
     import boto3
-    vendor = 'aws'
-    params = event
+    from resource.wrapper.boto3_wrapper import get_boto3_client, get_boto3_resource
     with open('./cloud/app_id.txt', 'r') as file:
         app_id = file.read()
-    resource = get_resource(vendor, None, app_id, boto3.Session())
-    return abstracted_handler(params, resource)
+    boto3_session = boto3.Session()
+    for service_name in ('dynamodb', 's3', 'lambda'):
+        get_boto3_client(boto3_session, service_name)
+    get_boto3_resource(boto3_session, 'dynamodb')
+    _aws_resource = get_resource('aws', None, app_id, boto3_session)
+    return _aws_resource
+
+
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME', None):
+    init_aws_resource()
+
+
+# AWS Lambda handler
+def aws_handler(event, context):
+    resource = _aws_resource or init_aws_resource()
+    return event_handler(event, resource)
+
+
+# AWS Lambda handler of the job function, which is only invoked by resource.sl_invoke_job_async.
+# It is a separate function so events sent through the REST API never reach it.
+def aws_job_handler(event, context):
+    resource = _aws_resource or init_aws_resource()
+    return job_event_handler(event, resource)
+
+
+def event_handler(event, resource):
+    if event.get('warm_up', False):  # Scheduled ping keeping the container initialized
+        return {
+            'statusCode': 200,
+            'body': {
+                'warm_up': True,
+            }
+        }
+    return abstracted_handler(event, resource)
+
+
+def job_event_handler(event, resource):
+    success = False
+    if event.get('logic_job_id', None):  # Queued by cloud.logic.create_job
+        success = logic.run_job(resource, event['logic_job_id'])
+    return {
+        'statusCode': 200,
+        'body': {
+            'success': success,
+        }
+    }
 
 
 def abstracted_handler(params, resource):
+    if TRACE_ENABLED and params.get('trace', False) is True and is_admin(get_user(params, resource)):
+        return traced_handler(params, resource)
+    return dispatch(params, resource)
+
+
+def get_user(params, resource):
+    """:return: user of the session_id of params or None"""
+    data = {
+        'params': params,
+        'admin': False,
+    }
+    return get_me.do(data, resource).get('body', {}).get('item', None)
+
+
+def is_admin(user):
+    return bool(user) and 'admin' in user.get('groups', [])
+
+
+def traced_handler(params, resource):
+    current_trace = trace.start_trace()
+    try:
+        response = dispatch(params, resource)
+    finally:
+        trace.stop_trace()
+    response.setdefault('headers', {})['X-Trace-Id'] = current_trace.trace_id
+    if isinstance(response.get('body', None), dict):
+        response['body']['debug'] = {
+            'trace': current_trace.summary(),
+        }
+    if TRACE_EXPORT_PATH:
+        try:
+            current_trace.export(TRACE_EXPORT_PATH)
+        except Exception as ex:
+            print('trace export failed: {}'.format(ex))
+    return response
+
+
+def dispatch(params, resource):
+    if params.get('module_name', None) == BATCH_MODULE_NAME:
+        return batch_handler(params, resource)
     module_name = params.get('module_name', None)
-    if module_name not in CALLABLE_MODULE_WHITE_LIST:
-        print('module_name: {} not in CALLABLE_MODULE_WHITE_LIST'.format(module_name))
-        response = {
-            'statusCode': 403,
+    if module_name not in DISPATCH_TABLE:
+        return permission_denied(module_name)
+    user = get_user(params, resource)
+    return run_module(module_name, params, user, resource)
+
+
+def batch_handler(params, resource):
+    """
+    Run every operation of the envelope with the user resolved once.
+    Operations are independent and run concurrently unless the envelope is sequential,
+    responses keep the order of the operations.
+    """
+    operations = params.get('operations', None)
+    if not isinstance(operations, list) or len(operations) > BATCH_MAX_OPERATIONS:
+        return {
+            'statusCode': 400,
             'body': {
-                'message': 'permission denied'
+                'message': 'operations must be a list of at most {} operations'.format(BATCH_MAX_OPERATIONS)
             }
         }
-        return response
+    user = get_user(params, resource)
+    session_id = params.get('session_id', None)
+
+    def run_operation(operation):
+        if not isinstance(operation, dict) or not isinstance(operation.get('params', None) or {}, dict):
+            return {
+                'statusCode': 400,
+                'headers': {},
+                'body': {
+                    'message': "an operation must be {'module_name': str, 'params': dict}"
+                }
+            }
+        module_name = operation.get('module_name', None)
+        if module_name not in DISPATCH_TABLE:
+            return permission_denied(module_name)
+        operation_params = dict(operation.get('params', None) or {})
+        operation_params['module_name'] = module_name
+        operation_params.pop('session_id', None)  # Every operation runs as the user of the envelope
+        if session_id:
+            operation_params['session_id'] = session_id
+        try:
+            return run_module(module_name, operation_params, copy.deepcopy(user), resource)
+        except Exception as ex:  # One failing operation does not fail the others
+            print('module_name: {} failed in batch: {}'.format(module_name, ex))
+            return {
+                'statusCode': 500,
+                'headers': {},
+                'body': {
+                    'message': 'internal error'
+                }
+            }
+
+    if params.get('sequential', False) or len(operations) < 2:
+        responses = [run_operation(operation) for operation in operations]
+    else:
+        responses = list(_batch_executor.map(trace.bind(run_operation), operations))
+    return {
+        'statusCode': 200,
+        'headers': {},
+        'body': {
+            'responses': responses,
+        }
+    }
+
+
+def permission_denied(module_name):
+    print('module_name: {} not in CALLABLE_MODULE_WHITE_LIST'.format(module_name))
+    response = {
+        'statusCode': 403,
+        'body': {
+            'message': 'permission denied'
+        }
+    }
+    return response
+
+
+def run_module(module_name, params, user, resource):
     data = {
         'params': params,
         'admin': False,
+        'user': user,
     }
-    user = get_me.do(data, resource).get('body', {}).get('item', None)
-    data['user'] = user
-
-    module = importlib.import_module(module_name)
-    sys.modules[module_name] = module
-    module_response = module.do(data, resource)
+    module_response = DISPATCH_TABLE[module_name](data, resource)
 
     response = {
         'statusCode': module_response.get('statusCode', 200),
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import random
+import time
+
+# Logs are written to hourly partitions 'log-<YYYYMMDDHH>-<shard>' instead of a single growing partition.
+# An hour is spread over LOG_SHARDS partitions, lowering it hides the logs of removed shards until they expire.
+LOG_BUCKET_SECONDS = 3600
+LOG_SHARDS = int(os.environ.get('AWS_INTERFACE_LOG_SHARDS', 4))
+# Logs expire this many days after they are written, 0 keeps them forever
+LOG_RETENTION_DAYS = int(os.environ.get('AWS_INTERFACE_LOG_RETENTION_DAYS', 90))
+# Logs written before time buckets, all older than the first bucket
+LEGACY_LOG_PARTITION = 'log'
+
+
+def get_log_bucket_partitions(bucket):
+    return ['log-{}-{}'.format(time.strftime('%Y%m%d%H', time.gmtime(bucket)), shard) for shard in range(LOG_SHARDS)]
+
+
+def get_log_partition(creation_date):
+    """:return: partition of a log created at creation_date, on a random shard of its bucket"""
+    bucket = creation_date - creation_date % LOG_BUCKET_SECONDS
+    return random.choice(get_log_bucket_partitions(bucket))
+
+
+def get_log_partition_groups(start_time, end_time):
+    """:return: partitions holding the logs created from start_time to end_time, grouped by bucket in time order"""
+    groups = [[LEGACY_LOG_PARTITION]]
+    bucket = start_time - start_time % LOG_BUCKET_SECONDS
+    while bucket <= end_time:
+        groups.append(get_log_bucket_partitions(bucket))
+        bucket += LOG_BUCKET_SECONDS
+    return groups
+
+
+def get_log_expiration(creation_date):
+    if LOG_RETENTION_DAYS <= 0:
+        return None
+    return creation_date + LOG_RETENTION_DAYS * 24 * 60 * 60
+
+
+# Counts of logs by (event_source, event_name) per minute and per hour, updated when logs are written.
+# Rollup rows are kept in partitions of partition_seconds, and are spread over LOG_SHARDS rows like logs.
+LOG_ROLLUPS = {
+    'minute': {
+        'seconds': 60,
+        'partition_seconds': 24 * 60 * 60,
+        'retention_days': int(os.environ.get('AWS_INTERFACE_LOG_MINUTE_ROLLUP_RETENTION_DAYS', 7)),
+    },
+    'hour': {
+        'seconds': 3600,
+        'partition_seconds': 30 * 24 * 60 * 60,
+        'retention_days': int(os.environ.get('AWS_INTERFACE_LOG_HOUR_ROLLUP_RETENTION_DAYS', 400)),
+    },
+}
+
+
+LOG_ROLLUP_PAGE_SIZE = 1000
+
+
+def get_log_rollup_partition(resolution, bucket):
+    partition_seconds = LOG_ROLLUPS[resolution]['partition_seconds']
+    partition_start = bucket - bucket % partition_seconds
+    return 'log-rollup-{}-{}'.format(resolution, time.strftime('%Y%m%d', time.gmtime(partition_start)))
+
+
+def get_log_rollup_partitions(resolution, start_time, end_time):
+    """:return: rollup partitions holding the buckets from start_time to end_time in time order"""
+    partition_seconds = LOG_ROLLUPS[resolution]['partition_seconds']
+    partitions = []
+    partition_start = start_time - start_time % partition_seconds
+    while partition_start <= end_time:
+        partitions.append(get_log_rollup_partition(resolution, partition_start))
+        partition_start += partition_seconds
+    return partitions
+
+
+def iter_log_partition_groups(resource, start_time, end_time, event_source=None, event_name=None):
+    """
+    Like get_log_partition_groups but without the hours which have no log, or no log of event_source
+    and event_name when they are set. Hours are found in the hour rollups, which are read lazily so a page
+    of logs stops reading them once it is full. All hours are yielded when the hour rollups do not outlive logs.
+    """
+    hour_retention_days = LOG_ROLLUPS['hour']['retention_days']
+    if hour_retention_days > 0 and (LOG_RETENTION_DAYS <= 0 or hour_retention_days < LOG_RETENTION_DAYS):
+        for partitions in get_log_partition_groups(start_time, end_time):
+            yield partitions
+        return
+
+    yield [LEGACY_LOG_PARTITION]
+    statements = [(field, 'eq', value) for field, value in (('event_source', event_source),
+                                                            ('event_name', event_name)) if value]
+    start_bucket = start_time - start_time % LOG_BUCKET_SECONDS
+    last_bucket = None
+    for partition in get_log_rollup_partitions('hour', start_bucket, end_time):
+        start_key = None
+        while True:
+            items, start_key = resource.db_get_items_in_partition_since(partition, start_bucket, start_key,
+                                                                        LOG_ROLLUP_PAGE_SIZE, statements)
+            for item in items:
+                bucket = int(item['creationDate'])
+                if bucket > end_time:
+                    return
+                if bucket == last_bucket or any(item.get(field, None) != value for field, _, value in statements):
+                    continue
+                last_bucket = bucket
+                yield get_log_bucket_partitions(bucket)
+            if not start_key:
+                break
+
+
+def add_log_rollups(resource, items):
+    """Add the logs in items, which have their creationDate set, to the rollup counts"""
+    counts = {}
+    for item in items:
+        for resolution, rollup in LOG_ROLLUPS.items():
+            bucket = item['creationDate'] - item['creationDate'] % rollup['seconds']
+            key = (resolution, bucket, item.get('event_source', None), item.get('event_name', None))
+            counts[key] = counts.get(key, 0) + 1
+
+    shard = random.randrange(LOG_SHARDS)
+    for (resolution, bucket, event_source, event_name), count in counts.items():
+        event_hash = hashlib.md5(json.dumps([event_source, event_name]).encode('utf-8')).hexdigest()
+        item_id = 'log-rollup-{}-{}-{}-{}'.format(resolution, bucket, shard, event_hash)
+        rollup_item = {
+            'event_source': event_source,
+            'event_name': event_name,
+        }
+        retention_days = LOG_ROLLUPS[resolution]['retention_days']
+        if retention_days > 0:
+            rollup_item[resource.ttl_field] = bucket + retention_days * 24 * 60 * 60
+        resource.db_add_to_item(get_log_rollup_partition(resolution, bucket), item_id, 'count', count,
+                                item=rollup_item, creation_date=bucket)
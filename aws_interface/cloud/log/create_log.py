@@ -1,5 +1,8 @@
 
+import time
+
 from cloud.response import Response
+from cloud.log import get_log_partition, get_log_expiration, add_log_rollups
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -19,7 +22,6 @@ info = {
 
 
 def do(data, resource):
-    partition = 'log'
     body = {}
     params = data['params']
     user = data.get('user', None)
@@ -35,7 +37,13 @@ def do(data, resource):
         item['event_source'] = event_source
         item['owner'] = user.get('id')
 
-        success = resource.db_put_item(partition, item)
+        now = int(time.time())
+        expiration = get_log_expiration(now)
+        if expiration:
+            item[resource.ttl_field] = expiration
+        success = resource.db_put_item(get_log_partition(now), item, creation_date=now)
+        if success:
+            add_log_rollups(resource, [dict(item, creationDate=now)])
 
         body['success'] = success
         return Response(body)
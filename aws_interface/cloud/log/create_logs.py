@@ -0,0 +1,64 @@
+import time
+
+from cloud.response import Response
+from cloud.log import get_log_partition, get_log_expiration, add_log_rollups
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+
+        'logs': 'list',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+        'count': 'int',
+    }
+}
+
+MAX_LOGS = 100
+
+
+def do(data, resource):
+    """
+    Write a batch of logs buffered by a client, logs is [{'event_source', 'event_name', 'event_param'}].
+    The batch goes to a single shard of the current time bucket.
+    """
+    body = {}
+    params = data['params']
+    user = data.get('user', None)
+
+    logs = params.get('logs', None)
+
+    if not user:
+        body['success'] = False
+        body['message'] = 'No user session'
+        return Response(body)
+    if not isinstance(logs, list) or len(logs) > MAX_LOGS or not all(isinstance(log, dict) for log in logs):
+        body['success'] = False
+        body['message'] = 'logs must be a list of at most {} logs'.format(MAX_LOGS)
+        return Response(body)
+
+    now = int(time.time())
+    expiration = get_log_expiration(now)
+    items = []
+    for log in logs:
+        item = dict()
+        item['event_name'] = log.get('event_name', None)
+        item['event_param'] = log.get('event_param', None)
+        item['event_source'] = log.get('event_source', None)
+        item['owner'] = user.get('id')
+        item['creationDate'] = now
+        if expiration:
+            item[resource.ttl_field] = expiration
+        items.append(item)
+
+    if items:
+        resource.db_put_items(get_log_partition(now), items)
+        add_log_rollups(resource, items)
+
+    body['success'] = True
+    body['count'] = len(items)
+    return Response(body)
@@ -0,0 +1,96 @@
+import time
+
+from cloud.response import Response
+from cloud.log import LOG_ROLLUPS, get_log_rollup_partitions
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+
+        'start_time': 'int?',
+        'end_time': 'int?',
+        'resolution': 'str?',
+        'event_source': 'str?',
+        'event_name': 'str?',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+        'resolution': 'str',
+        'series': 'list',
+    }
+}
+
+DEFAULT_TIME_RANGE = 24 * 60 * 60
+MAX_POINTS = 1500
+PAGE_SIZE = 1000
+
+
+def do(data, resource):
+    """
+    Log counts by (event_source, event_name) from start_time to end_time (epoch seconds, the last day by default),
+    read from the rollups instead of the logs.
+    series is [{'event_source', 'event_name', 'total', 'points': [[bucket start time, count], ...]}],
+    buckets without logs are left out of points.
+    """
+    body = {}
+    params = data['params']
+
+    end_time = params.get('end_time', None)
+    start_time = params.get('start_time', None)
+    resolution = params.get('resolution', None) or 'hour'
+    event_source = params.get('event_source', None)
+    event_name = params.get('event_name', None)
+
+    if resolution not in LOG_ROLLUPS:
+        body['success'] = False
+        body['message'] = 'resolution must be one of {}'.format(', '.join(sorted(LOG_ROLLUPS)))
+        return Response(body)
+    seconds = LOG_ROLLUPS[resolution]['seconds']
+    now = int(time.time())
+    end_time = int(end_time) if end_time is not None else now
+    start_time = int(start_time) if start_time is not None else end_time - DEFAULT_TIME_RANGE
+    start_time -= start_time % seconds
+    if start_time > end_time:
+        body['success'] = False
+        body['message'] = 'start_time must not be after end_time'
+        return Response(body)
+    if (end_time - start_time) // seconds >= MAX_POINTS:
+        body['success'] = False
+        body['message'] = 'At most {} points of a {} can be read at once'.format(MAX_POINTS, resolution)
+        return Response(body)
+
+    series = {}
+    for partition in get_log_rollup_partitions(resolution, start_time, end_time):
+        start_key = None
+        while True:
+            items, start_key = resource.db_get_items_in_partition_since(partition, start_time, start_key, PAGE_SIZE)
+            for item in items:
+                if item['creationDate'] > end_time:
+                    start_key = None
+                    break
+                if event_source and item.get('event_source', None) != event_source:
+                    continue
+                if event_name and item.get('event_name', None) != event_name:
+                    continue
+                if item.get(resource.ttl_field, None) is not None and item[resource.ttl_field] <= now:
+                    continue
+                key = (item.get('event_source', None), item.get('event_name', None))
+                points = series.setdefault(key, {})
+                bucket = int(item['creationDate'])
+                # Shards of a bucket are summed
+                points[bucket] = points.get(bucket, 0) + int(item.get('count', 0))
+            if not start_key:
+                break
+
+    body['success'] = True
+    body['resolution'] = resolution
+    body['series'] = [{
+        'event_source': key[0],
+        'event_name': key[1],
+        'total': sum(points.values()),
+        'points': [[bucket, points[bucket]] for bucket in sorted(points)],
+    } for key, points in sorted(series.items(), key=lambda pair: [str(value) for value in pair[0]])]
+    return Response(body)
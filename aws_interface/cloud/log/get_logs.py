@@ -1,4 +1,7 @@
+import time
+
 from cloud.response import Response
+from cloud.log import LOG_RETENTION_DAYS, iter_log_partition_groups
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -6,10 +9,13 @@ info = {
     'input_format': {
         'session_id': 'str',
 
+        'start_time': 'int?',
+        'end_time': 'int?',
         'event_source': 'str?',
         'event_name': 'str?',
         'user_id': 'str?',
         'start_key': 'str?',
+        'limit': 'int?',
     },
     'output_format': {
         'success': 'bool',
@@ -18,27 +24,48 @@ info = {
     }
 }
 
+# Logs are read from the oldest retained hour by default, or from a day ago when logs are kept forever
+DEFAULT_TIME_RANGE = LOG_RETENTION_DAYS * 24 * 60 * 60 if LOG_RETENTION_DAYS > 0 else 24 * 60 * 60
+
 
 def do(data, resource):
-    partition = 'log'
+    """
+    Logs created from start_time to end_time (epoch seconds) in time order.
+    end_time is now by default and start_time is the oldest retained log, AWS_INTERFACE_LOG_RETENTION_DAYS ago,
+    or a day before end_time when logs are kept forever.
+    Only the hours of the range which have logs are read.
+    """
     body = {}
     params = data['params']
 
+    end_time = params.get('end_time', None)
+    start_time = params.get('start_time', None)
     event_source = params.get('event_source', None)
     event_name = params.get('event_name', None)
     user_id = params.get('user_id', None)
     start_key = params.get('start_key', None)
+    limit = params.get('limit', 100)
+
+    now = int(time.time())
+    end_time = int(end_time) if end_time is not None else now
+    start_time = int(start_time) if start_time is not None else end_time - DEFAULT_TIME_RANGE
+    if start_time > end_time:
+        body['success'] = False
+        body['message'] = 'start_time must not be after end_time'
+        return Response(body)
 
     operation = None
     instructions = []
-    for field_name, value in (('event_source', event_source), ('event_name', event_name), ('user_id', user_id)):
+    for field_name, value in (('event_source', event_source), ('event_name', event_name), ('owner', user_id)):
         if value:
             instructions.append((operation, (field_name, 'eq', value)))
             operation = 'and'
-    if len(instructions) > 0:
-        items, end_key = resource.db_query(partition, instructions, start_key)
-    else:
-        items, end_key = resource.db_get_items_in_partition(partition, start_key)
+    partition_groups = iter_log_partition_groups(resource, start_time, end_time, event_source, event_name)
+    # Expired logs stay readable until DynamoDB deletes them, and forever on local backends
+    items, end_key = resource.db_query_partitions(partition_groups, instructions, start_key, limit,
+                                                  start_creation_date=start_time, end_creation_date=end_time,
+                                                  live_at=now)
+    body['success'] = True
     body['end_key'] = end_key
     body['items'] = items
     return Response(body)
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+
+import cloud.shortuuid as shortuuid
+from cloud.cache import TTLCache
+
+FUNCTION_PARTITION = 'logic-function'
+# Fields of function items needed to run them, zip files are left out of the cache
+FUNCTION_METADATA_FIELDS = ('id', 'function_name', 'handler', 'runtime', 'run_groups', 'runnable', 'owner')
+# Function metadata by (app_id, function_name). Changes made by other containers are seen after at most ttl seconds.
+function_cache = TTLCache(
+    max_size=int(os.environ.get('AWS_INTERFACE_FUNCTION_CACHE_SIZE', 1024)),
+    ttl=int(os.environ.get('AWS_INTERFACE_FUNCTION_CACHE_TTL', 60)),
+)
+
+JOB_PARTITION = 'logic-job'
+# Jobs and their results are kept this many days after they are created
+JOB_RETENTION_DAYS = int(os.environ.get('AWS_INTERFACE_LOGIC_JOB_RETENTION_DAYS', 7))
+# Bigger responses are not kept in the job item, which is limited to 400KB in DynamoDB
+JOB_MAX_RESPONSE_BYTES = 256 * 1024
+
+
+def get_function_id(function_name):
+    """Functions are stored under ids made of their name, so they are read by primary key"""
+    return '{}-{}'.format(FUNCTION_PARTITION, function_name)
+
+
+def load_function_item(resource, function_name):
+    """:return: whole item of the function or None when it does not exist"""
+    item = resource.db_get_item(get_function_id(function_name))
+    if item and item.get('partition', None) == FUNCTION_PARTITION:
+        return item
+    # Functions created before ids were made of names
+    item_ids, _ = resource.db_get_item_ids_equal(FUNCTION_PARTITION, 'function_name', function_name, None, 1)
+    if not item_ids:
+        return None
+    return resource.db_get_item(next(iter(item_ids)))
+
+
+def get_function_item(resource, function_name):
+    """:return: metadata of the function from the cache, or None when it does not exist"""
+    key = (resource.app_id, function_name)
+    item = function_cache.get(key, None)
+    if item is None:
+        item = load_function_item(resource, function_name)
+        if item is None:
+            return None
+        item = {field: item[field] for field in FUNCTION_METADATA_FIELDS if field in item}
+        function_cache.set(key, item)
+    return item
+
+
+def invalidate_function(resource, function_name):
+    function_cache.pop((resource.app_id, function_name))
+
+
+def invoke_function(resource, function_name, payload):
+    """
+    Run the function and wait for it.
+    :return: response:decoded JSON response, error:str|None like the FunctionError of Lambda
+    """
+    response_payload, error = resource.sl_invoke_function(function_name, json.dumps(payload).encode('utf-8'))
+    if isinstance(response_payload, (bytes, str)):
+        try:
+            response_payload = json.loads(response_payload)
+        except ValueError:
+            response_payload = response_payload.decode('utf-8') if isinstance(response_payload, bytes) \
+                else response_payload
+    return response_payload, error
+
+
+def create_job(resource, user, function_name, payload):
+    """
+    Queue a run of the function, which is started in the background by the cloud API.
+    :return: job_id
+    """
+    job_id = 'job-{}'.format(shortuuid.uuid())
+    now = int(time.time())
+    item = {
+        'function_name': function_name,
+        'payload': json.dumps(payload),
+        'owner': user.get('id', None),
+        'status': 'queued',
+    }
+    if JOB_RETENTION_DAYS > 0:
+        item[resource.ttl_field] = now + JOB_RETENTION_DAYS * 24 * 60 * 60
+    resource.db_put_item(JOB_PARTITION, item, item_id=job_id, creation_date=now)
+    resource.sl_invoke_job_async({'logic_job_id': job_id})
+    return job_id
+
+
+def run_job(resource, job_id):
+    """
+    Run a queued job and keep its response in the job item, jobs which are not queued anymore are left alone.
+    The job is claimed by a conditional update so a retried or repeated invocation does not run it twice.
+    """
+    item = resource.db_get_item(job_id)
+    if not item or item.get('partition', None) != JOB_PARTITION or item.get('status', None) != 'queued':
+        print('job_id: {} is not a queued job'.format(job_id))
+        return False
+    item['status'] = 'running'
+    item['started_at'] = int(time.time())
+    if not resource.db_update_item(job_id, item, condition=('status', 'queued')):
+        print('job_id: {} is claimed by another invocation'.format(job_id))
+        return False
+
+    try:
+        response, error = invoke_function(resource, item['function_name'], json.loads(item['payload']))
+    except Exception as ex:
+        response, error = None, str(ex)
+    if len(json.dumps(response)) > JOB_MAX_RESPONSE_BYTES:
+        response, error = None, 'Response is bigger than {} bytes'.format(JOB_MAX_RESPONSE_BYTES)
+    item['status'] = 'failed' if error else 'succeeded'
+    item['response'] = json.dumps(response)
+    item['error'] = error
+    item['finished_at'] = int(time.time())
+    resource.db_update_item(job_id, item)
+    return True
@@ -1,6 +1,7 @@
 
 from cloud.response import Response
 from cloud.util import has_write_permission
+from cloud.logic import FUNCTION_PARTITION, get_function_id, load_function_item, invalidate_function
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -24,7 +25,7 @@ info = {
 
 
 def do(data, resource):
-    partition = 'logic-function'
+    partition = FUNCTION_PARTITION
     body = {}
     params = data['params']
 
@@ -45,10 +46,10 @@ def do(data, resource):
     item['run_groups'] = run_groups
     item['runnable'] = runnable
 
-    item_ids = resource.db_get_item_ids_equal(partition, 'function_name', function_name)
-    if len(item_ids) == 0:
-        resource.db_put_item(partition, item)
-        resource.sl_create_function(function_name, runtime, handler, run_groups, zip_file)
+    if load_function_item(resource, function_name) is None:
+        resource.db_put_item(partition, item, item_id=get_function_id(function_name))
+        resource.sl_create_function(function_name, runtime, handler, zip_file)
+        invalidate_function(resource, function_name)
         body['success'] = True
         body['function_name'] = function_name
         return Response(body)
@@ -1,6 +1,7 @@
 
 from cloud.response import Response
 from cloud.util import has_write_permission
+from cloud.logic import load_function_item, invalidate_function
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -18,18 +19,19 @@ info = {
 
 
 def do(data, resource):
-    partition = 'logic-function'
     body = {}
     params = data['params']
 
     function_name = params.get('function_name')
 
-    item_ids = resource.db_get_item_ids_equal(partition, 'function_name', function_name)
-    if len(item_ids) == 0:
+    item = load_function_item(resource, function_name)
+    if item is None:
         body['success'] = False
         body['message'] = 'function_name: {} did not exist'.format(function_name)
         return Response(body)
     else:
-        success = resource.db_delete_item_batch(item_ids)
+        success = resource.db_delete_item(item['id'])
+        resource.sl_delete_function(function_name)
+        invalidate_function(resource, function_name)
         body['success'] = success
         return Response(body)
@@ -1,6 +1,7 @@
 
 from cloud.response import Response
 from cloud.util import has_write_permission
+from cloud.logic import load_function_item
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -18,17 +19,15 @@ info = {
 
 
 def do(data, resource):
-    partition = 'logic-function'
     body = {}
     params = data['params']
 
     function_name = params.get('function_name')
 
-    item_ids = resource.db_get_item_ids_equal(partition, 'function_name', function_name)
-    if len(item_ids) == 0:
+    item = load_function_item(resource, function_name)
+    if item is None:
         body['message'] = 'function_name: {} did not exist'.format(function_name)
         return Response(body)
     else:
-        item = resource.db_get_item(item_ids[0])
         body['item'] = item
         return Response(body)
@@ -25,8 +25,11 @@ def do(data, resource):
 
     start_key = params.get('start_key', None)
     limit = params.get('limit', None)
+    # Zip files are only needed to deploy functions, not to list them
+    projection = ['id', 'creationDate', 'function_name', 'description', 'handler', 'runtime',
+                  'run_groups', 'runnable']
 
-    items, end_key = resource.db_get_items_in_partition(partition, start_key, limit)
+    items, end_key = resource.db_get_items_in_partition(partition, start_key, limit, projection=projection)
 
     body['items'] = items
     body['end_key'] = end_key
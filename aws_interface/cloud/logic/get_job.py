@@ -0,0 +1,51 @@
+import json
+
+from cloud.response import Response
+from cloud.logic import JOB_PARTITION
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+
+        'job_id': 'str',
+    },
+    'output_format': {
+        'job_id': 'str?',
+        'function_name': 'str?',
+        'status': 'str?',
+        'response': 'dict?',
+        'error': 'str?',
+        'message:': 'str?',
+    }
+}
+
+
+def do(data, resource):
+    """
+    Status of a job queued by run_function or run_functions: queued, running, succeeded or failed.
+    The response of the function is returned once the job is finished.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    job_id = params.get('job_id')
+
+    item = resource.db_get_item(job_id) if job_id else None
+    if not item or item.get('partition', None) != JOB_PARTITION:
+        body['message'] = 'job_id: {} did not exist'.format(job_id)
+        return Response(body)
+    groups = (user or {}).get('groups', [])
+    if not user or (item.get('owner', None) != user.get('id', None) and 'admin' not in groups):
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    body['job_id'] = job_id
+    body['function_name'] = item.get('function_name', None)
+    body['status'] = item.get('status', None)
+    if item.get('response', None) is not None:
+        body['response'] = json.loads(item['response'])
+    body['error'] = item.get('error', None)
+    return Response(body)
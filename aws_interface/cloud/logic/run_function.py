@@ -1,6 +1,7 @@
 
 from cloud.response import Response
 from cloud.util import has_run_permission
+from cloud.logic import get_function_item, invoke_function, create_job
 
 # Define the input output format of the function.
 # This information is used when creating the *SDK*.
@@ -10,32 +11,47 @@ info = {
 
         'function_name': 'str',
         'payload': 'dict',
+        'invocation_type': 'str?',
     },
     'output_format': {
-        'response': 'dict',
+        'response': 'dict?',
+        'job_id': 'str?',
         'message:': 'str?',
         'error': 'str?',
     }
 }
 
+INVOCATION_TYPES = ('RequestResponse', 'Event')
+
 
 def do(data, resource):
-    partition = 'logic-function'
+    """
+    invocation_type 'RequestResponse' (default) waits for the function and returns its response,
+    'Event' queues a job and returns its job_id at once, its result is read with get_job.
+    """
     body = {}
     params = data['params']
     user = data['user']
 
     function_name = params.get('function_name')
     payload = params.get('payload')
+    invocation_type = params.get('invocation_type', None) or 'RequestResponse'
 
-    item_ids = resource.db_get_item_ids_equal(partition, 'function_name', function_name)
-    if len(item_ids) == 0:
+    if invocation_type not in INVOCATION_TYPES:
+        body['message'] = 'invocation_type must be one of {}'.format(', '.join(INVOCATION_TYPES))
+        return Response(body)
+    item = get_function_item(resource, function_name)
+    if item is None:
         body['message'] = 'function_name: {} did not exist'.format(function_name)
         return Response(body)
+    if not has_run_permission(user, item):
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    if invocation_type == 'Event':
+        body['job_id'] = create_job(resource, user, function_name, payload)
     else:
-        item = resource.db_get_item(item_ids[0])
-        if has_run_permission(user, item):
-            response_payload, error = resource.sl_invoke_function(function_name, payload)
+        response_payload, error = invoke_function(resource, function_name, payload)
         body['response'] = response_payload
         body['error'] = error
-        return Response(body)
+    return Response(body)
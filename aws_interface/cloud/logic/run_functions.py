@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import resource.trace as trace
+from cloud.response import Response
+from cloud.util import has_run_permission
+from cloud.logic import get_function_item, invoke_function, create_job
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+
+        'function_name': 'str',
+        'payloads': 'list',
+        'invocation_type': 'str?',
+    },
+    'output_format': {
+        'responses': 'list?',
+        'job_ids': 'list?',
+        'message:': 'str?',
+    }
+}
+
+MAX_PAYLOADS = int(os.environ.get('AWS_INTERFACE_RUN_FUNCTIONS_MAX_PAYLOADS', 100))
+MAX_WORKERS = int(os.environ.get('AWS_INTERFACE_RUN_FUNCTIONS_MAX_WORKERS', 16))
+
+INVOCATION_TYPES = ('RequestResponse', 'Event')
+
+
+def do(data, resource):
+    """
+    Run the function once for every payload of payloads.
+    'RequestResponse' (default) runs them concurrently and returns responses [{'response', 'error'}]
+    in the order of payloads, 'Event' queues a job for each payload and returns their job_ids.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    function_name = params.get('function_name')
+    payloads = params.get('payloads', None)
+    invocation_type = params.get('invocation_type', None) or 'RequestResponse'
+
+    if invocation_type not in INVOCATION_TYPES:
+        body['message'] = 'invocation_type must be one of {}'.format(', '.join(INVOCATION_TYPES))
+        return Response(body)
+    if not isinstance(payloads, list) or len(payloads) > MAX_PAYLOADS:
+        body['message'] = 'payloads must be a list of at most {} payloads'.format(MAX_PAYLOADS)
+        return Response(body)
+    item = get_function_item(resource, function_name)
+    if item is None:
+        body['message'] = 'function_name: {} did not exist'.format(function_name)
+        return Response(body)
+    if not has_run_permission(user, item):
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    def run(payload):
+        try:
+            response_payload, error = invoke_function(resource, function_name, payload)
+        except Exception as ex:  # One failing run does not fail the others
+            response_payload, error = None, str(ex)
+        return {
+            'response': response_payload,
+            'error': error,
+        }
+
+    def queue(payload):
+        return create_job(resource, user, function_name, payload)
+
+    method = queue if invocation_type == 'Event' else run
+    if len(payloads) < 2:
+        results = [method(payload) for payload in payloads]
+    else:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(payloads))) as executor:
+            results = list(executor.map(trace.bind(method), payloads))
+    if invocation_type == 'Event':
+        body['job_ids'] = results
+    else:
+        body['responses'] = results
+    return Response(body)
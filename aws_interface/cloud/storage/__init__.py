@@ -0,0 +1,14 @@
+import os
+
+# Lifetime in seconds of the presigned URLs handed out by get_upload_url and get_download_url
+PRESIGNED_URL_EXPIRES_IN = int(os.environ.get('AWS_INTERFACE_PRESIGNED_URL_EXPIRES_IN', 3600))
+
+# S3 multipart uploads take 1 to 10000 parts of at least 5 MB except the last one
+MAX_PART_COUNT = 10000
+
+# Uploads in progress are kept in their own partition, so the files partition only lists and counts complete files.
+# complete_upload moves the item to the files partition.
+PENDING_FILE_PARTITION = 'pending_files'
+# Abandoned pending file items expire after this many seconds, like the incomplete multipart uploads
+# S3 aborts S3.abort_incomplete_multipart_upload_days after they are started.
+PENDING_UPLOAD_EXPIRES_IN = 7 * 24 * 60 * 60
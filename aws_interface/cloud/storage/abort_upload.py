@@ -0,0 +1,41 @@
+from cloud.response import Response
+from cloud.util import has_write_permission, is_owner
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+        'file_id': 'str',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+    }
+}
+
+
+def do(data, resource):
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    file_id = params.get('file_id')
+
+    item = resource.db_get_item(file_id)
+    if not item or item.get('upload_state', None) != 'pending':
+        body['success'] = False
+        body['message'] = 'file_id: {} has no pending upload'.format(file_id)
+        return Response(body)
+    if not is_owner(user, item) and not has_write_permission(user, item):
+        body['success'] = False
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    if item.get('upload_id', None):
+        resource.file_abort_multipart_upload(file_id, item['upload_id'])
+    resource.file_delete_bin(file_id)
+    resource.db_delete_item(file_id)
+
+    body['success'] = True
+    return Response(body)
@@ -0,0 +1,76 @@
+import time
+from cloud.response import Response
+from cloud.util import has_write_permission, is_owner
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+        'file_id': 'str',
+        'parts': 'list?',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+
+        'file_id': 'str',
+        'file_size': 'int',
+    }
+}
+
+
+def do(data, resource):
+    """
+    Finish an upload started by get_upload_url.
+    parts is [{'part_number': int, 'etag': str}] of every uploaded part for multipart uploads.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    file_id = params.get('file_id')
+    parts = params.get('parts', None) or []
+
+    item = resource.db_get_item(file_id)
+    expires_at = (item or {}).get(resource.ttl_field, None)
+    if not item or item.get('upload_state', None) != 'pending' or (expires_at and expires_at <= time.time()):
+        body['success'] = False
+        body['message'] = 'file_id: {} has no pending upload'.format(file_id)
+        return Response(body)
+    if not is_owner(user, item) and not has_write_permission(user, item):
+        body['success'] = False
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    upload_id = item.get('upload_id', None)
+    if upload_id:
+        try:
+            parts = [(int(part['part_number']), part['etag']) for part in parts]
+            if not all(isinstance(etag, str) for _, etag in parts):
+                raise TypeError('etag must be a string')
+        except (KeyError, TypeError, ValueError):
+            body['success'] = False
+            body['message'] = 'parts must be a list of {part_number, etag}'
+            return Response(body)
+        if not resource.file_complete_multipart_upload(file_id, upload_id, parts):
+            body['success'] = False
+            body['message'] = 'parts must be every uploaded part with the etag returned by its upload'
+            return Response(body, status_code=400)
+
+    file_size = resource.file_get_size(file_id)
+    if file_size is None:
+        body['success'] = False
+        body['message'] = 'file_id: {} is not uploaded'.format(file_id)
+        return Response(body)
+
+    item.pop('upload_state', None)
+    item.pop('upload_id', None)
+    item.pop(resource.ttl_field, None)
+    item['file_size'] = file_size
+    resource.db_put_item('files', item, file_id)  # Moved out of the pending partition and counted as a file
+
+    body['success'] = True
+    body['file_id'] = file_id
+    body['file_size'] = file_size
+    return Response(body)
@@ -0,0 +1,70 @@
+import time
+from cloud.response import Response
+from cloud.shortuuid import uuid
+from cloud.storage import PENDING_FILE_PARTITION, PENDING_UPLOAD_EXPIRES_IN
+from cloud.util import has_write_permission, is_owner
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+
+        'file_name': 'str?',
+
+        'read_groups': 'list',
+        'write_groups': 'list'
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+
+        'file_id': 'str',
+        'upload_id': 'str',
+    }
+}
+
+
+def do(data, resource):
+    """
+    Start a multipart upload, the file is a single object and item once complete_upload is called.
+    Parts are sent with upload_part_b64 or to the URLs of get_upload_part_urls, in any order and concurrently.
+    Sessions without user are denied, uploads which are never completed or aborted expire.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    user_id = user.get('id', None) if user else None
+
+    file_name = params.get('file_name', None) or uuid()
+
+    read_groups = params.get('read_groups', [])
+    write_groups = params.get('write_groups', [])
+
+    file_id = '{}'.format(uuid())
+    file_info = {
+        'file_id': file_id,
+        'parent_file_id': None,
+        'file_name': file_name,
+        'owner': user_id,
+        'file_size': 0,
+        'read_groups': read_groups,
+        'write_groups': write_groups,
+        'upload_state': 'pending',
+        resource.ttl_field: int(time.time()) + PENDING_UPLOAD_EXPIRES_IN,
+    }
+    # Nothing is started for requests which could not write the file afterwards
+    if not is_owner(user, file_info) and not has_write_permission(user, file_info):
+        body['success'] = False
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    upload_id = resource.file_create_multipart_upload(file_id)
+    file_info['upload_id'] = upload_id
+    resource.db_put_item(PENDING_FILE_PARTITION, file_info, file_id)
+
+    body['success'] = True
+    body['file_id'] = file_id
+    body['upload_id'] = upload_id
+    return Response(body)
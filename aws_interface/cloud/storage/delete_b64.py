@@ -25,6 +25,8 @@ def do(data, resource):
     while file_id_to_delete:
         file_item = resource.db_get_item(file_id_to_delete)
         if file_item and has_write_permission(user, file_item):
+            if file_item.get('upload_id', None):  # Multipart upload never completed
+                resource.file_abort_multipart_upload(file_id_to_delete, file_item['upload_id'])
             resource.file_delete_bin(file_id_to_delete)
             resource.db_delete_item(file_id_to_delete)
 
@@ -1,4 +1,3 @@
-
 from cloud.response import Response
 from cloud.util import has_read_permission
 import base64
@@ -9,11 +8,14 @@ info = {
     'input_format': {
         'session_id': 'str',
         'file_id': 'str',
+        'start': 'int?',
+        'end': 'int?',
     },
     'output_format': {
         'success': 'bool',
         'file_b64': 'str',
         'parent_file_id': 'str?',
+        'file_size': 'int?',
     }
 }
 
@@ -24,19 +26,31 @@ def do(data, resource):
     user = data['user']
 
     file_id = params.get('file_id')
+    start = params.get('start', None)
+    end = params.get('end', None)
 
     item = resource.db_get_item(file_id)
-    if item:
+    if item and item.get('upload_state', None) != 'pending':
         if has_read_permission(user, item):
             file_id = item['file_id']
             parent_file_id = item.get('parent_file_id', None)
-            file_b64 = resource.file_download_bin(file_id)
+            if start is None and end is None:
+                file_b64 = resource.file_download_bin(file_id)
+            else:  # Bytes start to end of this object, both included
+                start = start or 0
+                end = end if end is not None else item.get('file_size', 0) - 1
+                file_b64 = resource.file_download_range(file_id, start, end)
+            if file_b64 is None:
+                body['success'] = False
+                body['message'] = 'file_key: {} does not exist'.format(file_id)
+                return Response(body)
             file_b64 = base64.b64encode(file_b64)
             file_b64 = file_b64.decode('utf-8')
 
             body['file_b64'] = file_b64
             body['parent_file_id'] = parent_file_id
             body['file_name'] = item.get('file_name', None)
+            body['file_size'] = item.get('file_size', None)
             body['success'] = True
             return Response(body)
         else:
@@ -47,4 +61,3 @@ def do(data, resource):
         body['success'] = False
         body['message'] = 'file_key: {} does not exist'.format(file_id)
         return Response(body)
-
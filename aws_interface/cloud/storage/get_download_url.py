@@ -0,0 +1,53 @@
+from cloud.response import Response
+from cloud.util import has_read_permission
+from cloud.storage import PRESIGNED_URL_EXPIRES_IN
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+        'file_id': 'str',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+
+        'download_url': 'str',
+        'file_name': 'str',
+        'file_size': 'int',
+        'parent_file_id': 'str?',
+        'expires_in': 'int',
+    }
+}
+
+
+def do(data, resource):
+    """
+    Return the URL the client downloads the file from, the bytes come straight from storage.
+    Files uploaded in chunks by upload_b64 have a parent_file_id, the chunk before this one.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    file_id = params.get('file_id')
+
+    item = resource.db_get_item(file_id)
+    if not item or item.get('upload_state', None) == 'pending':
+        body['success'] = False
+        body['message'] = 'file_key: {} does not exist'.format(file_id)
+        return Response(body)
+    if not has_read_permission(user, item):
+        body['success'] = False
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    file_name = item.get('file_name', None)
+    body['download_url'] = resource.file_get_download_url(file_id, PRESIGNED_URL_EXPIRES_IN, file_name)
+    body['file_name'] = file_name
+    body['file_size'] = item.get('file_size', None)
+    body['parent_file_id'] = item.get('parent_file_id', None)
+    body['expires_in'] = PRESIGNED_URL_EXPIRES_IN
+    body['success'] = True
+    return Response(body)
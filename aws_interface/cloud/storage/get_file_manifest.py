@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from cloud.response import Response
+from cloud.util import has_read_permission
+from resource.trace import bind
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+        'file_id': 'str',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+
+        'file_name': 'str',
+        'file_size': 'int',
+        'chunks': 'list',
+    }
+}
+
+MAX_WORKERS = 8
+
+
+def do(data, resource):
+    """
+    Ordered chunks of the file, [{'file_id': str, 'start': int, 'size': int}] where start is the offset
+    of the chunk in the file. Files uploaded in base64 chunks have one chunk per upload_b64 call, others have one.
+    Clients download the chunks, or byte ranges of them with download_b64, concurrently.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    file_id = params.get('file_id')
+
+    item = resource.db_get_item(file_id)
+    if not item:
+        body['success'] = False
+        body['message'] = 'file_key: {} does not exist'.format(file_id)
+        return Response(body)
+    chunk_file_ids = item.get('_chunk_file_ids', None)
+    if chunk_file_ids:  # The last chunk lists every chunk, they are read at once
+        items = resource.db_get_items(chunk_file_ids[:-1]) + [item] if len(chunk_file_ids) > 1 else [item]
+        if len(items) != len(chunk_file_ids):
+            body['success'] = False
+            body['message'] = 'file_key: {} does not exist'.format(file_id)
+            return Response(body)
+        sizes = [int(size) for size in item['_chunk_sizes']]
+    else:  # Files uploaded before chunks were listed are read chunk by chunk from the last one
+        items = [item]
+        file_id = item.get('parent_file_id', None)
+        while file_id:
+            item = resource.db_get_item(file_id)
+            if not item:
+                body['success'] = False
+                body['message'] = 'file_key: {} does not exist'.format(file_id)
+                return Response(body)
+            items.append(item)
+            file_id = item.get('parent_file_id', None)
+        items.reverse()
+        sizes = None
+
+    for item in items:
+        if item.get('upload_state', None) == 'pending':
+            body['success'] = False
+            body['message'] = 'file_key: {} does not exist'.format(item['file_id'])
+            return Response(body)
+        if not has_read_permission(user, item):
+            body['success'] = False
+            body['message'] = 'permission denied'
+            return Response(body)
+
+    if sizes is None:
+        # file_size of chained items is not the size of the chunk so it is read from storage
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            sizes = list(executor.map(bind(lambda item: resource.file_get_size(item['file_id'])), items))
+
+    chunks = []
+    start = 0
+    for item, size in zip(items, sizes):
+        if size is None:
+            body['success'] = False
+            body['message'] = 'file_key: {} does not exist'.format(item['file_id'])
+            return Response(body)
+        chunks.append({
+            'file_id': item['file_id'],
+            'start': start,
+            'size': size,
+        })
+        start += size
+
+    body['success'] = True
+    body['file_name'] = items[-1].get('file_name', None)
+    body['file_size'] = start
+    body['chunks'] = chunks
+    return Response(body)
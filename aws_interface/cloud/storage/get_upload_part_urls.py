@@ -0,0 +1,54 @@
+from cloud.response import Response
+from cloud.util import has_write_permission, is_owner
+from cloud.storage import PRESIGNED_URL_EXPIRES_IN, MAX_PART_COUNT
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+        'file_id': 'str',
+        'part_numbers': 'list',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+
+        'part_urls': 'list',
+        'expires_in': 'int',
+    }
+}
+
+
+def do(data, resource):
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    file_id = params.get('file_id')
+    part_numbers = params.get('part_numbers', [])
+
+    if not isinstance(part_numbers, list) or \
+            not all(isinstance(number, int) and 1 <= number <= MAX_PART_COUNT for number in part_numbers):
+        body['success'] = False
+        body['message'] = 'part_numbers must be numbers between 1 and {}'.format(MAX_PART_COUNT)
+        return Response(body)
+
+    item = resource.db_get_item(file_id)
+    if not item or not item.get('upload_id', None):
+        body['success'] = False
+        body['message'] = 'file_id: {} has no pending multipart upload'.format(file_id)
+        return Response(body)
+    if not is_owner(user, item) and not has_write_permission(user, item):
+        body['success'] = False
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    upload_id = item['upload_id']
+    body['part_urls'] = [
+        resource.file_get_upload_part_url(file_id, upload_id, part_number, PRESIGNED_URL_EXPIRES_IN)
+        for part_number in part_numbers
+    ]
+    body['expires_in'] = PRESIGNED_URL_EXPIRES_IN
+    body['success'] = True
+    return Response(body)
@@ -0,0 +1,89 @@
+import time
+from cloud.response import Response
+from cloud.shortuuid import uuid
+from cloud.util import has_write_permission, is_owner
+from cloud.storage import PRESIGNED_URL_EXPIRES_IN, MAX_PART_COUNT, PENDING_FILE_PARTITION, PENDING_UPLOAD_EXPIRES_IN
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+
+        'file_name': 'str?',
+        'part_count': 'int?',
+
+        'read_groups': 'list',
+        'write_groups': 'list'
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+
+        'file_id': 'str',
+        'upload_url': 'str?',
+        'upload_id': 'str?',
+        'part_urls': 'list?',
+        'expires_in': 'int',
+    }
+}
+
+
+def do(data, resource):
+    """
+    Create the file item and return where the client uploads the file to, the bytes go straight to storage.
+    With part_count the upload is a multipart upload of part_count parts, part_urls[i] is for part i + 1.
+    The file is readable once complete_upload is called, sessions without user are denied.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    user_id = user.get('id', None) if user else None
+
+    file_name = params.get('file_name', None) or uuid()
+    part_count = params.get('part_count', None)
+
+    read_groups = params.get('read_groups', [])
+    write_groups = params.get('write_groups', [])
+
+    if part_count is not None and (not isinstance(part_count, int) or not 1 <= part_count <= MAX_PART_COUNT):
+        body['success'] = False
+        body['message'] = 'part_count must be between 1 and {}'.format(MAX_PART_COUNT)
+        return Response(body)
+
+    file_id = '{}'.format(uuid())
+    file_info = {
+        'file_id': file_id,
+        'parent_file_id': None,
+        'file_name': file_name,
+        'owner': user_id,
+        'file_size': 0,
+        'read_groups': read_groups,
+        'write_groups': write_groups,
+        'upload_state': 'pending',
+        resource.ttl_field: int(time.time()) + PENDING_UPLOAD_EXPIRES_IN,
+    }
+    # Nothing is issued for requests which could not write the file afterwards
+    if not is_owner(user, file_info) and not has_write_permission(user, file_info):
+        body['success'] = False
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    if part_count is None:
+        body['upload_url'] = resource.file_get_upload_url(file_id, PRESIGNED_URL_EXPIRES_IN)
+    else:
+        upload_id = resource.file_create_multipart_upload(file_id)
+        file_info['upload_id'] = upload_id
+        body['upload_id'] = upload_id
+        body['part_urls'] = [
+            resource.file_get_upload_part_url(file_id, upload_id, part_number, PRESIGNED_URL_EXPIRES_IN)
+            for part_number in range(1, part_count + 1)
+        ]
+
+    resource.db_put_item(PENDING_FILE_PARTITION, file_info, file_id)
+
+    body['success'] = True
+    body['file_id'] = file_id
+    body['expires_in'] = PRESIGNED_URL_EXPIRES_IN
+    return Response(body)
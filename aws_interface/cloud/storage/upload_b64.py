@@ -44,6 +44,7 @@ def do(data, resource):
     parent_file_info = None
 
     file_size = sys.getsizeof(file_b64)
+    file_bin = base64.b64decode(file_b64.encode('utf-8'))
 
     if parent_file_id:
         parent_file_info = resource.db_get_item(parent_file_id)
@@ -66,14 +67,20 @@ def do(data, resource):
         'read_groups': read_groups,
         'write_groups': write_groups,
     }
+    # Ids and sizes of the chunks of the file so far, the manifest of the file is read from its last chunk.
+    # Chunks appended to files uploaded before these fields existed do not have them.
+    if not parent_file_id:
+        file_info['_chunk_file_ids'] = [file_id]
+        file_info['_chunk_sizes'] = [len(file_bin)]
+    elif parent_file_info and '_chunk_file_ids' in parent_file_info:
+        file_info['_chunk_file_ids'] = parent_file_info['_chunk_file_ids'] + [file_id]
+        file_info['_chunk_sizes'] = parent_file_info['_chunk_sizes'] + [len(file_bin)]
 
     resource.db_put_item('files', file_info, file_id)
     if parent_file_id and parent_file_info:
         resource.db_update_item(parent_file_id, parent_file_info)
 
-    file_b64 = file_b64.encode('utf-8')
-    file_b64 = base64.b64decode(file_b64)
-    resource.file_upload_bin(file_id, file_b64)
+    resource.file_upload_bin(file_id, file_bin)
 
     body['success'] = True
     body['file_id'] = file_id
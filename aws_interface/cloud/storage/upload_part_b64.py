@@ -0,0 +1,59 @@
+from cloud.response import Response
+from cloud.util import has_write_permission, is_owner
+from cloud.storage import MAX_PART_COUNT
+import base64
+
+# Define the input output format of the function.
+# This information is used when creating the *SDK*.
+info = {
+    'input_format': {
+        'session_id': 'str',
+        'file_id': 'str',
+        'part_number': 'int',
+        'file_b64': 'str',
+    },
+    'output_format': {
+        'success': 'bool',
+        'message': 'str?',
+
+        'part_number': 'int',
+        'etag': 'str',
+    }
+}
+
+
+def do(data, resource):
+    """
+    Upload one part of a multipart upload, parts but the last must be at least 5 MB.
+    In base64 that is over the Lambda payload limit, so clients of the REST API upload parts to get_upload_part_urls.
+    """
+    body = {}
+    params = data['params']
+    user = data['user']
+
+    file_id = params.get('file_id')
+    part_number = params.get('part_number', None)
+    file_b64 = params.get('file_b64')
+
+    if not isinstance(part_number, int) or not 1 <= part_number <= MAX_PART_COUNT:
+        body['success'] = False
+        body['message'] = 'part_number must be between 1 and {}'.format(MAX_PART_COUNT)
+        return Response(body)
+
+    item = resource.db_get_item(file_id)
+    if not item or not item.get('upload_id', None):
+        body['success'] = False
+        body['message'] = 'file_id: {} has no pending multipart upload'.format(file_id)
+        return Response(body)
+    if not is_owner(user, item) and not has_write_permission(user, item):
+        body['success'] = False
+        body['message'] = 'permission denied'
+        return Response(body)
+
+    binary = base64.b64decode(file_b64.encode('utf-8'))
+    etag = resource.file_upload_part(file_id, item['upload_id'], part_number, binary)
+
+    body['success'] = True
+    body['part_number'] = part_number
+    body['etag'] = etag
+    return Response(body)
@@ -1,3 +1,9 @@
+def is_owner(user, item):
+    if user is None or item is None:
+        return False
+    return item.get('owner', None) is not None and item.get('owner') == user.get('id', None)
+
+
 def has_read_permission(user, item):
     if user is None or item is None:
         return False
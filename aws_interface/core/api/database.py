@@ -42,5 +42,8 @@ class DatabaseAPI(API):
     def get_partitions(self):
         return self.service_controller.get_partitions()
 
+    def create_range_index(self, partition, field):
+        return self.service_controller.create_range_index(partition, field)
+
     def query_items(self, partition, query, start_key=None):
         return self.service_controller.query_items(partition, query, start_key)
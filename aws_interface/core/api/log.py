@@ -9,5 +9,13 @@ class LogAPI(API):
     def create_log(self, event_source, event_name, event_param):
         return self.service_controller.create_log(event_source, event_name, event_param)
 
-    def get_logs(self, event_source=None, event_name=None, event_param=None, user_id=None):
-        return self.service_controller.delete_function(event_source, event_name, event_param, user_id)
+    def create_logs(self, logs):
+        return self.service_controller.create_logs(logs)
+
+    def get_logs(self, start_time=None, end_time=None, event_source=None, event_name=None, user_id=None,
+                 start_key=None, limit=100):
+        return self.service_controller.get_logs(start_time, end_time, event_source, event_name, user_id,
+                                                start_key, limit)
+
+    def get_log_series(self, start_time=None, end_time=None, resolution='hour', event_source=None, event_name=None):
+        return self.service_controller.get_log_series(start_time, end_time, resolution, event_source, event_name)
@@ -21,5 +21,11 @@ class LogicAPI(API):
     def get_function(self, function_name):
         return self.service_controller.get_function(function_name)
 
-    def run_function(self, function_name, payload):
-        return self.service_controller.run_function(function_name, payload)
+    def run_function(self, function_name, payload, invocation_type='RequestResponse'):
+        return self.service_controller.run_function(function_name, payload, invocation_type)
+
+    def run_functions(self, function_name, payloads, invocation_type='RequestResponse'):
+        return self.service_controller.run_functions(function_name, payloads, invocation_type)
+
+    def get_job(self, job_id):
+        return self.service_controller.get_job(job_id)
@@ -13,8 +13,23 @@ class StorageAPI(API):
     def delete_b64(self, file_key):
         return self.service_controller.delete_b64(file_key)
 
-    def download_b64(self, file_id):
-        return self.service_controller.download_b64(file_id)
+    def download_b64(self, file_id, start=None, end=None):
+        return self.service_controller.download_b64(file_id, start, end)
 
     def get_b64_info_items(self, start_key):
         return self.service_controller.get_b64_info_items(start_key)
+
+    def create_multipart_upload(self, file_name, read_groups, write_groups):
+        return self.service_controller.create_multipart_upload(file_name, read_groups, write_groups)
+
+    def upload_part_b64(self, file_id, part_number, file_b64):
+        return self.service_controller.upload_part_b64(file_id, part_number, file_b64)
+
+    def complete_upload(self, file_id, parts):
+        return self.service_controller.complete_upload(file_id, parts)
+
+    def abort_upload(self, file_id):
+        return self.service_controller.abort_upload(file_id)
+
+    def get_file_manifest(self, file_id):
+        return self.service_controller.get_file_manifest(file_id)
@@ -125,6 +125,16 @@ class DatabaseServiceController(ServiceController):
         data = make_data(self.app_id, params)
         return method.do(data, self.resource)
 
+    @lambda_method
+    def create_range_index(self, partition, field):
+        import cloud.database.create_range_index as method
+        params = {
+            'partition': partition,
+            'field': field,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
     @lambda_method
     def query_items(self, partition, query, start_key):
         """:query:list"""
@@ -20,13 +20,39 @@ class LogServiceController(ServiceController):
         return method.do(data, self.resource)
 
     @lambda_method
-    def get_logs(self, event_source=None, event_name=None, event_param=None, user_id=None):
+    def create_logs(self, logs):
+        import cloud.log.create_logs as method
+        params = {
+            'logs': logs,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def get_logs(self, start_time=None, end_time=None, event_source=None, event_name=None, user_id=None,
+                 start_key=None, limit=100):
         import cloud.log.get_logs as method
         params = {
+            'start_time': start_time,
+            'end_time': end_time,
             'event_source': event_source,
             'event_name': event_name,
-            'event_param': event_param,
             'user_id': user_id,
+            'start_key': start_key,
+            'limit': limit,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def get_log_series(self, start_time=None, end_time=None, resolution='hour', event_source=None, event_name=None):
+        import cloud.log.get_log_series as method
+        params = {
+            'start_time': start_time,
+            'end_time': end_time,
+            'resolution': resolution,
+            'event_source': event_source,
+            'event_name': event_name,
         }
         data = make_data(self.app_id, params)
         return method.do(data, self.resource)
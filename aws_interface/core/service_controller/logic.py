@@ -9,11 +9,32 @@ class LogicServiceController(ServiceController):
         super(LogicServiceController, self).__init__(resource, app_id)
 
     @lambda_method
-    def run_function(self, function_name, payload):
-        import cloud.database.create_item as method
+    def run_function(self, function_name, payload, invocation_type='RequestResponse'):
+        import cloud.logic.run_function as method
         params = {
             'function_name': function_name,
             'payload': payload,
+            'invocation_type': invocation_type,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def run_functions(self, function_name, payloads, invocation_type='RequestResponse'):
+        import cloud.logic.run_functions as method
+        params = {
+            'function_name': function_name,
+            'payloads': payloads,
+            'invocation_type': invocation_type,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def get_job(self, job_id):
+        import cloud.logic.get_job as method
+        params = {
+            'job_id': job_id,
         }
         data = make_data(self.app_id, params)
         return method.do(data, self.resource)
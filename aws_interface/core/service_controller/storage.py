@@ -31,10 +31,12 @@ class StorageServiceController(ServiceController):
         return method.do(data, self.resource)
 
     @lambda_method
-    def download_b64(self, file_id):
+    def download_b64(self, file_id, start=None, end=None):
         import cloud.storage.download_b64 as method
         params = {
             'file_id': file_id,
+            'start': start,
+            'end': end,
         }
         data = make_data(self.app_id, params)
         return method.do(data, self.resource)
@@ -48,3 +50,53 @@ class StorageServiceController(ServiceController):
         data = make_data(self.app_id, params)
         return method.do(data, self.resource)
 
+
+    @lambda_method
+    def create_multipart_upload(self, file_name, read_groups, write_groups):
+        import cloud.storage.create_multipart_upload as method
+        params = {
+            'file_name': file_name,
+            'read_groups': read_groups,
+            'write_groups': write_groups,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def upload_part_b64(self, file_id, part_number, file_b64):
+        import cloud.storage.upload_part_b64 as method
+        params = {
+            'file_id': file_id,
+            'part_number': part_number,
+            'file_b64': file_b64,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def complete_upload(self, file_id, parts):
+        import cloud.storage.complete_upload as method
+        params = {
+            'file_id': file_id,
+            'parts': parts,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def abort_upload(self, file_id):
+        import cloud.storage.abort_upload as method
+        params = {
+            'file_id': file_id,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
+
+    @lambda_method
+    def get_file_manifest(self, file_id):
+        import cloud.storage.get_file_manifest as method
+        params = {
+            'file_id': file_id,
+        }
+        data = make_data(self.app_id, params)
+        return method.do(data, self.resource)
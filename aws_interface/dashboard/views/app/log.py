@@ -1,9 +1,9 @@
-
 from django.shortcuts import render
 from django.views.generic import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 from dashboard.views.utils import Util, page_manage
+from core.adapter.django import DjangoAdapter
 
 
 class Log(LoginRequiredMixin, View):
@@ -11,5 +11,13 @@ class Log(LoginRequiredMixin, View):
     def get(self, request, app_id):
         context = Util.get_context(request)
         context['app_id'] = app_id
-        return render(request, 'dashboard/app/log.html', context=context)
 
+        adapter = DjangoAdapter(app_id, request)
+        with adapter.open_api_log() as log_api:
+            # Event counts of the last day from the hourly rollups
+            result = log_api.get_log_series(resolution='hour')
+        series = result.get('series', [])
+        for event in series:
+            event['peak'] = max(count for _, count in event['points']) if event['points'] else 0
+        context['log_series'] = sorted(series, key=lambda event: event['total'], reverse=True)
+        return render(request, 'dashboard/app/log.html', context=context)
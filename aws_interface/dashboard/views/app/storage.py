@@ -1,5 +1,6 @@
 
 from django.shortcuts import render, HttpResponse
+from django.http import StreamingHttpResponse
 from django.views.generic import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse
@@ -8,7 +9,103 @@ from core.adapter.django import DjangoAdapter
 
 import json
 import base64
+import itertools
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Files are uploaded as a single S3 multipart upload, parts are at least 5 MB except the last one
+UPLOAD_PART_SIZE = 1024 * 1024 * 8
+UPLOAD_MAX_WORKERS = 4
+
+# Files are streamed as byte ranges of their chunks, DOWNLOAD_PREFETCH ranges are fetched ahead of the response
+DOWNLOAD_RANGE_SIZE = 1024 * 1024 * 8
+DOWNLOAD_PREFETCH = 2
+
+
+def get_chunk_ranges(chunks, start, end, range_size=DOWNLOAD_RANGE_SIZE):
+    """
+    Split bytes start to end (included) of a file into reads of at most range_size bytes.
+    :param chunks: chunks of the file manifest, [{'file_id', 'start', 'size'}]
+    :return: list of (chunk file_id, start in chunk, end in chunk, offset from start)
+    """
+    file_ranges = []
+    for chunk in chunks:
+        chunk_start = chunk['start']
+        low = max(start, chunk_start)
+        high = min(end, chunk_start + chunk['size'] - 1)
+        for range_start in range(low, high + 1, range_size):
+            range_end = min(high, range_start + range_size - 1)
+            file_ranges.append((chunk['file_id'], range_start - chunk_start, range_end - chunk_start,
+                                range_start - start))
+    return file_ranges
+
+
+def stream_ranges(read_range, file_ranges, prefetch=DOWNLOAD_PREFETCH):
+    """
+    Yield read_range(file_range) for every range in order, reading at most prefetch ranges ahead
+    so the memory used by a download does not grow with the file.
+    """
+    executor = ThreadPoolExecutor(max_workers=prefetch)
+    futures = deque()
+    file_ranges = iter(file_ranges)
+    try:
+        for file_range in itertools.islice(file_ranges, prefetch):
+            futures.append(executor.submit(read_range, file_range))
+        while futures:
+            binary = futures.popleft().result()
+            for file_range in itertools.islice(file_ranges, 1):
+                futures.append(executor.submit(read_range, file_range))
+            yield binary
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def upload_parts(upload_part, numbered_chunks, max_workers=UPLOAD_MAX_WORKERS):
+    """
+    :return: upload_part(numbered_chunk) of every chunk in order. At most max_workers chunks are read ahead
+    of the finished parts so the memory used by an upload does not grow with the file.
+    """
+    parts = []
+    futures = deque()
+    numbered_chunks = iter(numbered_chunks)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for numbered_chunk in itertools.islice(numbered_chunks, max_workers):
+                futures.append(executor.submit(upload_part, numbered_chunk))
+            while futures:
+                parts.append(futures.popleft().result())
+                for numbered_chunk in itertools.islice(numbered_chunks, 1):
+                    futures.append(executor.submit(upload_part, numbered_chunk))
+        finally:
+            for future in futures:
+                future.cancel()
+    return parts
+
+
+def parse_range_header(range_header, file_size):
+    """
+    :param range_header: value of the Range header, only a single range of bytes is supported
+    :return: (start, end) with end included, None to send the whole file, False when the range is not satisfiable
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    start, _, end = range_header[len('bytes='):].strip().partition('-')
+    try:
+        if not start:  # Last bytes of the file, e.g. bytes=-500
+            suffix_length = int(end)
+            if suffix_length <= 0 or file_size == 0:
+                return False
+            return max(file_size - suffix_length, 0), file_size - 1
+        start = int(start)
+        end = int(end) if end else file_size - 1
+    except ValueError:
+        return None
+    if start >= file_size or end < start:
+        return False
+    return start, min(end, file_size - 1)
 
 
 class Storage(LoginRequiredMixin, View):
@@ -31,23 +128,32 @@ class Storage(LoginRequiredMixin, View):
                 return response
             elif cmd == 'download_b64':
                 file_id = request.GET['file_id']
-                string_file_b64 = None
-                file_name = 'file'
-                while file_id:
-                    result = storage_api.download_b64(file_id)
-                    file_id = result.get('parent_file_id', None)
-                    string_b64_chuck = result.get('file_b64')
-
-                    if string_file_b64:
-                        string_file_b64 = string_b64_chuck + string_file_b64
-                    else:
-                        string_file_b64 = string_b64_chuck
-                    file_name = result.get('file_name', file_name)
-
-                string_b64 = string_file_b64.encode('utf-8')
-                file_bin = base64.b64decode(string_b64)
+                manifest = storage_api.get_file_manifest(file_id)
+                if not manifest.get('success', False):
+                    return JsonResponse(manifest, status=404)
+                file_name = manifest.get('file_name', None) or 'file'
+                file_size = manifest['file_size']
 
-                response = HttpResponse(file_bin, content_type='application/x-binary')
+                byte_range = parse_range_header(request.META.get('HTTP_RANGE', None), file_size)
+                if byte_range is False:
+                    response = HttpResponse(status=416)
+                    response['Content-Range'] = 'bytes */{}'.format(file_size)
+                    return response
+                start, end = byte_range or (0, file_size - 1)
+                file_ranges = get_chunk_ranges(manifest['chunks'], start, end)
+
+                def read_range(file_range):
+                    chunk_id, range_start, range_end, _ = file_range
+                    result = storage_api.download_b64(chunk_id, range_start, range_end)
+                    return base64.b64decode(result['file_b64'])
+
+                response = StreamingHttpResponse(stream_ranges(read_range, file_ranges),
+                                                 status=206 if byte_range else 200,
+                                                 content_type='application/x-binary')
+                response['Content-Length'] = str(end + 1 - start)
+                response['Accept-Ranges'] = 'bytes'
+                if byte_range:
+                    response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, file_size)
                 file_name = file_name.encode('utf8').decode('ISO-8859-1')
                 response['Content-Disposition'] = 'attachment; filename=%s' % os.path.basename(file_name)
                 return response
@@ -72,19 +178,23 @@ class Storage(LoginRequiredMixin, View):
                 file_name = request.POST['file_name']
                 read_groups = json.loads(request.POST.get('read_groups'))
                 write_groups = json.loads(request.POST.get('write_groups'))
-                parent_file_id = None
-
-                def divide_chunks(text, n):
-                    for i in range(0, len(text), n):
-                        yield text[i:i + n]
-
-                raw_base64 = file_bin.read()
-                raw_base64 = base64.b64encode(raw_base64)
-                raw_base64 = raw_base64.decode('utf-8')
-                base64_chunks = divide_chunks(raw_base64, 1024 * 1024 * 4)  # 4mb
-                for base64_chunk in base64_chunks:
-                    result = storage_api.upload_b64(parent_file_id, file_name, base64_chunk, read_groups, write_groups)
-                    parent_file_id = result.get('file_id')
+
+                result = storage_api.create_multipart_upload(file_name, read_groups, write_groups)
+                file_id = result['file_id']
+
+                def upload_part(numbered_chunk):
+                    part_number, chunk = numbered_chunk
+                    chunk_b64 = base64.b64encode(chunk).decode('utf-8')
+                    part = storage_api.upload_part_b64(file_id, part_number, chunk_b64)
+                    return {'part_number': part_number, 'etag': part['etag']}
+
+                chunks = enumerate(file_bin.chunks(chunk_size=UPLOAD_PART_SIZE), start=1)
+                try:
+                    parts = upload_parts(upload_part, chunks) or [upload_part((1, b''))]
+                except Exception:
+                    storage_api.abort_upload(file_id)
+                    raise
+                result = storage_api.complete_upload(file_id, parts)
                 return JsonResponse(result)
             elif cmd == 'get_b64_info_items':  # For admins
                 start_key = request.POST.get('start_key', None)
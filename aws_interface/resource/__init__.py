@@ -1,13 +1,24 @@
 from resource.aws import AWSResource, AWSResourceAllocator
+from resource.memory import InMemoryResource, InMemoryResourceAllocator
+from resource.sqlite import SQLiteResource, SQLiteResourceAllocator
+from resource.trace import instrument_resource
 
 
 def get_resource(vendor, credential, app_id, vendor_session=None):
     if vendor == 'aws':
-        return AWSResource(credential, app_id, vendor_session)
+        return instrument_resource(AWSResource(credential, app_id, vendor_session))
+    elif vendor == 'memory':
+        return instrument_resource(InMemoryResource(credential, app_id))
+    elif vendor == 'sqlite':
+        return instrument_resource(SQLiteResource(credential, app_id))
     raise BaseException('No vendor name which is {}'.format(vendor))
 
 
 def get_resource_allocator(vendor, credential, app_id):
     if vendor == 'aws':
         return AWSResourceAllocator(credential, app_id)
+    elif vendor == 'memory':
+        return InMemoryResourceAllocator(credential, app_id)
+    elif vendor == 'sqlite':
+        return SQLiteResourceAllocator(credential, app_id)
     raise BaseException('No vendor name which is {}'.format(vendor))
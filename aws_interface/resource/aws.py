@@ -1,11 +1,20 @@
 import importlib
+import json
 import os
 import shutil
 import tempfile
+from itertools import islice
+from cloud.cache import TTLCache
 from resource.wrapper.boto3_wrapper import get_boto3_session, Lambda, APIGateway, IAM, DynamoDB, CostExplorer, S3
 from resource.base import ResourceAllocator, Resource
 
 
+# Partition counts by (app_id, partition), a few seconds of staleness saves reading every shard.
+count_cache = TTLCache(max_size=1024, ttl=int(os.environ.get('AWS_INTERFACE_COUNT_CACHE_TTL', 5)))
+# Index cardinalities used to plan queries by (app_id, partition, field, value, limit).
+cardinality_cache = TTLCache(max_size=4096, ttl=int(os.environ.get('AWS_INTERFACE_CARDINALITY_CACHE_TTL', 60)))
+
+
 def create_lambda_zipfile_bin(app_id, cloud_path, resource_path):
     output_filename = tempfile.mktemp()
     cloud_name = 'cloud'
@@ -31,6 +40,11 @@ def create_lambda_zipfile_bin(app_id, cloud_path, resource_path):
     return zip_file_bin
 
 
+def get_job_function_name(app_id):
+    """Logic functions are named '<app_id>-<function_name>', so the job function cannot collide with them"""
+    return '{}_jobs'.format(app_id)
+
+
 class AWSResourceAllocator(ResourceAllocator):
     def __init__(self, credential, app_id):
         super(AWSResourceAllocator, self).__init__(credential, app_id)
@@ -68,10 +82,11 @@ class AWSResourceAllocator(ResourceAllocator):
 
         role_arn = iam.create_role_and_attach_policies(role_name)
 
-        name = '{}'.format(self.app_id)
-        desc = 'aws-interface cloud API'
         runtime = 'python3.6'
-        handler = 'cloud.lambda_function.aws_handler'
+        functions = [
+            ('{}'.format(self.app_id), 'aws-interface cloud API', 'cloud.lambda_function.aws_handler'),
+            (get_job_function_name(self.app_id), 'aws-interface jobs', 'cloud.lambda_function.aws_job_handler'),
+        ]
 
         cloud_module_name = 'cloud'
         cloud_module = importlib.import_module(cloud_module_name)
@@ -83,11 +98,12 @@ class AWSResourceAllocator(ResourceAllocator):
 
         zip_file = create_lambda_zipfile_bin(self.app_id, cloud_module_path, resource_module_path)
 
-        try:
-            lambda_client.create_function(name, desc, runtime, role_arn, handler, zip_file)
-        except BaseException as ex:
-            print(ex)
-            lambda_client.update_function_code(name, zip_file)
+        for name, desc, handler in functions:
+            try:
+                lambda_client.create_function(name, desc, runtime, role_arn, handler, zip_file)
+            except BaseException as ex:
+                print(ex)
+                lambda_client.update_function_code(name, zip_file)
 
     def _create_rest_api_connection(self):
         api_name = '{}'.format(self.app_id)
@@ -97,7 +113,7 @@ class AWSResourceAllocator(ResourceAllocator):
 
     def _create_bucket(self):
         s3 = S3(self.boto3_session)
-        s3.create_bucket(self.app_id)
+        s3.init_bucket(self.app_id)  # Also sets the lifecycle rules of buckets created before them
 
     def _get_rest_api_url(self):
         api_name = '{}'.format(self.app_id)
@@ -113,6 +129,7 @@ class AWSResourceAllocator(ResourceAllocator):
         resource_name = '{}'.format(self.app_id)
         lambda_client = Lambda(self.boto3_session)
         lambda_client.delete_function(resource_name)
+        lambda_client.delete_function(get_job_function_name(self.app_id))
 
     def _remove_rest_api_connection(self):
         resource_name = '{}'.format(self.app_id)
@@ -188,9 +205,11 @@ class AWSResource(Resource):
         result = dynamo.get_items(self.app_id, item_ids)
         return result.get('Items', [])
 
-    def db_get_items_in_partition(self, partition, exclusive_start_key=None, limit=100, reverse=False):
+    def db_get_items_in_partition(self, partition, exclusive_start_key=None, limit=100, reverse=False,
+                                  projection=None):
         dynamo = DynamoDB(self.boto3_session)
-        result = dynamo.get_items_in_partition(self.app_id, partition, exclusive_start_key, limit, reverse)
+        result = dynamo.get_items_in_partition(self.app_id, partition, exclusive_start_key, limit, reverse,
+                                               projection=projection)
         end_key = result.get('LastEvaluatedKey', None)
         items = result.get('Items', [])
         return items, end_key
@@ -200,15 +219,27 @@ class AWSResource(Resource):
         result = dynamo.put_item(self.app_id, partition, item, item_id, creation_date)
         return bool(result)
 
-    def db_update_item(self, item_id, item):
+    def db_put_items(self, partition, items):
         dynamo = DynamoDB(self.boto3_session)
-        result = dynamo.update_item(self.app_id, item_id, item)
+        result = dynamo.put_items(self.app_id, partition, items)
         return bool(result)
 
-    def db_get_count(self, partition):
+    def db_update_item(self, item_id, item, condition=None):
+        dynamo = DynamoDB(self.boto3_session)
+        result = dynamo.update_item(self.app_id, item_id, item, condition)
+        return bool(result)
+
+    def db_add_to_item(self, partition, item_id, field, value, item=None, creation_date=None):
         dynamo = DynamoDB(self.boto3_session)
-        item = dynamo.get_item_count(self.app_id, '{}-count'.format(partition)).get('Item', {'count': 0})
-        count = item.get('count')
+        result = dynamo.add_to_item(self.app_id, partition, item_id, field, value, item, creation_date)
+        return bool(result)
+
+    def db_get_count(self, partition):
+        count = count_cache.get((self.app_id, partition), None)
+        if count is None:
+            dynamo = DynamoDB(self.boto3_session)
+            count = dynamo.get_partition_count(self.app_id, partition)
+            count_cache.set((self.app_id, partition), count)
         return count
 
     def db_get_item_ids_equal(self, partition, field, value, start_key, limit):
@@ -219,6 +250,56 @@ class AWSResource(Resource):
         ids = {item.get('item_id') for item in items}
         return ids, end_key
 
+    def db_get_index_entries_equal(self, partition, field, value, start_creation_date, start_key, limit):
+        dynamo = DynamoDB(self.boto3_session)
+        response = dynamo.get_inverted_queries(self.app_id, partition, field, value, 'eq', start_key, limit,
+                                               start_creation_date=start_creation_date)
+        items = response.get('Items', [])
+        end_key = response.get('LastEvaluatedKey', None)
+        entries = [(item.get('creationDate'), item.get('item_id')) for item in items]
+        return entries, end_key
+
+    def db_get_items_in_partition_since(self, partition, start_creation_date, start_key, limit, statements=None):
+        dynamo = DynamoDB(self.boto3_session)
+        filter_expression = dynamo.get_filter_expression(statements or [])
+        result = dynamo.get_items_in_partition(self.app_id, partition, start_key, limit,
+                                               start_creation_date=start_creation_date,
+                                               filter_expression=filter_expression)
+        end_key = result.get('LastEvaluatedKey', None)
+        items = result.get('Items', [])
+        return items, end_key
+
+    def db_get_range_fields(self, partition):
+        dynamo = DynamoDB(self.boto3_session)
+        return dynamo.get_range_fields(self.app_id, partition)
+
+    def db_create_range_index(self, partition, field):
+        dynamo = DynamoDB(self.boto3_session)
+        result = dynamo.create_range_index(self.app_id, partition, field)
+        return bool(result)
+
+    def db_get_index_entries_range(self, partition, field, condition, value, limit=None):
+        dynamo = DynamoDB(self.boto3_session)
+        items = dynamo.iter_range_queries(self.app_id, partition, field, condition, value, page_size=limit or 1000)
+        return [(item.get('creationDate'), item.get('item_id')) for item in islice(items, limit)]
+
+    def db_get_index_entries_range_since(self, partition, field, condition, value, start_creation_date,
+                                         start_key, limit):
+        dynamo = DynamoDB(self.boto3_session)
+        response = dynamo.get_range_queries_since(self.app_id, partition, field, condition, value,
+                                                  start_creation_date, start_key, limit)
+        entries = [(item.get('creationDate'), item.get('item_id')) for item in response.get('Items', [])]
+        return entries, response.get('LastEvaluatedKey', None)
+
+    def db_get_item_count_equal(self, partition, field, value, limit):
+        key = (self.app_id, partition, field, str(value), limit)
+        count = cardinality_cache.get(key, None)
+        if count is None:
+            dynamo = DynamoDB(self.boto3_session)
+            count = dynamo.count_inverted_queries(self.app_id, partition, field, value, 'eq', limit)
+            cardinality_cache.set(key, count)
+        return count
+
     # File ops
     def file_download_bin(self, file_id):
         s3 = S3(self.boto3_session)
@@ -235,6 +316,44 @@ class AWSResource(Resource):
         result = s3.delete_bin(self.app_id, file_id)
         return bool(result)
 
+    def file_get_size(self, file_id):
+        s3 = S3(self.boto3_session)
+        return s3.get_size(self.app_id, file_id)
+
+    def file_get_upload_url(self, file_id, expires_in):
+        s3 = S3(self.boto3_session)
+        return s3.generate_upload_url(self.app_id, file_id, expires_in)
+
+    def file_get_download_url(self, file_id, expires_in, file_name=None):
+        s3 = S3(self.boto3_session)
+        return s3.generate_download_url(self.app_id, file_id, expires_in, file_name)
+
+    def file_create_multipart_upload(self, file_id):
+        s3 = S3(self.boto3_session)
+        return s3.create_multipart_upload(self.app_id, file_id)
+
+    def file_get_upload_part_url(self, file_id, upload_id, part_number, expires_in):
+        s3 = S3(self.boto3_session)
+        return s3.generate_upload_part_url(self.app_id, file_id, upload_id, part_number, expires_in)
+
+    def file_upload_part(self, file_id, upload_id, part_number, binary):
+        s3 = S3(self.boto3_session)
+        return s3.upload_part(self.app_id, file_id, upload_id, part_number, binary)
+
+    def file_complete_multipart_upload(self, file_id, upload_id, parts):
+        s3 = S3(self.boto3_session)
+        result = s3.complete_multipart_upload(self.app_id, file_id, upload_id, parts)
+        return bool(result)
+
+    def file_abort_multipart_upload(self, file_id, upload_id):
+        s3 = S3(self.boto3_session)
+        result = s3.abort_multipart_upload(self.app_id, file_id, upload_id)
+        return bool(result)
+
+    def file_download_range(self, file_id, start, end):
+        s3 = S3(self.boto3_session)
+        return s3.download_range(self.app_id, file_id, start, end)
+
     # Server-less ops
     def sl_create_function(self, function_name, runtime, handler, zip_file_bin):
         lambda_client = Lambda(self.boto3_session)
@@ -264,4 +383,12 @@ class AWSResource(Resource):
         result = lambda_client.invoke_function(name, payload)
         error = result.get('FunctionError', None)
         response_payload = result.get('Payload', None)
+        if response_payload is not None:
+            response_payload = response_payload.read()
         return response_payload, error
+
+    def sl_invoke_job_async(self, payload):
+        lambda_client = Lambda(self.boto3_session)
+        result = lambda_client.invoke_function_async(get_job_function_name(self.app_id),
+                                                     json.dumps(payload).encode('utf-8'))
+        return bool(result)
@@ -1,5 +1,8 @@
 from abc import ABCMeta
+from itertools import islice, takewhile
 from resource.sdk import generate
+from resource.query import EmptyStream, PagedStream, AndStream, OrStream, FilterStream, ConcatStream, Entry, \
+    match_condition, encode_cursor, decode_cursor
 
 
 class ResourceAllocator(metaclass=ABCMeta):
@@ -32,12 +35,17 @@ class ResourceAllocator(metaclass=ABCMeta):
         raise NotImplementedError
 
 
-class IDDict(dict):
-    def __hash__(self):
-        return hash(self['id'])
-
-
 class Resource(metaclass=ABCMeta):
+    # Index cardinality is only counted up to this, bigger indexes are estimated at this size.
+    query_plan_cardinality_limit = 1000
+    range_conditions = ('gt', 'ge', 'ls', 'le')
+    # Ranges matching at most this many rows are read at once from the range index, which is ordered by value,
+    # and sorted by creation date. Wider ranges are read in creation date order, this many rows per page.
+    range_stream_max_rows = 1000
+    # Items are expired once the epoch seconds in this field have passed. DynamoDB deletes them with TTL
+    # some time later, other backends keep them, so readers skip expired items themselves.
+    ttl_field = 'expiresAt'
+
     def __init__(self, credential, app_id):
         self.credential = credential
         self.app_id = app_id
@@ -69,16 +77,48 @@ class Resource(metaclass=ABCMeta):
         raise NotImplementedError
 
     def db_get_items(self, item_ids):
+        """
+        :param item_ids: any number of ids
+        :return: items in the order of item_ids, ids without item are left out
+        """
         raise NotImplementedError
 
-    def db_get_items_in_partition(self, partition, start_key=None, limit=None, reverse=False):
+    def db_get_items_in_partition(self, partition, start_key=None, limit=None, reverse=False, projection=None):
+        """
+        :param projection: list of fields to read, None reads whole items
+        :return: items, end_key
+        """
         raise NotImplementedError
 
     def db_put_item(self, partition, item, item_id=None, creation_date=None):
-        """This is connected with db_get_count"""
+        """
+        This is connected with db_get_count, overwriting an item of the same partition does not count it again.
+        The item and its index are written atomically, AWSResource rejects items with more than 98 index rows
+        with ValueError.
+        """
+        raise NotImplementedError
+
+    def db_put_items(self, partition, items):
+        """
+        Put many new items at once, with generated ids, for bulk writes like logs.
+        The creationDate of an item is kept when it is set. The writes are batched and not atomic.
+        This is connected with db_get_count
+        """
         raise NotImplementedError
 
-    def db_update_item(self, item_id, item):
+    def db_update_item(self, item_id, item, condition=None):
+        """
+        :param condition: (field, value), the item is only updated when its field is equal to value, atomically
+        :return: False when condition is not met
+        """
+        raise NotImplementedError
+
+    def db_add_to_item(self, partition, item_id, field, value, item=None, creation_date=None):
+        """
+        Atomically add value to the number field of item_id, for counters written concurrently.
+        The item is created with the fields of item on its first write, its other fields are set on every write.
+        These items are not indexed for queries and not counted in db_get_count.
+        """
         raise NotImplementedError
 
     def db_get_count(self, partition):
@@ -87,6 +127,56 @@ class Resource(metaclass=ABCMeta):
     def db_get_item_ids_equal(self, partition, field, value, start_key, limit):
         raise NotImplementedError
 
+    def db_get_index_entries_equal(self, partition, field, value, start_creation_date, start_key, limit):
+        """
+        Same as db_get_item_ids_equal but ordered by creation date and starting from start_creation_date
+        :return: entries:list of (creation_date, item_id), end_key
+        """
+        raise NotImplementedError
+
+    def db_get_items_in_partition_since(self, partition, start_creation_date, start_key, limit, statements=None):
+        """
+        Items of partition ordered by creation date and starting from start_creation_date
+        :param statements: (field, condition, value) list the backend may use to skip items early,
+        returned items are checked against them again so backends are free to ignore them.
+        :return: items:list, end_key
+        """
+        raise NotImplementedError
+
+    def db_get_range_fields(self, partition):
+        """:return: fields of partition which have a range index"""
+        raise NotImplementedError
+
+    def db_create_range_index(self, partition, field):
+        """Range index field of partition, including the items already in it"""
+        raise NotImplementedError
+
+    def db_get_index_entries_range(self, partition, field, condition, value, limit=None):
+        """
+        Items whose field satisfies condition (gt|ge|ls|le) against value, read from the range index
+        in the order of the index, which is not the creation date order.
+        :param limit: read at most limit entries, None reads every entry
+        :return: entries:list of (creation_date, item_id)
+        """
+        raise NotImplementedError
+
+    def db_get_index_entries_range_since(self, partition, field, condition, value, start_creation_date,
+                                         start_key, limit):
+        """
+        Same entries as db_get_index_entries_range, ordered by creation date and starting from start_creation_date.
+        Backends may read limit index rows and drop those out of the range, so a page can hold fewer entries
+        while end_key is set.
+        :return: entries:list of (creation_date, item_id), end_key
+        """
+        raise NotImplementedError
+
+    def db_get_item_count_equal(self, partition, field, value, limit):
+        """
+        Estimated number of items whose field equals value, used to plan queries.
+        :return: count:int, at most limit
+        """
+        raise NotImplementedError
+
     # File ops
     def file_download_bin(self, file_id):
         raise NotImplementedError
@@ -97,6 +187,69 @@ class Resource(metaclass=ABCMeta):
     def file_delete_bin(self, file_id):
         raise NotImplementedError
 
+    def file_get_size(self, file_id):
+        """
+        :return: size of the stored file in bytes, None when nothing is stored under file_id
+        """
+        raise NotImplementedError
+
+    def file_get_upload_url(self, file_id, expires_in):
+        """
+        URL a client uploads the file to with a single HTTP PUT, without going through the backend.
+        :return: url:str
+        """
+        raise NotImplementedError
+
+    def file_get_download_url(self, file_id, expires_in, file_name=None):
+        """
+        URL a client downloads the file from with HTTP GET, Range requests included.
+        :return: url:str
+        """
+        raise NotImplementedError
+
+    def file_create_multipart_upload(self, file_id):
+        """
+        :return: upload_id:str
+        """
+        raise NotImplementedError
+
+    def file_get_upload_part_url(self, file_id, upload_id, part_number, expires_in):
+        """
+        URL a client uploads part part_number (1 to 10000) of a multipart upload to with HTTP PUT,
+        the ETag header of the response is needed to complete the upload.
+        :return: url:str
+        """
+        raise NotImplementedError
+
+    def file_upload_part(self, file_id, upload_id, part_number, binary):
+        """
+        Upload part part_number of a multipart upload, every part but the last must be at least 5 MB.
+        :return: etag:str
+        """
+        raise NotImplementedError
+
+    def file_complete_multipart_upload(self, file_id, upload_id, parts):
+        """
+        Assemble the uploaded parts into the file
+        :param parts: list of (part_number, etag)
+        :return: False when the upload does not exist or a part is missing or has another etag
+        """
+        raise NotImplementedError
+
+    def file_abort_multipart_upload(self, file_id, upload_id):
+        """
+        Drop the parts uploaded so far
+        """
+        raise NotImplementedError
+
+    def file_download_range(self, file_id, start, end):
+        """
+        :param start: first byte
+        :param end: last byte, included
+        :return: binary, None when nothing is stored under file_id
+        """
+        raise NotImplementedError
+
     # Server-less ops
     def sl_create_function(self, function_name, runtime, handler, zip_file_bin):
         raise NotImplementedError
@@ -115,52 +268,246 @@ class Resource(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    def sl_invoke_job_async(self, payload):
+        """
+        Invoke the job handler of the app with payload without waiting for it, for work continued in the background.
+        Unlike the cloud API it cannot be invoked through the REST API.
+        :param payload: dict event of cloud.lambda_function.aws_job_handler
+        """
+        raise NotImplementedError
+
     # SHOULD NOT RE-IMPLEMENT
-    def db_query(self, partition, instructions, start_index=0, limit=100):
-        """:return:items:list,end_key:str"""
+    def db_query(self, partition, instructions, start_key=None, limit=100, plan=None):
+        """
+        Items of partition matching instructions, ordered by (creationDate, id).
+        Instructions are merged as lazy streams and reading stops once limit items are found.
+        :param start_key: end_key of the previous page
+        :param plan: db_query_plan of partition and instructions, already computed to be explained
+        :return:items:list,end_key:str|None
+        """
         # TODO 상위레이어에서 쿼리를 순차적으로 실행가능한 instructions 으로 만들어 전달 -> ORM 클래스 만들기
+        if not limit:
+            limit = 100
 
-        def get_items():
-            item_set = set()
-            for idx, option_statement in enumerate(instructions):
-                if isinstance(option_statement, list):
-                    option = option_statement[0]
-                    statement = (option_statement[1], option_statement[2], option_statement[3])
-                elif isinstance(option_statement, tuple):
-                    (option, statement) = option_statement
-                elif isinstance(option_statement, dict):
-                    option = option_statement['option']
-                    statement = (option_statement['field'], option_statement['condition'], option_statement['value'])
-                else:
-                    raise BaseException('Unknown instruction type')
+        def make_stream(start_creation_date):
+            return self._db_query_stream(partition, instructions, limit, start_creation_date, plan)
+        return self._db_read_page(make_stream, start_key, limit)
 
-                instruction_type = self._db_instruction_type(statement, option)
-                if instruction_type == 'index':
-                    if option == 'and':
-                        item_set &= set(self._db_index_items(statement, partition))
-                    elif option == 'or' or option is None:
-                        item_set |= set(self._db_index_items(statement, partition))
-                elif instruction_type == 'filter':
-                    if option == 'and':
-                        item_set = set(self._db_filter_items(statement, item_set))
-                    elif option == 'or' or option is None:
-                        raise BaseException('You cannot use option [or] on filtering')
-                elif instruction_type == 'scan':
-                    if option == 'and':
-                        item_set &= set(self._db_scan_items(statement, partition))
-                    elif option == 'or' or option is None:
-                        item_set |= set(self._db_scan_items(statement, partition))
-            return list(item_set)
+    def db_query_partitions(self, partition_groups, instructions, start_key=None, limit=100,
+                            start_creation_date=None, end_creation_date=None, live_at=None):
+        """
+        db_query over several partitions, like the time buckets of logs. Without instructions every item matches.
+        :param partition_groups: list of partition lists. Groups hold items of increasing and disjoint creation dates
+        and are read one after the other, partitions of a group are merged.
+        :param start_creation_date: items created before it are left out
+        :param end_creation_date: items created after it are left out
+        :param live_at: epoch seconds, items expired by then are left out before limit is applied
+        :return:items:list,end_key:str|None
+        """
         if not limit:
             limit = 100
-        if not start_index:
-            start_index = 0
-        items = get_items()
-        items = items[start_index: start_index + limit]
-        items = self._db_batch_fake_items_to_real(items)
 
-        end_index = start_index + limit
-        return list(items), end_index
+        def make_stream(start_creation_date):
+            def group_streams():
+                for partitions in partition_groups:
+                    stream = EmptyStream()
+                    for partition in partitions:
+                        if instructions:
+                            sub_stream = self._db_query_stream(partition, instructions, limit, start_creation_date)
+                        else:
+                            sub_stream = self._db_scan_stream(partition, [], start_creation_date)
+                        stream = OrStream(stream, sub_stream)
+                    yield stream
+            stream = ConcatStream(group_streams())
+            if live_at is not None:
+                stream = FilterStream(stream, self._db_live_predicate(live_at), self._db_hydrate_entries,
+                                      chunk_size=limit)
+            return stream
+        return self._db_read_page(make_stream, start_key, limit, start_creation_date, end_creation_date)
+
+    def _db_query_stream(self, partition, instructions, limit, start_creation_date, plan=None):
+        if plan is None:
+            plan = self.db_query_plan(partition, instructions, limit, explain=False)
+        stream = EmptyStream()
+        for step in plan['steps']:
+            statements = step['statements']
+            if step['type'] == 'index':
+                sub_stream = self._db_index_stream(partition, statements[0], start_creation_date)
+            elif step['type'] == 'range':
+                sub_stream = self._db_range_stream(partition, statements[0], start_creation_date)
+            elif step['type'] == 'scan':
+                sub_stream = self._db_scan_stream(partition, statements, start_creation_date)
+            else:
+                stream = FilterStream(stream, self._db_statements_predicate(statements), self._db_hydrate_entries)
+                continue
+            if step['option'] == 'and':
+                stream = AndStream(stream, sub_stream)
+            else:
+                stream = OrStream(stream, sub_stream)
+        return stream
+
+    def _db_read_page(self, make_stream, start_key, limit, start_creation_date=None, end_creation_date=None):
+        """
+        :param make_stream: function(start_creation_date) -> Stream
+        """
+        skip = 0
+        cursor = None
+        if isinstance(start_key, int) or (isinstance(start_key, str) and start_key.isdigit()):
+            skip = int(start_key)  # Legacy numeric end_index
+        elif start_key:
+            cursor = decode_cursor(start_key)
+        if cursor and (start_creation_date is None or cursor[0] > start_creation_date):
+            start_creation_date = cursor[0]
+
+        stream = make_stream(start_creation_date)
+        if start_creation_date is not None:
+            stream.seek((start_creation_date, ''))
+        if cursor:
+            stream.seek(cursor)
+            entry = stream.peek()
+            if entry is not None and entry.key == cursor:
+                stream.pop()
+        entries = iter(stream)
+        if end_creation_date is not None:
+            entries = takewhile(lambda entry: entry.key[0] <= end_creation_date, entries)
+        entries = list(islice(entries, skip, skip + limit))
+        self._db_hydrate_entries(entries)
+        items = [entry.item for entry in entries if entry.item is not None]
+
+        end_key = None
+        if len(entries) == limit:
+            end_key = encode_cursor(entries[-1].key)
+        return items, end_key
+
+    def db_query_plan(self, partition, instructions, limit=100, explain=True):
+        """
+        Order in which db_query runs instructions, this is also the explain output of query_items.
+        Queries made only of [and] instructions are reordered to start from the most selective index,
+        or run as a single partition scan when that reads less. Indexes are only counted to be ordered
+        against each other, queries with a single index step are planned without reading counts.
+        Range conditions on range indexed fields read the range index instead of filtering items.
+        :param explain: Estimate every step, otherwise only what is needed to choose the plan
+        :return: {'steps': [{'option', 'type', 'statements', 'estimated_rows'}], 'estimated_reads': int}
+        """
+        instructions = [self._db_parse_instruction(instruction) for instruction in instructions]
+        options = [option for option, _ in instructions]
+        conjunctive = len(instructions) > 1 and options[0] is None and all(option == 'and' for option in options[1:])
+        range_fields = []
+        if any(statement[1] in self.range_conditions for _, statement in instructions):
+            range_fields = self.db_get_range_fields(partition)
+
+        def instruction_type_of(statement, option):
+            field, condition, value = statement
+            if condition in self.range_conditions and field in range_fields:
+                return 'range'
+            return self._db_instruction_type(statement, option)
+
+        if not conjunctive and not explain:
+            steps = [self._db_plan_step(option, instruction_type_of(statement, option), [statement], None)
+                     for option, statement in instructions]
+            return {
+                'steps': steps,
+                'estimated_reads': None,
+            }
+
+        if conjunctive:
+            statements = [statement for _, statement in instructions]
+            index_statements = []
+            filter_statements = []
+            for statement in statements:
+                instruction_type = instruction_type_of(statement, 'and')
+                if instruction_type == 'filter':
+                    filter_statements.append(statement)
+                else:
+                    index_statements.append((instruction_type, statement))
+            if len(index_statements) <= 1 and not explain:  # Nothing to reorder, no need to count
+                return {
+                    'steps': self._db_conjunctive_plan_steps([(None, instruction_type, statement)
+                                                              for instruction_type, statement in index_statements],
+                                                             filter_statements, statements, None),
+                    'estimated_reads': None,
+                }
+
+        partition_count = int(self.db_get_count(partition) or 0)
+        index_cardinality_limit = max(min(partition_count, self.query_plan_cardinality_limit), 1)
+
+        def estimate(statement):
+            field, condition, value = statement
+            return int(self.db_get_item_count_equal(partition, field, value, index_cardinality_limit))
+
+        if conjunctive:
+            estimates = sorted((estimate(statement) if instruction_type == 'index' else partition_count // 3,
+                                instruction_type, statement) for instruction_type, statement in index_statements)
+            steps = self._db_conjunctive_plan_steps(estimates, filter_statements, statements, partition_count)
+            if steps[0]['type'] != 'scan':
+                # Leapfrog intersection reads at most about the smallest index once per index.
+                estimated_reads = estimates[0][0] * len(estimates) + min(estimates[0][0], limit)
+            else:
+                estimated_reads = partition_count
+        else:
+            steps = []
+            estimated_reads = 0
+            rows = 0
+            for option, statement in instructions:
+                instruction_type = instruction_type_of(statement, option)
+                if instruction_type == 'index':
+                    estimated_rows = estimate(statement)
+                    estimated_reads += estimated_rows
+                elif instruction_type == 'range':
+                    estimated_rows = partition_count // 3
+                    estimated_reads += estimated_rows
+                elif instruction_type == 'scan':
+                    estimated_rows = partition_count
+                    estimated_reads += partition_count
+                else:
+                    estimated_rows = rows
+                    estimated_reads += rows
+                rows = min(rows, estimated_rows) if option == 'and' else rows + estimated_rows
+                steps.append(self._db_plan_step(option, instruction_type, [statement], estimated_rows))
+            estimated_reads += min(rows, limit)
+        return {
+            'steps': steps,
+            'estimated_reads': estimated_reads,
+        }
+
+    def _db_conjunctive_plan_steps(self, estimates, filter_statements, statements, partition_count):
+        """
+        Steps of [and] only instructions, from the index steps sorted by estimated rows.
+        Intersecting several indexes reads about the smallest one once per index,
+        a single partition scan is chosen when that is not less than the partition.
+        Estimates are counted up to query_plan_cardinality_limit, so only small partitions are scanned.
+        :param estimates: sorted list of (estimated_rows, type, statement), estimated_rows None when not counted
+        """
+        if not estimates or (len(estimates) > 1 and estimates[0][0] * len(estimates) >= partition_count):
+            return [self._db_plan_step(None, 'scan', statements, partition_count)]
+        steps = []
+        for idx, (estimated_rows, instruction_type, statement) in enumerate(estimates):
+            option = 'and' if idx else None
+            steps.append(self._db_plan_step(option, instruction_type, [statement], estimated_rows))
+        if filter_statements:
+            steps.append(self._db_plan_step('and', 'filter', filter_statements, estimates[0][0]))
+        return steps
+
+    def _db_plan_step(self, option, step_type, statements, estimated_rows):
+        return {
+            'option': option,
+            'type': step_type,
+            'statements': statements,
+            'estimated_rows': estimated_rows,
+        }
+
+    def _db_parse_instruction(self, option_statement):
+        if isinstance(option_statement, list):
+            option = option_statement[0]
+            statement = (option_statement[1], option_statement[2], option_statement[3])
+        elif isinstance(option_statement, tuple):
+            (option, statement) = option_statement
+        elif isinstance(option_statement, dict):
+            option = option_statement['option']
+            statement = (option_statement['field'], option_statement['condition'], option_statement['value'])
+        else:
+            raise BaseException('Unknown instruction type')
+        return option, tuple(statement)
 
     def _db_instruction_type(self, statement, option):
         field, condition, value = statement
@@ -182,84 +529,56 @@ class Resource(metaclass=ABCMeta):
         else:
             raise BaseException('No such option : [{}]'.format(option))
 
-    def _db_get_fake_item(self, item_id):
-        return {
-            'id': item_id,
-            '_is_fake': True
-        }
+    def _db_statements_predicate(self, statements):
+        return lambda item: all(match_condition(item, field, condition, value)
+                                for field, condition, value in statements)
 
-    def _db_batch_fake_items_to_real(self, items):
-        item_ids = [item['id'] for item in items]
-        bulk_size = 100
-        items = []
-        for i in range(0, len(item_ids), bulk_size):
-            items.extend(self.db_get_items(item_ids[i:i+bulk_size]))
-        for item in items:
-            yield IDDict(item)
+    def _db_live_predicate(self, now):
+        return lambda item: item.get(self.ttl_field, None) is None or item[self.ttl_field] > now
 
-    def _db_index_items(self, statement, partition):
+    def _db_hydrate_entries(self, entries):
+        """Load the items of entries which have not been loaded yet"""
+        item_ids = [entry.item_id for entry in entries if entry.item is None]
+        items = {}
+        if item_ids:
+            items = {item['id']: item for item in self.db_get_items(item_ids)}
+        for entry in entries:
+            if entry.item is None:
+                entry.item = items.get(entry.item_id, None)
+
+    def _db_index_stream(self, partition, statement, start_creation_date):
         field, condition, value = statement
-        start_key = None
-        while True:
-            if condition == 'eq':
-                item_ids, start_key = self.db_get_item_ids_equal(partition, field, value, start_key, 10000)
-                for item_id in item_ids:
-                    yield IDDict(self._db_get_fake_item(item_id))
-            else:
-                raise BaseException('You cannot use condition : [{}] for indexing'.format(condition))
-            if start_key is None:
-                break
+        if condition != 'eq':
+            raise BaseException('You cannot use condition : [{}] for indexing'.format(condition))
+
+        def fetch(_start_creation_date, start_key, limit):
+            entries, end_key = self.db_get_index_entries_equal(partition, field, value,
+                                                               _start_creation_date, start_key, limit)
+            return [Entry(creation_date, item_id) for creation_date, item_id in entries], end_key
+        return PagedStream(fetch, start_creation_date)
 
-    def _db_filter_items(self, statement, items):
+    def _db_range_stream(self, partition, statement, start_creation_date):
         field, condition, value = statement
-        items = self._db_batch_fake_items_to_real(items)
-        for item in items:
-            item_value = item.get(field, None)
-            if not item_value:
-                continue
-            else:
-                if condition == 'eq':
-                    if value == item_value:
-                        yield item
-                elif condition == 'in':
-                    if value in item_value:
-                        yield item
-                elif condition == 'gt':
-                    if isinstance(item_value, str):
-                        if str(value) < str(item_value):
-                            yield item
-                    else:
-                        if float(value) < float(item_value):
-                            yield item
-                elif condition == 'ls':
-                    if isinstance(item_value, str):
-                        if str(value) > str(item_value):
-                            yield item
-                    else:
-                        if float(value) > float(item_value):
-                            yield item
-                elif condition == 'ge':
-                    if isinstance(item_value, str):
-                        if str(value) <= str(item_value):
-                            yield item
-                    else:
-                        if float(value) <= float(item_value):
-                            yield item
-                elif condition == 'le':
-                    if isinstance(item_value, str):
-                        if str(value) >= str(item_value):
-                            yield item
-                    else:
-                        if float(value) >= float(item_value):
-                            yield item
-                else:
-                    raise BaseException('No such condition : [{}]'.format(condition))
-
-    def _db_scan_items(self, statement, partition):
-        start_key = None
-        while True:
-            items, start_key = self.db_get_items_in_partition(partition, start_key)
-            for item in self._db_filter_items(statement, items):
-                yield IDDict(item)
-            if start_key is None:
-                break
+        entries = self.db_get_index_entries_range(partition, field, condition, value, self.range_stream_max_rows + 1)
+        if len(entries) > self.range_stream_max_rows:
+            def fetch_since(_start_creation_date, start_key, limit):
+                entries, end_key = self.db_get_index_entries_range_since(partition, field, condition, value,
+                                                                         _start_creation_date, start_key, limit)
+                return [Entry(creation_date, item_id) for creation_date, item_id in entries], end_key
+            return PagedStream(fetch_since, start_creation_date, page_size=self.range_stream_max_rows)
+        entries = [Entry(creation_date, item_id) for creation_date, item_id in entries]
+
+        def fetch(_start_creation_date, start_key, limit):
+            return [entry for entry in entries
+                    if _start_creation_date is None or entry.key[0] >= _start_creation_date], None
+        return PagedStream(fetch, start_creation_date)
+
+    def _db_scan_stream(self, partition, statements, start_creation_date):
+        predicate = self._db_statements_predicate(statements)
+
+        def fetch(_start_creation_date, start_key, limit):
+            items, end_key = self.db_get_items_in_partition_since(partition, _start_creation_date, start_key, limit,
+                                                                  statements)
+            entries = [Entry(item['creationDate'], item['id'], item) for item in items if predicate(item)]
+            return entries, end_key
+        return PagedStream(fetch, start_creation_date)
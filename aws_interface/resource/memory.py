@@ -0,0 +1,498 @@
+import copy
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+import cloud.shortuuid as shortuuid
+from resource.base import Resource, ResourceAllocator
+from resource.query import encode_range_value, range_index_bounds
+
+
+class MemoryTable:
+    """
+    Everything an app stores, kept in process memory and shared by every InMemoryResource of the app.
+    Indexes are sorted lists of (creation_date, item_id) like the partition and inverted query indexes of DynamoDB.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.items = {}
+        self.partitions = {}  # partition -> [(creation_date, item_id)]
+        self.eq_indexes = {}  # (partition, field, str(value)) -> [(creation_date, item_id)]
+        self.range_indexes = {}  # (partition, field) -> ([encoded value], [(encoded value, creation_date, item_id)])
+        self.counts = {}
+        self.files = {}
+        self.uploads = {}  # upload_id -> {part_number: binary}
+        self.functions = {}
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_memory_table(app_id):
+    with _tables_lock:
+        table = _tables.get(app_id, None)
+        if table is None:
+            table = MemoryTable()
+            _tables[app_id] = table
+        return table
+
+
+def delete_memory_table(app_id):
+    with _tables_lock:
+        table = _tables.pop(app_id, None)
+    if table:
+        for function in table.functions.values():
+            shutil.rmtree(function.get('directory', None) or '', ignore_errors=True)
+
+
+def _insert(keys, key):
+    idx = bisect_left(keys, key)
+    if idx == len(keys) or keys[idx] != key:
+        keys.insert(idx, key)
+
+
+def _remove(keys, key):
+    idx = bisect_left(keys, key)
+    if idx < len(keys) and keys[idx] == key:
+        del keys[idx]
+
+
+def _get_page(keys, start_key, limit, reverse=False, start_creation_date=None):
+    """
+    Page of sorted (creation_date, item_id) keys, paginated like a DynamoDB query:
+    end_key is the last key of a full page, even when no key follows it.
+    """
+    if reverse:
+        end = len(keys)
+        if start_key:
+            end = bisect_left(keys, (start_key['creationDate'], start_key['id']))
+        start = bisect_left(keys, (start_creation_date,)) if start_creation_date is not None else 0
+        if limit:
+            start = max(start, end - limit)
+        page = keys[start:end][::-1]
+    else:
+        start = bisect_left(keys, (start_creation_date,)) if start_creation_date is not None else 0
+        if start_key:
+            start = max(start, bisect_right(keys, (start_key['creationDate'], start_key['id'])))
+        page = keys[start:start + limit] if limit else keys[start:]
+    end_key = None
+    if limit and len(page) == limit:
+        creation_date, item_id = page[-1]
+        end_key = {'creationDate': creation_date, 'id': item_id}
+    return page, end_key
+
+
+def load_python_handler(zip_file_bin, handler):
+    """
+    Extract a function zip file and import its python handler ('module.function') in this process.
+    :return: handler:callable, directory:str where the zip file was extracted
+    """
+    directory = tempfile.mkdtemp()
+    with zipfile.ZipFile(io.BytesIO(zip_file_bin)) as zip_file:
+        zip_file.extractall(directory)
+    module_name, callable_name = handler.rsplit('.', 1)
+    path = os.path.join(directory, *module_name.split('.')) + '.py'
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, callable_name), directory
+
+
+def call_python_handler(handler, payload):
+    """
+    Call handler like Lambda does, errors are reported as 'Unhandled' with a payload describing the exception.
+    :return: response_payload:bytes, error:str|None
+    """
+    if isinstance(payload, (str, bytes)):
+        payload = json.loads(payload)
+    try:
+        response = handler(payload, None)
+    except Exception as ex:
+        error = {
+            'errorMessage': str(ex),
+            'errorType': type(ex).__name__,
+        }
+        return json.dumps(error).encode('utf-8'), 'Unhandled'
+    return json.dumps(response).encode('utf-8'), None
+
+
+# Asynchronous invocations of the cloud API of local backends run on these threads
+BACKGROUND_MAX_WORKERS = int(os.environ.get('AWS_INTERFACE_BACKGROUND_MAX_WORKERS', 4))
+_background_executor = ThreadPoolExecutor(max_workers=BACKGROUND_MAX_WORKERS)
+
+
+def invoke_job_in_background(resource, payload):
+    """Run the job handler on a background thread like an asynchronous Lambda invocation"""
+    import cloud.lambda_function as lambda_function  # cloud imports resource, so it is imported on use
+
+    def run():
+        try:
+            lambda_function.job_event_handler(payload, resource)
+        except Exception as ex:
+            print('background invocation failed: {}'.format(ex))
+    return _background_executor.submit(run)
+
+
+class InMemoryResourceAllocator(ResourceAllocator):
+    def create(self):
+        get_memory_table(self.app_id)
+
+    def terminate(self):
+        delete_memory_table(self.app_id)
+
+    def get_rest_api_url(self):
+        return None
+
+
+class InMemoryResource(Resource):
+    """
+    Resource keeping the app in process memory, for local runs and benchmarks.
+    Writes, indexes, counts and pagination behave like AWSResource without any network call.
+    """
+    def __init__(self, credential, app_id):
+        super(InMemoryResource, self).__init__(credential, app_id)
+        self.table = get_memory_table(app_id)
+
+    # backend resource cost
+    def cost_for(self, start, end):
+        return {
+            'ResultsByTime': [{
+                'Total': {'BlendedCost': {'Amount': '0', 'Unit': 'USD'}},
+            }]
+        }
+
+    def cost_and_usage_for(self, start, end):
+        return {
+            'ResultsByTime': [{
+                'Groups': [],
+            }]
+        }
+
+    # DB ops
+    def db_create_partition(self, partition):
+        item = {
+            'name': partition
+        }
+        return self._put_item('partition-list', item, partition, indexing=False)
+
+    def db_delete_partition(self, partition):
+        return self.db_delete_item(partition)
+
+    def db_has_partition(self, partition):
+        return partition in self.table.items
+
+    def db_get_partitions(self):
+        items, _ = self.db_get_items_in_partition('partition-list', limit=None)
+        return items
+
+    def db_delete_item(self, item_id):
+        with self.table.lock:
+            item = self.table.items.get(item_id, None)
+            partition = (item or {}).get('partition', None)
+            if not partition:
+                print('It cannot be removed. app_id: {}, item_id: {}'.format(self.app_id, item_id))
+                return False
+            self._unindex_item(item)
+            del self.table.items[item_id]
+            self.table.counts[partition] = self.table.counts.get(partition, 0) - 1
+        return True
+
+    def db_delete_item_batch(self, item_ids):
+        result = True
+        for item_id in item_ids:
+            result &= self.db_delete_item(item_id)
+        return result
+
+    def db_get_item(self, item_id):
+        with self.table.lock:
+            return copy.deepcopy(self.table.items.get(item_id, None))
+
+    def db_get_items(self, item_ids):
+        with self.table.lock:
+            return [copy.deepcopy(self.table.items[item_id]) for item_id in dict.fromkeys(item_ids)
+                    if item_id in self.table.items]
+
+    def db_get_items_in_partition(self, partition, exclusive_start_key=None, limit=100, reverse=False,
+                                  projection=None):
+        with self.table.lock:
+            keys = self.table.partitions.get(partition, [])
+            page, end_key = _get_page(keys, exclusive_start_key, limit, reverse)
+            items = [self.table.items[item_id] for _, item_id in page]
+            if projection:
+                items = [{field: item[field] for field in projection if field in item} for item in items]
+            return copy.deepcopy(items), end_key
+
+    def db_put_item(self, partition, item, item_id=None, creation_date=None):
+        return self._put_item(partition, item, item_id, creation_date)
+
+    def db_put_items(self, partition, items):
+        with self.table.lock:
+            for item in items:
+                self._put_item(partition, item, creation_date=item.get('creationDate', None))
+        return bool(items)
+
+    def db_update_item(self, item_id, item, condition=None):
+        with self.table.lock:
+            old_item = self.table.items.get(item_id, None)
+            if condition and (old_item or {}).get(condition[0], None) != condition[1]:
+                return False
+            item['id'] = item_id
+            item['_update_date'] = int(time.time())
+            for field in ('partition', 'creationDate'):
+                if field not in item and old_item and field in old_item:
+                    item[field] = old_item[field]
+            if old_item:
+                self._unindex_item(old_item)
+            self.table.items[item_id] = copy.deepcopy(item)
+            self._index_item(item)
+        return True
+
+    def db_add_to_item(self, partition, item_id, field, value, item=None, creation_date=None):
+        with self.table.lock:
+            old_item = self.table.items.get(item_id, None)
+            if old_item is None:
+                new_item = dict(item or {})
+                new_item[field] = 0
+                new_item['id'] = item_id
+                new_item['creationDate'] = creation_date or int(time.time())
+                new_item['partition'] = partition
+                self.table.items[item_id] = new_item
+                _insert(self.table.partitions.setdefault(partition, []), (new_item['creationDate'], item_id))
+                old_item = new_item
+            old_item.update(copy.deepcopy(item or {}))
+            old_item[field] = old_item.get(field, 0) + value
+        return True
+
+    def db_get_count(self, partition):
+        return self.table.counts.get(partition, 0)
+
+    def db_get_item_ids_equal(self, partition, field, value, start_key, limit):
+        entries, end_key = self.db_get_index_entries_equal(partition, field, value, None, start_key, limit)
+        return {item_id for _, item_id in entries}, end_key
+
+    def db_get_index_entries_equal(self, partition, field, value, start_creation_date, start_key, limit):
+        with self.table.lock:
+            keys = self.table.eq_indexes.get((partition, field, str(value)), [])
+            return _get_page(keys, start_key, limit, start_creation_date=start_creation_date)
+
+    def db_get_items_in_partition_since(self, partition, start_creation_date, start_key, limit, statements=None):
+        with self.table.lock:
+            keys = self.table.partitions.get(partition, [])
+            page, end_key = _get_page(keys, start_key, limit, start_creation_date=start_creation_date)
+            items = [self.table.items[item_id] for _, item_id in page]
+            return copy.deepcopy(items), end_key
+
+    def db_get_range_fields(self, partition):
+        item = self.table.items.get(partition, None) or {}
+        if item.get('partition', None) != 'partition-list':
+            return []
+        return list(item.get('range_fields', []))
+
+    def db_create_range_index(self, partition, field):
+        with self.table.lock:
+            partition_item = self.table.items.get(partition, None)
+            if partition_item is not None and field not in partition_item.get('range_fields', []):
+                partition_item['range_fields'] = partition_item.get('range_fields', []) + [field]
+            for _, item_id in self.table.partitions.get(partition, []):
+                self._index_range(partition, self.table.items[item_id], [field])
+        return True
+
+    def db_get_index_entries_range(self, partition, field, condition, value, limit=None):
+        with self.table.lock:
+            values, rows = self.table.range_indexes.get((partition, field), ([], []))
+            entries = []
+            for low, high, excluded in range_index_bounds(condition, value):
+                for encoded, creation_date, item_id in rows[bisect_left(values, low):bisect_right(values, high)]:
+                    if encoded != excluded:
+                        entries.append((creation_date, item_id))
+            return entries[:limit]
+
+    def db_get_index_entries_range_since(self, partition, field, condition, value, start_creation_date,
+                                         start_key, limit):
+        with self.table.lock:
+            entries = sorted(self.db_get_index_entries_range(partition, field, condition, value))
+            return _get_page(entries, start_key, limit, start_creation_date=start_creation_date)
+
+    def db_get_item_count_equal(self, partition, field, value, limit):
+        return min(len(self.table.eq_indexes.get((partition, field, str(value)), [])), limit)
+
+    def _put_item(self, partition, item, item_id=None, creation_date=None, indexing=True):
+        if not item_id:
+            item_id = str(shortuuid.uuid())
+        if not creation_date:
+            creation_date = int(time.time())
+        item['id'] = item_id
+        item['creationDate'] = creation_date
+        item['partition'] = partition
+        with self.table.lock:
+            old_item = self.table.items.get(item_id, None)
+            if old_item:
+                self._unindex_item(old_item)
+            self.table.items[item_id] = copy.deepcopy(item)
+            if indexing:
+                self._index_item(item)
+            else:
+                _insert(self.table.partitions.setdefault(partition, []), (creation_date, item_id))
+            # Overwrites are not counted again, like the partition counters of DynamoDB
+            old_partition = (old_item or {}).get('partition', None)
+            if old_partition != partition:
+                self.table.counts[partition] = self.table.counts.get(partition, 0) + 1
+                if old_partition:
+                    self.table.counts[old_partition] = self.table.counts.get(old_partition, 0) - 1
+        return True
+
+    def _index_item(self, item):
+        partition = item.get('partition', None)
+        if partition is None:
+            return
+        key = (item['creationDate'], item['id'])
+        _insert(self.table.partitions.setdefault(partition, []), key)
+        for field, value in item.items():
+            _insert(self.table.eq_indexes.setdefault((partition, field, str(value)), []), key)
+        self._index_range(partition, item, self.db_get_range_fields(partition))
+
+    def _index_range(self, partition, item, range_fields):
+        for field in range_fields:
+            value = item.get(field, None)
+            encoded = encode_range_value(value) if value else None  # Falsy values never satisfy range conditions
+            if encoded is None:
+                continue
+            values, rows = self.table.range_indexes.setdefault((partition, field), ([], []))
+            row = (encoded, item['creationDate'], item['id'])
+            idx = bisect_left(rows, row)
+            if idx == len(rows) or rows[idx] != row:
+                rows.insert(idx, row)
+                values.insert(idx, encoded)
+
+    def _unindex_item(self, item):
+        partition = item.get('partition', None)
+        if partition is None:
+            return
+        key = (item['creationDate'], item['id'])
+        _remove(self.table.partitions.get(partition, []), key)
+        for field, value in item.items():
+            _remove(self.table.eq_indexes.get((partition, field, str(value)), []), key)
+        for field in self.db_get_range_fields(partition):
+            values, rows = self.table.range_indexes.get((partition, field), ([], []))
+            value = item.get(field, None)
+            encoded = encode_range_value(value) if value else None
+            if encoded is None:
+                continue
+            row = (encoded, item['creationDate'], item['id'])
+            idx = bisect_left(rows, row)
+            if idx < len(rows) and rows[idx] == row:
+                del rows[idx]
+                del values[idx]
+
+    # File ops
+    def file_download_bin(self, file_id):
+        binary = self.table.files.get(file_id, None)
+        if binary is None:
+            print('The object does not exist.')
+        return binary
+
+    def file_upload_bin(self, file_id, binary):
+        self.table.files[file_id] = bytes(binary)
+        return True
+
+    def file_delete_bin(self, file_id):
+        self.table.files.pop(file_id, None)
+        return True
+
+    def file_get_size(self, file_id):
+        binary = self.table.files.get(file_id, None)
+        return None if binary is None else len(binary)
+
+    def file_create_multipart_upload(self, file_id):
+        upload_id = str(shortuuid.uuid())
+        self.table.uploads[upload_id] = {}
+        return upload_id
+
+    def file_upload_part(self, file_id, upload_id, part_number, binary):
+        parts = self.table.uploads.get(upload_id, None)
+        if parts is None:
+            raise BaseException('No such upload: {}'.format(upload_id))
+        parts[part_number] = bytes(binary)
+        return '"{}"'.format(hashlib.md5(binary).hexdigest())
+
+    def file_complete_multipart_upload(self, file_id, upload_id, parts):
+        uploaded_parts = self.table.uploads.get(upload_id, None)
+        if uploaded_parts is None:
+            print('No such upload: {}'.format(upload_id))
+            return False
+        if not parts:
+            print('No parts to complete upload: {}'.format(upload_id))
+            return False
+        for part_number, etag in parts:
+            binary = uploaded_parts.get(part_number, None)
+            if binary is None or etag != '"{}"'.format(hashlib.md5(binary).hexdigest()):
+                print('Invalid part: {}'.format(part_number))
+                return False
+        self.table.uploads.pop(upload_id, None)
+        self.table.files[file_id] = b''.join(uploaded_parts[part_number] for part_number, _ in sorted(parts))
+        return True
+
+    def file_abort_multipart_upload(self, file_id, upload_id):
+        self.table.uploads.pop(upload_id, None)
+        return True
+
+    def file_download_range(self, file_id, start, end):
+        binary = self.table.files.get(file_id, None)
+        if binary is None:
+            print('The object does not exist.')
+            return None
+        return binary[start:end + 1]
+
+    # Server-less ops
+    def sl_create_function(self, function_name, runtime, handler, zip_file_bin):
+        with self.table.lock:
+            self.table.functions[function_name] = {
+                'runtime': runtime,
+                'handler': handler,
+                'zip_file_bin': zip_file_bin,
+            }
+        return True
+
+    def sl_delete_function(self, function_name):
+        with self.table.lock:
+            function = self.table.functions.pop(function_name, None)
+        if function is None:
+            return False
+        shutil.rmtree(function.get('directory', None) or '', ignore_errors=True)
+        return True
+
+    def sl_update_function(self, function_name, zip_file_bin):
+        with self.table.lock:
+            function = self.table.functions.get(function_name, None)
+            if function is None:
+                return False
+            shutil.rmtree(function.pop('directory', None) or '', ignore_errors=True)
+            function.pop('callable', None)
+            function['zip_file_bin'] = zip_file_bin
+        return True
+
+    def sl_invoke_function(self, function_name, payload):
+        """Run the handler of a python function in this process, its zip file is extracted on the first call"""
+        with self.table.lock:
+            function = self.table.functions.get(function_name, None)
+            if function is None:
+                raise BaseException('Function not found: {}'.format(function_name))
+            if 'callable' not in function:
+                function['callable'], function['directory'] = load_python_handler(function['zip_file_bin'],
+                                                                                  function['handler'])
+            handler = function['callable']
+        return call_python_handler(handler, payload)
+
+    def sl_invoke_job_async(self, payload):
+        invoke_job_in_background(self, payload)
+        return True
@@ -0,0 +1,316 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+
+def encode_cursor(key):
+    creation_date, item_id = key
+    cursor = json.dumps({'creationDate': int(creation_date), 'id': item_id})
+    return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('utf-8')
+
+
+def decode_cursor(cursor):
+    cursor = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8')
+    cursor = json.loads(cursor)
+    return cursor['creationDate'], cursor['id']
+
+
+def is_number(value):
+    try:
+        return Decimal(str(value)).is_finite()
+    except InvalidOperation:
+        return False
+
+
+def encode_range_value(value):
+    """
+    Encode value into a string whose byte order is the order of values, numbers sort before strings.
+    Numbers are 'N' + sign class + exponent + mantissa digits, negative numbers complemented.
+    :return: str or None when value cannot be range indexed
+    """
+    if isinstance(value, str):
+        encoded = 'S' + value
+        if len(encoded.encode('utf-8')) > 1024:  # DynamoDB sort key limit
+            return None
+        return encoded
+    if isinstance(value, bool):
+        value = int(value)
+    if not isinstance(value, (int, float, Decimal)):
+        return None
+    number = Decimal(str(value))
+    if not number.is_finite():
+        return None
+    if number.is_zero():
+        return 'N1'
+    digits = ''.join(str(digit) for digit in number.normalize().as_tuple().digits)
+    exponent = number.adjusted()
+    if number > 0:
+        return 'N2{:04d}{}'.format(exponent + 5000, digits)
+    digits = ''.join(str(9 - int(digit)) for digit in digits)
+    return 'N0{:04d}{}~'.format(5000 - exponent, digits)
+
+
+def range_index_bounds(condition, value):
+    """
+    Ranges of encoded values satisfying condition (gt|ge|ls|le) against value.
+    Strings and numbers are looked up in their own part of the index like Python compares them.
+    :return: list of (low, high, excluded), both bounds included, rows equal to excluded are not part of the result
+    """
+    regions = [('S' + str(value), 'S', 'T')]
+    if not isinstance(value, str) or is_number(value):
+        regions.append((encode_range_value(Decimal(str(value))), 'N', 'O'))
+    bounds = []
+    for encoded, low, high in regions:
+        excluded = encoded if condition in ('gt', 'ls') else None
+        if condition in ('gt', 'ge'):
+            bounds.append((encoded, high, excluded))
+        elif condition in ('ls', 'le'):
+            bounds.append((low, encoded, excluded))
+        else:
+            raise BaseException('an operation is must be <gt>, <ge>, <ls> or <le>')
+    return bounds
+
+
+def match_condition(item, field, condition, value):
+    if condition == 'eq':  # Same as the inverted index which keeps values as strings
+        return field in item and str(item[field]) == str(value)
+    item_value = item.get(field, None)
+    if not item_value:
+        return False
+    if condition == 'in':
+        return value in item_value
+    if isinstance(item_value, str):
+        value, item_value = str(value), str(item_value)
+    else:
+        value, item_value = float(value), float(item_value)
+    if condition == 'gt':
+        return value < item_value
+    elif condition == 'ls':
+        return value > item_value
+    elif condition == 'ge':
+        return value <= item_value
+    elif condition == 'le':
+        return value >= item_value
+    raise BaseException('No such condition : [{}]'.format(condition))
+
+
+class Entry:
+    """
+    Query result candidate. Streams are ordered by key = (creation_date, item_id),
+    item stays None until somebody needs the full item.
+    """
+    __slots__ = ('key', 'item')
+
+    def __init__(self, creation_date, item_id, item=None):
+        self.key = (creation_date, item_id)
+        self.item = item
+
+    @property
+    def item_id(self):
+        return self.key[1]
+
+
+class Stream:
+    """
+    Lazy iterator of entries in ascending key order.
+    peek() returns the head without consuming it, seek(key) skips every entry below key.
+    """
+    def peek(self):
+        raise NotImplementedError
+
+    def pop(self):
+        entry = self.peek()
+        if entry is not None:
+            self._drop()
+        return entry
+
+    def seek(self, key):
+        while True:
+            entry = self.peek()
+            if entry is None or entry.key >= key:
+                return
+            self._drop()
+
+    def _drop(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        while True:
+            entry = self.pop()
+            if entry is None:
+                return
+            yield entry
+
+
+class EmptyStream(Stream):
+    def peek(self):
+        return None
+
+    def _drop(self):
+        pass
+
+
+class PagedStream(Stream):
+    """
+    Stream over a backend reading pages ordered by creation date only.
+    fetch(start_creation_date, start_key, limit) -> entries:list, end_key
+    Entries sharing a creation date are sorted by id once the whole group is buffered,
+    and seeking past the buffer restarts the backend read from the target creation date.
+    """
+    def __init__(self, fetch, start_creation_date=None, page_size=100):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.buffer = []
+        self.start_key = None
+        self.done = False
+        self._read(start_creation_date, None)
+
+    def _read(self, start_creation_date, start_key):
+        entries, self.start_key = self.fetch(start_creation_date, start_key, self.page_size)
+        self.buffer.extend(entries)
+        self.buffer.sort(key=lambda entry: entry.key)
+        self.done = self.start_key is None
+        self.last_creation_date = self.buffer[-1].key[0] if self.buffer else start_creation_date
+
+    def _fill(self):
+        while not self.done and (not self.buffer or self.buffer[0].key[0] >= self.last_creation_date):
+            self._read(None, self.start_key)
+
+    def peek(self):
+        self._fill()
+        if self.buffer:
+            return self.buffer[0]
+        return None
+
+    def _drop(self):
+        self.buffer.pop(0)
+
+    def seek(self, key):
+        self.buffer = [entry for entry in self.buffer if entry.key >= key]
+        if not self.buffer and not self.done and self.last_creation_date is not None \
+                and key[0] > self.last_creation_date:
+            self.start_key = None
+            self._read(key[0], None)
+        super(PagedStream, self).seek(key)
+
+
+class AndStream(Stream):
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def peek(self):
+        while True:
+            left = self.left.peek()
+            right = self.right.peek()
+            if left is None or right is None:
+                return None
+            if left.key == right.key:
+                left.item = left.item or right.item
+                return left
+            elif left.key < right.key:
+                self.left.seek(right.key)
+            else:
+                self.right.seek(left.key)
+
+    def _drop(self):
+        self.left.pop()
+        self.right.pop()
+
+    def seek(self, key):
+        self.left.seek(key)
+        self.right.seek(key)
+
+
+class OrStream(Stream):
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def peek(self):
+        left = self.left.peek()
+        right = self.right.peek()
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.key == right.key:
+            left.item = left.item or right.item
+            return left
+        return min(left, right, key=lambda entry: entry.key)
+
+    def _drop(self):
+        entry = self.peek()
+        for stream in (self.left, self.right):
+            head = stream.peek()
+            if head is not None and head.key == entry.key:
+                stream.pop()
+
+    def seek(self, key):
+        self.left.seek(key)
+        self.right.seek(key)
+
+
+class ConcatStream(Stream):
+    """
+    Streams of increasing and disjoint key ranges read one after the other.
+    streams is an iterable consumed lazily, a stream is only created once the previous ones are exhausted.
+    """
+    def __init__(self, streams):
+        self.streams = iter(streams)
+        self.current = EmptyStream()
+
+    def peek(self):
+        while True:
+            entry = self.current.peek()
+            if entry is not None:
+                return entry
+            self.current = next(self.streams, None)
+            if self.current is None:
+                self.current = EmptyStream()
+                return None
+
+    def _drop(self):
+        self.current.pop()
+
+    def seek(self, key):
+        while True:
+            self.current.seek(key)
+            entry = self.peek()
+            if entry is None or entry.key >= key:
+                return
+
+
+class FilterStream(Stream):
+    """
+    Keep the entries of source whose item satisfies predicate.
+    Items are loaded by hydrate(entries) in chunks of chunk_size.
+    """
+    def __init__(self, source, predicate, hydrate, chunk_size=100):
+        self.source = source
+        self.predicate = predicate
+        self.hydrate = hydrate
+        self.chunk_size = chunk_size
+        self.buffer = []
+
+    def peek(self):
+        while not self.buffer:
+            chunk = []
+            while len(chunk) < self.chunk_size:
+                entry = self.source.pop()
+                if entry is None:
+                    break
+                chunk.append(entry)
+            if not chunk:
+                return None
+            self.hydrate(chunk)
+            self.buffer = [entry for entry in chunk if entry.item is not None and self.predicate(entry.item)]
+        return self.buffer[0]
+
+    def _drop(self):
+        self.buffer.pop(0)
+
+    def seek(self, key):
+        self.buffer = [entry for entry in self.buffer if entry.key >= key]
+        if not self.buffer:
+            self.source.seek(key)
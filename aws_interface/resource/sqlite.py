@@ -0,0 +1,638 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import cloud.shortuuid as shortuuid
+from resource.base import Resource, ResourceAllocator
+from resource.memory import load_python_handler, call_python_handler, invoke_job_in_background
+from resource.query import Entry, PagedStream, encode_cursor, decode_cursor, match_condition, is_number
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS items ('
+    ' id TEXT PRIMARY KEY, partition TEXT, creation_date INTEGER, body TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS items_partition ON items (partition, creation_date, id)',
+    # One row per field of an item. value is str(field value) like the inverted queries of DynamoDB,
+    # string_value and number keep truthy strings and numbers for range conditions.
+    'CREATE TABLE IF NOT EXISTS item_fields ('
+    ' item_id TEXT NOT NULL, field TEXT NOT NULL, partition TEXT, creation_date INTEGER,'
+    ' value TEXT, string_value TEXT, number REAL, PRIMARY KEY (item_id, field)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS item_fields_value ON item_fields (partition, field, value, creation_date, item_id)',
+    'CREATE INDEX IF NOT EXISTS item_fields_string ON item_fields (partition, field, string_value)',
+    'CREATE INDEX IF NOT EXISTS item_fields_number ON item_fields (partition, field, number)',
+    'CREATE TABLE IF NOT EXISTS counts (partition TEXT PRIMARY KEY, count INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS functions ('
+    ' name TEXT PRIMARY KEY, runtime TEXT, handler TEXT, zip_file_bin BLOB)',
+]
+
+RANGE_OPERATORS = {
+    'gt': '>',
+    'ge': '>=',
+    'ls': '<',
+    'le': '<=',
+}
+
+# Connections are not shared between threads, each thread opens its own connection per database file.
+_thread_local = threading.local()
+_schema_lock = threading.Lock()
+_initialized_paths = set()
+
+# Logic function handlers loaded in this process by (database path, function name)
+_handlers = {}
+
+
+def get_sqlite_directory(credential, app_id):
+    """
+    Directory holding the database and the files of app_id,
+    set with credential {'sqlite': {'directory': ...}} or AWS_INTERFACE_SQLITE_DIR.
+    """
+    directory = ((credential or {}).get('sqlite', None) or {}).get('directory', None)
+    if not directory:
+        directory = os.environ.get('AWS_INTERFACE_SQLITE_DIR', os.path.join(os.getcwd(), 'sqlite'))
+    return os.path.join(directory, app_id)
+
+
+def get_connection(path):
+    connections = getattr(_thread_local, 'connections', None)
+    if connections is None:
+        connections = {}
+        _thread_local.connections = connections
+    connection = connections.get(path, None)
+    if connection is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with _schema_lock:
+            if path not in _initialized_paths:
+                with connection:
+                    for statement in SCHEMA:
+                        connection.execute(statement)
+                _initialized_paths.add(path)
+        connections[path] = connection
+    return connection
+
+
+def _close_connection(path):
+    connection = getattr(_thread_local, 'connections', {}).pop(path, None)
+    if connection:
+        connection.close()
+    with _schema_lock:
+        _initialized_paths.discard(path)
+
+
+class SQLiteResourceAllocator(ResourceAllocator):
+    def __init__(self, credential, app_id):
+        super(SQLiteResourceAllocator, self).__init__(credential, app_id)
+        self.directory = get_sqlite_directory(credential, app_id)
+
+    def create(self):
+        get_connection(os.path.join(self.directory, 'db.sqlite3'))
+
+    def terminate(self):
+        _close_connection(os.path.join(self.directory, 'db.sqlite3'))
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_rest_api_url(self):
+        return None
+
+
+class SQLiteResource(Resource):
+    """
+    Resource storing the app in a local SQLite database for single node installs.
+    Items are JSON rows, every field is indexed and db_query runs as a single SQL query.
+    Binaries are files next to the database.
+    """
+    def __init__(self, credential, app_id):
+        super(SQLiteResource, self).__init__(credential, app_id)
+        self.directory = get_sqlite_directory(credential, app_id)
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        self.file_directory = os.path.join(self.directory, 'files')
+
+    @property
+    def connection(self):
+        return get_connection(self.path)
+
+    # backend resource cost
+    def cost_for(self, start, end):
+        return {
+            'ResultsByTime': [{
+                'Total': {'BlendedCost': {'Amount': '0', 'Unit': 'USD'}},
+            }]
+        }
+
+    def cost_and_usage_for(self, start, end):
+        return {
+            'ResultsByTime': [{
+                'Groups': [],
+            }]
+        }
+
+    # DB ops
+    def db_create_partition(self, partition):
+        item = {
+            'name': partition
+        }
+        return self._put_item('partition-list', item, partition, indexing=False)
+
+    def db_delete_partition(self, partition):
+        return self.db_delete_item(partition)
+
+    def db_has_partition(self, partition):
+        return self.db_get_item(partition) is not None
+
+    def db_get_partitions(self):
+        items, _ = self.db_get_items_in_partition('partition-list', limit=None)
+        return items
+
+    def db_delete_item(self, item_id):
+        connection = self.connection
+        with connection:
+            row = connection.execute('SELECT partition FROM items WHERE id = ?', (item_id,)).fetchone()
+            if not row or not row[0]:
+                print('It cannot be removed. app_id: {}, item_id: {}'.format(self.app_id, item_id))
+                return False
+            connection.execute('DELETE FROM items WHERE id = ?', (item_id,))
+            connection.execute('DELETE FROM item_fields WHERE item_id = ?', (item_id,))
+            self._add_count(connection, row[0], -1)
+        return True
+
+    def db_delete_item_batch(self, item_ids):
+        result = True
+        for item_id in item_ids:
+            result &= self.db_delete_item(item_id)
+        return result
+
+    def db_get_item(self, item_id):
+        row = self.connection.execute('SELECT body FROM items WHERE id = ?', (item_id,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        return None
+
+    def db_get_items(self, item_ids):
+        item_ids = list(dict.fromkeys(item_ids))
+        items = {}
+        bulk_size = 500  # Stay under the host parameter limit of SQLite
+        for idx in range(0, len(item_ids), bulk_size):
+            chunk = item_ids[idx:idx + bulk_size]
+            rows = self.connection.execute('SELECT id, body FROM items WHERE id IN ({})'.format(
+                ', '.join('?' * len(chunk))), chunk)
+            for item_id, body in rows:
+                items[item_id] = json.loads(body)
+        return [items[item_id] for item_id in item_ids if item_id in items]
+
+    def db_get_items_in_partition(self, partition, exclusive_start_key=None, limit=100, reverse=False,
+                                  projection=None):
+        items, end_key = self._get_page('SELECT creation_date, id, body FROM items WHERE partition = ?',
+                                        [partition], exclusive_start_key, limit, reverse)
+        items = [json.loads(body) for body in items]
+        if projection:
+            items = [{field: item[field] for field in projection if field in item} for item in items]
+        return items, end_key
+
+    def db_put_item(self, partition, item, item_id=None, creation_date=None):
+        return self._put_item(partition, item, item_id, creation_date)
+
+    def db_put_items(self, partition, items):
+        creation_date = int(time.time())
+        connection = self.connection
+        with connection:
+            for item in items:
+                item['id'] = str(shortuuid.uuid())
+                item['creationDate'] = item.get('creationDate', None) or creation_date
+                item['partition'] = partition
+                self._write_item(connection, item, indexing=True)
+            self._add_count(connection, partition, len(items))
+        return bool(items)
+
+    def db_update_item(self, item_id, item, condition=None):
+        connection = self.connection
+        with connection:
+            if condition:  # Take the write lock before reading so that the check and the write are atomic
+                connection.execute('BEGIN IMMEDIATE')
+            old_item = self.db_get_item(item_id) or {}
+            if condition and old_item.get(condition[0], None) != condition[1]:
+                return False
+            item['id'] = item_id
+            item['_update_date'] = int(time.time())
+            for field in ('partition', 'creationDate'):
+                if field not in item and field in old_item:
+                    item[field] = old_item[field]
+            self._write_item(connection, item, indexing=True)
+        return True
+
+    def db_add_to_item(self, partition, item_id, field, value, item=None, creation_date=None):
+        connection = self.connection
+        with connection:
+            # Take the write lock before reading so that concurrent adds are serialized
+            connection.execute('BEGIN IMMEDIATE')
+            old_item = self.db_get_item(item_id)
+            if old_item is None:
+                old_item = {
+                    field: 0,
+                    'id': item_id,
+                    'creationDate': creation_date or int(time.time()),
+                    'partition': partition,
+                }
+            old_item.update(item or {})
+            old_item[field] = old_item.get(field, 0) + value
+            self._write_item(connection, old_item, indexing=False)
+        return True
+
+    def db_get_count(self, partition):
+        row = self.connection.execute('SELECT count FROM counts WHERE partition = ?', (partition,)).fetchone()
+        return row[0] if row else 0
+
+    def db_get_item_ids_equal(self, partition, field, value, start_key, limit):
+        entries, end_key = self.db_get_index_entries_equal(partition, field, value, None, start_key, limit)
+        return {item_id for _, item_id in entries}, end_key
+
+    def db_get_index_entries_equal(self, partition, field, value, start_creation_date, start_key, limit):
+        sql = 'SELECT creation_date, item_id, creation_date FROM item_fields WHERE partition = ? AND field = ? ' \
+              'AND value = ?'
+        entries, end_key = self._get_page(sql, [partition, field, str(value)], start_key, limit,
+                                          start_creation_date=start_creation_date, id_column='item_id')
+        return entries, end_key
+
+    def db_get_items_in_partition_since(self, partition, start_creation_date, start_key, limit, statements=None):
+        items, end_key = self._get_page('SELECT creation_date, id, body FROM items WHERE partition = ?',
+                                        [partition], start_key, limit, start_creation_date=start_creation_date)
+        return [json.loads(body) for body in items], end_key
+
+    def db_get_range_fields(self, partition):
+        item = self.db_get_item(partition) or {}
+        if item.get('partition', None) != 'partition-list':
+            return []
+        return item.get('range_fields', [])
+
+    def db_create_range_index(self, partition, field):
+        """Every field is range indexed already, the field is only registered on the partition"""
+        item = self.db_get_item(partition)
+        if item is not None and field not in item.get('range_fields', []):
+            item['range_fields'] = item.get('range_fields', []) + [field]
+            self.db_update_item(partition, item)
+        return True
+
+    def db_get_index_entries_range(self, partition, field, condition, value, limit=None):
+        where, params = self._compile_statement(partition, (field, condition, value))
+        rows = self.connection.execute('SELECT creation_date, id FROM items WHERE {} ORDER BY creation_date, id '
+                                       'LIMIT ?'.format(where), params + [-1 if limit is None else limit])
+        return [(creation_date, item_id) for creation_date, item_id in rows]
+
+    def db_get_index_entries_range_since(self, partition, field, condition, value, start_creation_date,
+                                         start_key, limit):
+        where, params = self._compile_statement(partition, (field, condition, value))
+        return self._get_page('SELECT creation_date, id, creation_date FROM items WHERE {}'.format(where), params,
+                              start_key, limit, start_creation_date=start_creation_date)
+
+    def db_get_item_count_equal(self, partition, field, value, limit):
+        row = self.connection.execute('SELECT COUNT(*) FROM (SELECT 1 FROM item_fields WHERE partition = ? '
+                                      'AND field = ? AND value = ? LIMIT ?)',
+                                      (partition, field, str(value), limit)).fetchone()
+        return row[0]
+
+    def db_query(self, partition, instructions, start_key=None, limit=100, plan=None):
+        """
+        Same results and pagination as Resource.db_query, with instructions compiled to one SQL query.
+        [in] conditions are matched in SQL by field presence only, so their results are checked in Python.
+        :param plan: ignored, SQLite plans the compiled query itself
+        """
+        if not limit:
+            limit = 100
+        skip = 0
+        cursor = None
+        if isinstance(start_key, int) or (isinstance(start_key, str) and start_key.isdigit()):
+            skip = int(start_key)  # Legacy numeric end_index
+        elif start_key:
+            cursor = decode_cursor(start_key)
+        instructions = [self._db_parse_instruction(instruction) for instruction in instructions]
+        where, params = self._compile_instructions(partition, instructions)
+        recheck = any(statement[1] == 'in' for _, statement in instructions)
+
+        items = []
+        last_key = None
+        while len(items) < limit:
+            sql = 'SELECT creation_date, id, body FROM items WHERE partition = ? AND ({})'.format(where)
+            page_params = [partition] + params
+            if cursor:
+                sql += ' AND (creation_date > ? OR (creation_date = ? AND id > ?))'
+                page_params += [cursor[0], cursor[0], cursor[1]]
+            page_size = limit - len(items)
+            sql += ' ORDER BY creation_date, id LIMIT ? OFFSET ?'
+            page_params += [page_size, 0 if recheck else skip]
+            rows = self.connection.execute(sql, page_params).fetchall()
+            for creation_date, item_id, body in rows:
+                last_key = (creation_date, item_id)
+                item = json.loads(body)
+                if recheck and not self._match_instructions(item, instructions):
+                    continue
+                if recheck and skip:
+                    skip -= 1
+                    continue
+                items.append(item)
+                if len(items) == limit:
+                    break
+            if len(rows) < page_size:
+                break
+            cursor = last_key
+            skip = 0 if not recheck else skip
+
+        end_key = None
+        if len(items) == limit:
+            end_key = encode_cursor((items[-1]['creationDate'], items[-1]['id']))
+        return items, end_key
+
+    def db_query_plan(self, partition, instructions, limit=100, explain=True):
+        instructions = [self._db_parse_instruction(instruction) for instruction in instructions]
+        where, params = self._compile_instructions(partition, instructions)
+        sql = 'SELECT creation_date, id, body FROM items WHERE partition = ? AND ({}) ' \
+              'ORDER BY creation_date, id LIMIT ?'.format(where)
+        rows = self.connection.execute('EXPLAIN QUERY PLAN ' + sql, [partition] + params + [limit]).fetchall()
+        step = {
+            'option': None,
+            'type': 'sql',
+            'statements': [statement for _, statement in instructions],
+            'estimated_rows': None,
+        }
+        return {
+            'steps': [step],
+            'estimated_reads': None,
+            'sql': sql,
+            'query_plan': [row[-1] for row in rows],
+        }
+
+    def _db_query_stream(self, partition, instructions, limit, start_creation_date, plan=None):
+        """Stream of db_query_partitions, reading the compiled SQL query page by page"""
+        instructions = [self._db_parse_instruction(instruction) for instruction in instructions]
+        where, params = self._compile_instructions(partition, instructions)
+        recheck = any(statement[1] == 'in' for _, statement in instructions)
+        sql = 'SELECT creation_date, id, body FROM items WHERE partition = ? AND ({})'.format(where)
+
+        def fetch(_start_creation_date, start_key, page_size):
+            bodies, end_key = self._get_page(sql, [partition] + params, start_key, page_size,
+                                             start_creation_date=_start_creation_date)
+            items = [json.loads(body) for body in bodies]
+            return [Entry(item['creationDate'], item['id'], item) for item in items
+                    if not recheck or self._match_instructions(item, instructions)], end_key
+        return PagedStream(fetch, start_creation_date)
+
+    def _compile_instructions(self, partition, instructions):
+        """
+        Fold instructions from left to right like the streams of Resource.db_query,
+        starting from no item: (((0 [or] s1) [and|or] s2) [and|or] s3) ...
+        :return: where:str, params:list
+        """
+        where = '0'
+        params = []
+        for option, statement in instructions:
+            statement_where, statement_params = self._compile_statement(partition, statement)
+            if option == 'and':
+                where = '({}) AND {}'.format(where, statement_where)
+            else:
+                where = '({}) OR {}'.format(where, statement_where)
+            params += statement_params
+        return where, params
+
+    def _compile_statement(self, partition, statement):
+        field, condition, value = statement
+        where = 'id IN (SELECT item_id FROM item_fields WHERE partition = ? AND field = ? AND {})'
+        params = [partition, field]
+        if condition == 'eq':
+            return where.format('value = ?'), params + [str(value)]
+        elif condition == 'in':
+            # Every item having the field, db_query checks them again
+            return where.format('1'), params
+        elif condition in RANGE_OPERATORS:
+            operator = RANGE_OPERATORS[condition]
+            comparisons = ['string_value {} ?'.format(operator)]
+            params.append(str(value))
+            if not isinstance(value, str) or is_number(value):
+                comparisons.append('number {} ?'.format(operator))
+                params.append(float(value))
+            return where.format('({})'.format(' OR '.join(comparisons))), params
+        raise BaseException('No such condition : [{}]'.format(condition))
+
+    def _match_instructions(self, item, instructions):
+        matched = False
+        for option, (field, condition, value) in instructions:
+            statement_matched = match_condition(item, field, condition, value)
+            if option == 'and':
+                matched = matched and statement_matched
+            else:
+                matched = matched or statement_matched
+        return matched
+
+    def _get_page(self, sql, params, start_key, limit, reverse=False, start_creation_date=None, id_column='id'):
+        """
+        Page of rows (creation_date, id, value) of sql, paginated like a DynamoDB query:
+        end_key is the key of the last row of a full page, even when no row follows it.
+        :return: values:list, end_key
+        """
+        params = list(params)
+        if start_creation_date is not None:
+            sql += ' AND creation_date >= ?'
+            params.append(start_creation_date)
+        if start_key:
+            comparison = '<' if reverse else '>'
+            sql += ' AND (creation_date {0} ? OR (creation_date = ? AND {1} {0} ?))'.format(comparison, id_column)
+            params += [start_key['creationDate'], start_key['creationDate'], start_key['id']]
+        order = 'DESC' if reverse else 'ASC'
+        sql += ' ORDER BY creation_date {0}, {1} {0}'.format(order, id_column)
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        rows = self.connection.execute(sql, params).fetchall()
+        end_key = None
+        if limit and len(rows) == limit:
+            end_key = {'creationDate': rows[-1][0], 'id': rows[-1][1]}
+        if id_column == 'item_id':
+            return [(creation_date, item_id) for creation_date, item_id, _ in rows], end_key
+        return [value for _, _, value in rows], end_key
+
+    def _put_item(self, partition, item, item_id=None, creation_date=None, indexing=True):
+        if not item_id:
+            item_id = str(shortuuid.uuid())
+        if not creation_date:
+            creation_date = int(time.time())
+        item['id'] = item_id
+        item['creationDate'] = creation_date
+        item['partition'] = partition
+        connection = self.connection
+        with connection:
+            # Take the write lock before reading so that concurrent puts of the same id are counted once
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT partition FROM items WHERE id = ?', (item_id,)).fetchone()
+            old_partition = row[0] if row else None
+            self._write_item(connection, item, indexing)
+            # Overwrites are not counted again, like the partition counters of DynamoDB
+            if old_partition != partition:
+                self._add_count(connection, partition, 1)
+                if old_partition:
+                    self._add_count(connection, old_partition, -1)
+        return True
+
+    def _write_item(self, connection, item, indexing):
+        item_id = item['id']
+        partition = item.get('partition', None)
+        creation_date = item.get('creationDate', None)
+        connection.execute('INSERT OR REPLACE INTO items (id, partition, creation_date, body) VALUES (?, ?, ?, ?)',
+                           (item_id, partition, creation_date, json.dumps(item)))
+        connection.execute('DELETE FROM item_fields WHERE item_id = ?', (item_id,))
+        if not indexing:
+            return
+        rows = []
+        for field, value in item.items():
+            string_value = value if isinstance(value, str) and value else None
+            number = None
+            if value and isinstance(value, (int, float)):  # Falsy values never satisfy range conditions
+                number = float(value)
+            rows.append((item_id, field, partition, creation_date, str(value), string_value, number))
+        connection.executemany('INSERT INTO item_fields (item_id, field, partition, creation_date, value, '
+                               'string_value, number) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def _add_count(self, connection, partition, value_to_add):
+        connection.execute('INSERT INTO counts (partition, count) VALUES (?, ?) '
+                           'ON CONFLICT (partition) DO UPDATE SET count = count + excluded.count',
+                           (partition, value_to_add))
+
+    # File ops
+    def _get_file_path(self, file_id):
+        file_name = os.path.basename(file_id)
+        if not file_name or file_name != file_id:
+            raise BaseException('Invalid file_id: {}'.format(file_id))
+        return os.path.join(self.file_directory, file_name)
+
+    def file_download_bin(self, file_id):
+        path = self._get_file_path(file_id)
+        if not os.path.exists(path):
+            print('The object does not exist.')
+            return None
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def file_upload_bin(self, file_id, binary):
+        os.makedirs(self.file_directory, exist_ok=True)
+        path = self._get_file_path(file_id)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(binary)
+        os.replace(path + '.tmp', path)
+        return True
+
+    def file_delete_bin(self, file_id):
+        path = self._get_file_path(file_id)
+        if os.path.exists(path):
+            os.remove(path)
+        return True
+
+    def file_get_size(self, file_id):
+        path = self._get_file_path(file_id)
+        if not os.path.exists(path):
+            return None
+        return os.path.getsize(path)
+
+    def _get_upload_directory(self, upload_id):
+        if not upload_id or os.path.basename(upload_id) != upload_id:
+            raise BaseException('Invalid upload_id: {}'.format(upload_id))
+        return os.path.join(self.directory, 'uploads', upload_id)
+
+    def file_create_multipart_upload(self, file_id):
+        upload_id = str(shortuuid.uuid())
+        os.makedirs(self._get_upload_directory(upload_id))
+        return upload_id
+
+    def file_upload_part(self, file_id, upload_id, part_number, binary):
+        directory = self._get_upload_directory(upload_id)
+        if not os.path.isdir(directory):
+            raise BaseException('No such upload: {}'.format(upload_id))
+        with open(os.path.join(directory, str(int(part_number))), 'wb') as file:
+            file.write(binary)
+        return '"{}"'.format(hashlib.md5(binary).hexdigest())
+
+    def file_complete_multipart_upload(self, file_id, upload_id, parts):
+        directory = self._get_upload_directory(upload_id)
+        if not os.path.isdir(directory):
+            print('No such upload: {}'.format(upload_id))
+            return False
+        if not parts:
+            print('No parts to complete upload: {}'.format(upload_id))
+            return False
+        for part_number, etag in parts:
+            part_path = os.path.join(directory, str(int(part_number)))
+            if not os.path.isfile(part_path):
+                print('Invalid part: {}'.format(part_number))
+                return False
+            with open(part_path, 'rb') as part:
+                if etag != '"{}"'.format(hashlib.md5(part.read()).hexdigest()):
+                    print('Invalid part: {}'.format(part_number))
+                    return False
+        os.makedirs(self.file_directory, exist_ok=True)
+        path = self._get_file_path(file_id)
+        with open(path + '.tmp', 'wb') as file:
+            for part_number, _ in sorted(parts):
+                with open(os.path.join(directory, str(int(part_number))), 'rb') as part:
+                    shutil.copyfileobj(part, file)
+        os.replace(path + '.tmp', path)
+        shutil.rmtree(directory)
+        return True
+
+    def file_abort_multipart_upload(self, file_id, upload_id):
+        shutil.rmtree(self._get_upload_directory(upload_id), ignore_errors=True)
+        return True
+
+    def file_download_range(self, file_id, start, end):
+        path = self._get_file_path(file_id)
+        if not os.path.exists(path):
+            print('The object does not exist.')
+            return None
+        with open(path, 'rb') as file:
+            file.seek(start)
+            return file.read(end + 1 - start)
+
+    # Server-less ops
+    def sl_create_function(self, function_name, runtime, handler, zip_file_bin):
+        connection = self.connection
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO functions (name, runtime, handler, zip_file_bin) '
+                               'VALUES (?, ?, ?, ?)', (function_name, runtime, handler, zip_file_bin))
+        self._unload_function(function_name)
+        return True
+
+    def sl_delete_function(self, function_name):
+        connection = self.connection
+        with connection:
+            deleted = connection.execute('DELETE FROM functions WHERE name = ?', (function_name,)).rowcount
+        self._unload_function(function_name)
+        return bool(deleted)
+
+    def sl_update_function(self, function_name, zip_file_bin):
+        connection = self.connection
+        with connection:
+            updated = connection.execute('UPDATE functions SET zip_file_bin = ? WHERE name = ?',
+                                         (zip_file_bin, function_name)).rowcount
+        self._unload_function(function_name)
+        return bool(updated)
+
+    def sl_invoke_function(self, function_name, payload):
+        """Run the handler of a python function in this process, its zip file is extracted on the first call"""
+        loaded = _handlers.get((self.path, function_name), None)
+        if loaded is None:
+            row = self.connection.execute('SELECT handler, zip_file_bin FROM functions WHERE name = ?',
+                                          (function_name,)).fetchone()
+            if row is None:
+                raise BaseException('Function not found: {}'.format(function_name))
+            loaded = load_python_handler(row[1], row[0])
+            _handlers[(self.path, function_name)] = loaded
+        handler, _ = loaded
+        return call_python_handler(handler, payload)
+
+    def sl_invoke_job_async(self, payload):
+        invoke_job_in_background(self, payload)
+        return True
+
+    def _unload_function(self, function_name):
+        loaded = _handlers.pop((self.path, function_name), None)
+        if loaded:
+            shutil.rmtree(loaded[1], ignore_errors=True)
@@ -50,6 +50,38 @@ var awsi = (function () {
       _post(api_url, data, success);
     }
 
+    // operations: [{service_type: 'database', function_name: 'get_item', params: {item_id: ...}}, ...]
+    // callback receives the response bodies in the order of operations
+    function batch(operations, callback) {
+      var data = {
+        module_name: 'batch',
+        operations: operations.map(function (operation) {
+          return {
+            module_name: 'cloud.' + operation.service_type + '.' + operation.function_name,
+            params: operation.params || {},
+          };
+        }),
+      };
+      if (getSessionId() != null){
+        data['session_id'] = getSessionId();
+      }
+      $.ajax({
+        method : "POST",
+        url : _get_rest_api_url('batch'),
+        contentType : "application/json",
+        data: JSON.stringify(data),
+        success : function (response) {
+          var responses = (response.body || {}).responses || [];
+          callback(responses.map(function (operation_response) {
+            return operation_response.body || {};
+          }));
+        },
+        error : function(e) {
+            alert("error: " + JSON.stringify(e));
+        }
+      });
+    }
+
     function hasSession(){
       var session_id = getSessionId();
       if (session_id == null || session_id.length == 0){
@@ -248,6 +280,7 @@ var awsi = (function () {
 
     return {
         hasSession: hasSession,
+        batch: batch,
         auth: {
             login: login,
             logout: logout,
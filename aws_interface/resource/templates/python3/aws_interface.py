@@ -1,7 +1,75 @@
 import requests
+import atexit
 import json
 import base64
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Files larger than this are uploaded directly to storage as a multipart upload of parts of PART_SIZE bytes
+MULTIPART_THRESHOLD = 1024 * 1024 * 64
+PART_SIZE = 1024 * 1024 * 16
+# Files are downloaded as byte ranges of at most DOWNLOAD_RANGE_SIZE bytes, small enough for a response in base64
+DOWNLOAD_RANGE_SIZE = 1024 * 1024 * 3
+
+# Log events of API calls are written in the background with cloud.log.create_logs,
+# once LOG_FLUSH_SIZE events are waiting, every LOG_FLUSH_INTERVAL seconds and on exit.
+LOG_FLUSH_SIZE = 50
+LOG_FLUSH_INTERVAL = 5
+LOG_BATCH_SIZE = 100
+LOG_MAX_BUFFER = 1000  # Oldest events are dropped beyond this, e.g. while offline
+
+
+class LogBuffer:
+    def __init__(self, url):
+        self.url = url
+        self.events = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        atexit.register(self.flush)
+
+    def add(self, session_id, event_source, event_name, event_param):
+        if not session_id:  # Logs are written for a user session only
+            return
+        with self.lock:
+            self.events.append((session_id, {
+                'event_source': event_source,
+                'event_name': event_name,
+                'event_param': event_param,
+            }))
+            del self.events[:-LOG_MAX_BUFFER]
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            if len(self.events) >= LOG_FLUSH_SIZE:
+                self.wake.set()
+
+    def _run(self):
+        while True:
+            self.wake.wait(LOG_FLUSH_INTERVAL)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            events, self.events = self.events, []
+        logs_by_session = OrderedDict()
+        for session_id, log in events:
+            logs_by_session.setdefault(session_id, []).append(log)
+        for session_id, logs in logs_by_session.items():
+            for start in range(0, len(logs), LOG_BATCH_SIZE):
+                data = {
+                    'module_name': 'cloud.log.create_logs',
+                    'session_id': session_id,
+                    'logs': logs[start:start + LOG_BATCH_SIZE],
+                }
+                try:
+                    _post(self.url, json.dumps(data))
+                except Exception as ex:  # Logging never fails the client
+                    print('log flush failed: {}'.format(ex))
 
 
 class Client:
@@ -9,6 +77,7 @@ class Client:
         self.url = '{{REST_API_URL}}'
         self.session_id = None
         self.guest_id = None
+        self._log_buffer = LogBuffer(self.url)
 
     def _call_api(self, service_type, function_name, data=None):
         if not data:
@@ -20,16 +89,37 @@ class Client:
         resp = _post(self.url, data)
         return resp.json().get('body', {'error': '404', 'message': 'NO RESPONSE'})
 
+    def batch(self, operations, sequential=False):
+        """
+        Run several calls in a single request, the session is resolved once for all of them.
+        :param operations: list of (service_type, function_name, data), e.g. ('database', 'get_item', {'item_id': ...})
+        :param sequential: run the operations one after the other instead of concurrently
+        :return: list of response bodies in the order of operations
+        """
+        data = {
+            'module_name': 'batch',
+            'operations': [{
+                'module_name': 'cloud.{}.{}'.format(service_type, function_name),
+                'params': params or {},
+            } for service_type, function_name, params in operations],
+            'sequential': sequential,
+        }
+        if self.session_id:
+            data['session_id'] = self.session_id
+        resp = _post(self.url, json.dumps(data))
+        responses = resp.json().get('body', {}).get('responses', [])
+        return [response.get('body', {}) for response in responses]
+
     def _auth(self, api_name, data):
-        self.log_create_log('auth', api_name, None)
+        self._log_buffer.add(self.session_id, 'auth', api_name, None)
         return self._call_api('auth', api_name, data)
 
     def _database(self, api_name, data):
-        self.log_create_log('database', api_name, None)
+        self._log_buffer.add(self.session_id, 'database', api_name, None)
         return self._call_api('database', api_name, data)
 
     def _storage(self, api_name, data):
-        self.log_create_log('storage', api_name, None)
+        self._log_buffer.add(self.session_id, 'storage', api_name, None)
         return self._call_api('storage', api_name, data)
 
     def _log(self, api_name, data):
@@ -126,12 +216,13 @@ class Client:
         })
         return response
 
-    def database_query_items(self, partition, query, start_key=None, limit=None):
+    def database_query_items(self, partition, query, start_key=None, limit=None, explain=False):
         response = self._database('query_items', {
             'partition': partition,
             'query': query,
             'start_key': start_key,
             'limit': limit,
+            'explain': explain,
         })
         return response
 
@@ -141,68 +232,157 @@ class Client:
         })
         return response
 
-    def _storage_download_b64_chunk(self, file_id):
+    def _storage_download_b64_range(self, file_id, start, end):
         response = self._storage('download_b64', {
-            'file_id': file_id
+            'file_id': file_id,
+            'start': start,
+            'end': end,
         })
         return response
 
-    def _storage_upload_b64_chunk(self, parent_file_id, file_name, file_b64, read_groups, write_groups):
-        response = self._storage('upload_b64', {
-            'parent_file_id': parent_file_id,
-            'file_name': file_name,
-            'file_b64': file_b64,
-            'read_groups': read_groups,
-            'write_groups': write_groups,
+    def _storage_get_file_manifest(self, file_id):
+        response = self._storage('get_file_manifest', {
+            'file_id': file_id,
         })
         return response
 
     def storage_delete_file(self, file_id):
         self._storage_delete_b64(file_id)
 
-    def storage_download_file(self, file_id, download_path):
+    def storage_download_file(self, file_id, download_path, start=None, end=None, max_workers=4):
         """
         :param file_id: file_id that is uploaded on aws via storage_upload_file
         :param download_path: str
-        :return:
+        :param start: first byte to download, 0 by default
+        :param end: last byte to download, included, the end of the file by default
+        :return: manifest of the file
         """
-        string_file_b64 = None
-        file_name = 'file'
-        while file_id:
-            result = self._storage_download_b64_chunk(file_id)
-            file_id = result.get('parent_file_id', None)
-            file_name = result.get('file_name', file_name)
-            if string_file_b64:
-                string_file_b64 = result.get('file_b64') + string_file_b64
-            else:
-                string_file_b64 = result.get('file_b64')
-
-        string_b64 = string_file_b64.encode('utf-8')
-        file_bin = base64.b64decode(string_b64)
-
-        with open(download_path, 'wb+') as file_obj:
-            file_obj.seek(0)
-            file_obj.write(file_bin)
+        manifest = self._storage_get_file_manifest(file_id)
+        if not manifest.get('success', False):
+            return manifest
+        start = start or 0
+        end = manifest['file_size'] - 1 if end is None else min(end, manifest['file_size'] - 1)
+        with open(download_path, 'wb') as file_obj:
+            file_obj.truncate(max(end + 1 - start, 0))
+
+        def download_range(file_range):
+            chunk_id, chunk_start, chunk_end, offset = file_range
+            result = self._storage_download_b64_range(chunk_id, chunk_start, chunk_end)
+            if not result.get('success', False):
+                raise Exception(result.get('message', 'download failed'))
+            with open(download_path, 'r+b') as file_obj:
+                file_obj.seek(offset)
+                file_obj.write(base64.b64decode(result['file_b64'].encode('utf-8')))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(download_range, _get_chunk_ranges(manifest['chunks'], start, end)))
+        return manifest
 
     def storage_upload_file(self, file_path, read_groups, write_groups):
-        def div_chunks(text, n):
-            for i in range(0, len(text), n):
-                yield text[i:i + n]
+        return self.storage_upload_file_direct(file_path, read_groups, write_groups)
 
-        file_name = os.path.basename(file_path)
-        with open(file_path, 'rb') as file_obj:
-            raw_base64 = file_obj.read()
+    def _storage_get_upload_url(self, file_name, part_count, read_groups, write_groups):
+        response = self._storage('get_upload_url', {
+            'file_name': file_name,
+            'part_count': part_count,
+            'read_groups': read_groups,
+            'write_groups': write_groups,
+        })
+        return response
 
-        raw_base64 = base64.b64encode(raw_base64)
-        raw_base64 = raw_base64.decode('utf-8')
+    def _storage_create_multipart_upload(self, file_name, read_groups, write_groups):
+        response = self._storage('create_multipart_upload', {
+            'file_name': file_name,
+            'read_groups': read_groups,
+            'write_groups': write_groups,
+        })
+        return response
 
-        base64_chunks = div_chunks(raw_base64, 1024 * 1024 * 6)  # 4mb
-        parent_file_id = None
-        for base64_chunk in base64_chunks:
-            result = self._storage_upload_b64_chunk(parent_file_id, file_name, base64_chunk, read_groups, write_groups)
-            parent_file_id = result.get('file_id')
+    def _storage_get_upload_part_urls(self, file_id, part_numbers):
+        response = self._storage('get_upload_part_urls', {
+            'file_id': file_id,
+            'part_numbers': part_numbers,
+        })
+        return response
+
+    def _storage_abort_upload(self, file_id):
+        response = self._storage('abort_upload', {
+            'file_id': file_id,
+        })
+        return response
+
+    def _storage_complete_upload(self, file_id, parts=None):
+        response = self._storage('complete_upload', {
+            'file_id': file_id,
+            'parts': parts,
+        })
+        return response
+
+    def _storage_get_download_url(self, file_id):
+        response = self._storage('get_download_url', {
+            'file_id': file_id,
+        })
+        return response
+
+    def storage_upload_file_direct(self, file_path, read_groups, write_groups, max_workers=4):
+        """
+        Upload the file straight to storage through presigned URLs, large files in parallel parts.
+        :return: response of complete_upload, with file_id
+        """
+        file_name = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path)
+        if file_size <= MULTIPART_THRESHOLD:
+            result = self._storage_get_upload_url(file_name, None, read_groups, write_groups)
+            if not result.get('success', False):
+                return result
+            with open(file_path, 'rb') as file_obj:
+                _put(result['upload_url'], file_obj).raise_for_status()
+            return self._storage_complete_upload(result['file_id'])
+
+        result = self._storage_create_multipart_upload(file_name, read_groups, write_groups)
+        if not result.get('success', False):
+            return result
+        file_id = result['file_id']
+        part_numbers = list(range(1, (file_size + PART_SIZE - 1) // PART_SIZE + 1))
+        part_urls = self._storage_get_upload_part_urls(file_id, part_numbers)['part_urls']
+
+        def upload_part(part_number):
+            with open(file_path, 'rb') as file_obj:
+                file_obj.seek((part_number - 1) * PART_SIZE)
+                part = file_obj.read(PART_SIZE)
+            response = _put(part_urls[part_number - 1], part)
+            response.raise_for_status()
+            return {'part_number': part_number, 'etag': response.headers['ETag']}
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parts = list(executor.map(upload_part, part_numbers))
+        except Exception:
+            self._storage_abort_upload(file_id)
+            raise
+        return self._storage_complete_upload(file_id, parts)
+
+    def storage_download_file_direct(self, file_id, download_path):
+        """
+        Stream the file straight from storage to download_path through a presigned URL.
+        Files uploaded in base64 chunks are downloaded with storage_download_file.
+        """
+        result = self._storage_get_download_url(file_id)
+        if not result.get('success', False):
+            return result
+        if result.get('parent_file_id', None):
+            return self.storage_download_file(file_id, download_path)
+        with requests.get(result['download_url'], stream=True) as response:
+            response.raise_for_status()
+            with open(download_path, 'wb') as file_obj:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    file_obj.write(chunk)
         return result
 
+    def log_flush(self):
+        """Write the buffered log events now"""
+        self._log_buffer.flush()
+
     def log_create_log(self, event_source, event_name, event_param):
         response = self._log('create_log', {
             'event_source': event_source,
@@ -217,6 +397,27 @@ def _post(url, data):
     return response
 
 
+def _get_chunk_ranges(chunks, start, end):
+    """
+    :return: list of (chunk file_id, start in chunk, end in chunk, offset in the download) reading start to end
+    """
+    file_ranges = []
+    for chunk in chunks:
+        chunk_start = chunk['start']
+        low = max(start, chunk_start)
+        high = min(end, chunk_start + chunk['size'] - 1)
+        for range_start in range(low, high + 1, DOWNLOAD_RANGE_SIZE):
+            range_end = min(high, range_start + DOWNLOAD_RANGE_SIZE - 1)
+            file_ranges.append((chunk['file_id'], range_start - chunk_start, range_end - chunk_start,
+                                range_start - start))
+    return file_ranges
+
+
+def _put(url, data):
+    response = requests.put(url, data=data)
+    return response
+
+
 def test():
     email = 'email@example.com'
     password = 'password'
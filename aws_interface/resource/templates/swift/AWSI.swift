@@ -20,6 +20,16 @@ private class AWSINetworkRequest {
         session.dataTask(with: request, completionHandler: completionHandler).resume()
     }
 
+    func upload(url: URL, fileURL: URL, completionHandler: @escaping (Data?, URLResponse?, Error?) -> Void) {
+        var request: URLRequest = URLRequest(url: url)
+        request.httpMethod = "PUT"
+        session.uploadTask(with: request, fromFile: fileURL, completionHandler: completionHandler).resume()
+    }
+
+    func download(url: URL, completionHandler: @escaping (URL?, URLResponse?, Error?) -> Void) {
+        session.downloadTask(with: url, completionHandler: completionHandler).resume()
+    }
+
 }
 
 class AWSI {
@@ -27,6 +37,14 @@ class AWSI {
     private let baseUrl = "{{REST_API_URL}}"
     private var session_id: String?
 
+    // Log events of API calls are sent in batches with cloud.log.create_logs,
+    // once logFlushSize events are waiting or logFlushInterval seconds after the first one
+    private let logFlushSize = 50
+    private let logFlushInterval: TimeInterval = 5
+    private let logQueue = DispatchQueue(label: "awsi.log")
+    private var pendingLogs: [(session_id: String, log: [String: Any])] = []
+    private var logFlushScheduled = false
+
     private func dataToJson(data: Data?)->[String: Any]?{
         guard let data = data else {
             return nil
@@ -74,29 +92,102 @@ class AWSI {
     }
 
     private func auth(function_name: String, data: [String: Any], callback: @escaping (_ response: [String: Any]?)->Void){
+        bufferLog(event_source: "auth", event_name: function_name)
         callAPI(service_type: "auth", function_name: function_name, data: data, callback: callback)
-        self.log_create_log(event_source: "auth", event_name: function_name, event_param: nil) { (_) in }
     }
 
     private func database(function_name: String, data: [String: Any], callback: @escaping (_ response: [String: Any]?)->Void){
+        bufferLog(event_source: "database", event_name: function_name)
         callAPI(service_type: "database", function_name: function_name, data: data, callback: callback)
-        self.log_create_log(event_source: "auth", event_name: function_name, event_param: nil) { (_) in }
     }
 
     private func storage(function_name: String, data: [String: Any], callback: @escaping (_ response: [String: Any]?)->Void){
+        bufferLog(event_source: "storage", event_name: function_name)
         callAPI(service_type: "storage", function_name: function_name, data: data, callback: callback)
-        self.log_create_log(event_source: "auth", event_name: function_name, event_param: nil) { (_) in }
     }
 
     private func logic(function_name: String, data: [String: Any], callback: @escaping (_ response: [String: Any]?)->Void){
+        bufferLog(event_source: "logic", event_name: function_name)
         callAPI(service_type: "logic", function_name: function_name, data: data, callback: callback)
-        self.log_create_log(event_source: "auth", event_name: function_name, event_param: nil) { (_) in }
     }
 
     private func log(function_name: String, data: [String: Any], callback: @escaping (_ response: [String: Any]?)->Void){
         callAPI(service_type: "log", function_name: function_name, data: data, callback: callback)
     }
 
+    private func bufferLog(event_source: String, event_name: String){
+        guard let session_id = self.session_id else {
+            return
+        }
+        logQueue.async {
+            self.pendingLogs.append((session_id: session_id, log: [
+                "event_source": event_source,
+                "event_name": event_name,
+            ]))
+            if self.pendingLogs.count >= self.logFlushSize {
+                self.flushLogs()
+            }else if !self.logFlushScheduled {
+                self.logFlushScheduled = true
+                self.logQueue.asyncAfter(deadline: .now() + self.logFlushInterval) {
+                    self.flushLogs()
+                }
+            }
+        }
+    }
+
+    // Runs on logQueue
+    private func flushLogs(){
+        logFlushScheduled = false
+        var sessionIds: [String] = []
+        var logsBySession: [String: [[String: Any]]] = [:]
+        for pending in pendingLogs {
+            if logsBySession[pending.session_id] == nil {
+                sessionIds.append(pending.session_id)
+            }
+            logsBySession[pending.session_id, default: []].append(pending.log)
+        }
+        pendingLogs = []
+        for session_id in sessionIds {
+            let data: [String: Any] = [
+                "module_name": "cloud.log.create_logs",
+                "session_id": session_id,
+                "logs": logsBySession[session_id] ?? [],
+            ]
+            post(params: data) { (_, _) in }
+        }
+    }
+
+    // Sends the buffered log events now, e.g. when the app goes to the background
+    func log_flush(){
+        logQueue.async {
+            self.flushLogs()
+        }
+    }
+
+    // Runs several calls in a single request, callback receives the response bodies in the order of operations
+    func batch(operations: [(service_type: String, function_name: String, data: [String: Any])], sequential: Bool = false, callback: @escaping (_ responses: [[String: Any]])->Void){
+        var data: [String: Any] = [
+            "module_name": "batch",
+            "sequential": sequential,
+        ]
+        data["operations"] = operations.map { operation -> [String: Any] in
+            return [
+                "module_name": "cloud.\(operation.service_type).\(operation.function_name)",
+                "params": operation.data,
+            ]
+        }
+        if let session_id = self.session_id{
+            data["session_id"] = session_id
+        }
+        post(params: data) { (response, error) in
+            var responses: [[String: Any]] = []
+            if let json = response, let body = json["body"] as? [String: Any], let _responses = body["responses"] as? [[String: Any]]{
+                responses = _responses.map { ($0["body"] as? [String: Any]) ?? [:] }
+            }
+            callback(responses)
+        }
+    }
+
     func auth_login(email: String, password: String, callback: @escaping (_ response: [String: Any]?)->Void){
         let data = [
             "email": email,
@@ -208,7 +299,7 @@ class AWSI {
         ["and|or", "field", "condition (eq|gt|..)", "value"], ...
     ]
     */
-    func database_query_items(partition: String, query: [[String]], start_key: [String: Any]?, limit: Int=100, callback: @escaping (_ response: [String: Any]?)->Void){
+    func database_query_items(partition: String, query: [[String]], start_key: String?, limit: Int=100, callback: @escaping (_ response: [String: Any]?)->Void){
         var data: [String: Any] = [
             "partition": partition,
             "query": query,
@@ -293,6 +384,43 @@ class AWSI {
         }
     }
 
+    // Upload the file straight to storage through a presigned URL, the file never goes through the API
+    func storage_upload_file_direct(file_url: URL, read_groups: [String], write_groups: [String], callback: @escaping (_ response: [String: Any]?)->Void){
+        let data: [String: Any] = [
+            "file_name": file_url.lastPathComponent,
+            "read_groups": read_groups,
+            "write_groups": write_groups,
+        ]
+        storage(function_name: "get_upload_url", data: data) { (response) in
+            guard let response = response, let file_id = response["file_id"] as? String,
+                let upload_url = response["upload_url"] as? String, let url = URL(string: upload_url) else {
+                callback(nil)
+                return
+            }
+            AWSINetworkRequest().upload(url: url, fileURL: file_url) { (_, urlResponse, error) in
+                guard error == nil, let httpResponse = urlResponse as? HTTPURLResponse, httpResponse.statusCode == 200 else {
+                    callback(nil)
+                    return
+                }
+                self.storage(function_name: "complete_upload", data: ["file_id": file_id], callback: callback)
+            }
+        }
+    }
+
+    // Download the file straight from storage to a temporary file through a presigned URL
+    func storage_download_file_direct(file_id: String, callback: @escaping (URL?)->Void){
+        storage(function_name: "get_download_url", data: ["file_id": file_id]) { (response) in
+            guard let response = response, let download_url = response["download_url"] as? String,
+                let url = URL(string: download_url) else {
+                callback(nil)
+                return
+            }
+            AWSINetworkRequest().download(url: url) { (location, _, error) in
+                callback(error == nil ? location : nil)
+            }
+        }
+    }
+
     func log_create_log(event_source: String, event_name: String, event_param: [String: Any]?, callback: @escaping (_ response: [String: Any]?)->Void){
         var data: [String: Any] = [
             "event_source": event_source,
@@ -0,0 +1,222 @@
+"""
+Per request tracing of backend calls.
+While a Trace is active in a thread, every Resource backend method and every AWS API call
+made from that thread is recorded as a span. bind(function) carries the active trace into worker threads.
+"""
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import cloud.shortuuid as shortuuid
+
+BACKEND_METHOD_PREFIXES = ('db_', 'file_', 'sl_')
+
+_thread_local = threading.local()
+
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or str(shortuuid.uuid())
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span):
+        span['start_ms'] = round((span.pop('started_at') - self.started_at) * 1000, 3)
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """:return: totals of the trace and of every (kind, operation)"""
+        operations = OrderedDict()
+        for span in self.spans:
+            key = '{}:{}'.format(span['kind'], span['operation'])
+            operation = operations.setdefault(key, {
+                'count': 0, 'latency_ms': 0, 'consumed_capacity': 0, 'bytes': 0,
+            })
+            operation['count'] += 1
+            operation['latency_ms'] += span['latency_ms']
+            operation['consumed_capacity'] += span.get('consumed_capacity', None) or 0
+            operation['bytes'] += span.get('bytes', None) or 0
+        aws_spans = [span for span in self.spans if span['kind'] == 'aws']
+        return {
+            'trace_id': self.trace_id,
+            'latency_ms': round((time.time() - self.started_at) * 1000, 3),
+            'resource_calls': len(self.spans) - len(aws_spans),
+            'aws_calls': len(aws_spans),
+            'consumed_capacity': sum(span.get('consumed_capacity', None) or 0 for span in aws_spans),
+            'operations': {key: dict(operation, latency_ms=round(operation['latency_ms'], 3))
+                           for key, operation in operations.items()},
+        }
+
+    def export(self, path):
+        """Append the trace as a single JSON line to path"""
+        line = dict(self.summary())
+        line['time'] = self.started_at
+        line['spans'] = self.spans
+        with self._lock:
+            with open(path, 'a') as file:
+                file.write(json.dumps(line, default=str) + '\n')
+
+
+def get_trace():
+    return getattr(_thread_local, 'trace', None)
+
+
+def start_trace(trace_id=None):
+    trace = Trace(trace_id)
+    _thread_local.trace = trace
+    _thread_local.depth = 0
+    return trace
+
+
+def stop_trace():
+    trace = get_trace()
+    _thread_local.trace = None
+    return trace
+
+
+def bind(function):
+    """Run function with the trace active in the calling thread, for functions handed to other threads"""
+    trace = get_trace()
+    if trace is None:
+        return function
+
+    @functools.wraps(function)
+    def traced(*args, **kwargs):
+        previous_trace = get_trace()
+        previous_depth = getattr(_thread_local, 'depth', 0)
+        _thread_local.trace = trace
+        _thread_local.depth = 0
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _thread_local.trace = previous_trace
+            _thread_local.depth = previous_depth
+    return traced
+
+
+def _record(kind, operation, started_at, error=None, **fields):
+    trace = get_trace()
+    if trace is None:
+        return
+    span = {
+        'kind': kind,
+        'operation': operation,
+        'started_at': started_at,
+        'latency_ms': round((time.time() - started_at) * 1000, 3),
+        'depth': getattr(_thread_local, 'depth', 0),
+        'thread': threading.current_thread().name,
+    }
+    if error:
+        span['error'] = error
+    span.update({key: value for key, value in fields.items() if value is not None})
+    trace.add_span(span)
+
+
+def _binary_size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return None
+
+
+def instrument_resource(resource):
+    """
+    Record a span for each backend method of resource called while a trace is active.
+    Methods implemented by Resource itself, like db_query, are spans too and nest the backend calls they make.
+    """
+    if getattr(resource, '_traced', False):
+        return resource
+    for name in dir(type(resource)):
+        if name.startswith(BACKEND_METHOD_PREFIXES) and callable(getattr(type(resource), name)):
+            setattr(resource, name, _trace_method(name, getattr(resource, name)))
+    resource._traced = True
+    return resource
+
+
+def _trace_method(name, method):
+    @functools.wraps(method)
+    def traced(*args, **kwargs):
+        if get_trace() is None:
+            return method(*args, **kwargs)
+        started_at = time.time()
+        _thread_local.depth = getattr(_thread_local, 'depth', 0) + 1
+        try:
+            result = method(*args, **kwargs)
+        except BaseException as ex:
+            _thread_local.depth -= 1
+            _record('resource', name, started_at, error=type(ex).__name__)
+            raise
+        _thread_local.depth -= 1
+        size = _binary_size(result)
+        for arg in args:
+            size = size or _binary_size(arg)
+        _record('resource', name, started_at, bytes=size)
+        return result
+    return traced
+
+
+def instrument_client(client):
+    """Record a span for each API call client makes while a trace is active, through botocore events"""
+    if getattr(client, '_traced', False):
+        return client
+    events = client.meta.events
+    events.register('provide-client-params.*.*', _before_api_call)
+    events.register('before-call.*.*', _before_send)
+    events.register('after-call.*.*', _after_api_call)
+    client._traced = True
+    return client
+
+
+def _get_target(params):
+    for key in ('TableName', 'Bucket', 'FunctionName', 'restApiId'):
+        if key in params:
+            return params[key]
+    if 'RequestItems' in params:
+        return ','.join(params['RequestItems'].keys())
+    if 'TransactItems' in params:
+        targets = []
+        for transact_item in params['TransactItems']:
+            for request in transact_item.values():
+                if request.get('TableName', None) not in targets:
+                    targets.append(request.get('TableName', None))
+        return ','.join(str(target) for target in targets)
+    return None
+
+
+def _before_api_call(params, model, context=None, **kwargs):
+    if get_trace() is None or context is None:
+        return
+    input_members = model.input_shape.members if model.input_shape else {}
+    if 'ReturnConsumedCapacity' in input_members and 'ReturnConsumedCapacity' not in params:
+        params['ReturnConsumedCapacity'] = 'TOTAL'
+    context['trace'] = {
+        'started_at': time.time(),
+        'target': _get_target(params),
+    }
+
+
+def _before_send(params, context=None, **kwargs):
+    trace_context = (context or {}).get('trace', None)
+    if trace_context is not None:
+        body = params.get('body', None)
+        trace_context['request_bytes'] = len(body) if isinstance(body, (bytes, str)) else None
+
+
+def _after_api_call(http_response, parsed, model, context=None, **kwargs):
+    trace_context = (context or {}).get('trace', None)
+    if trace_context is None:
+        return
+    consumed_capacity = parsed.get('ConsumedCapacity', None)
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    if consumed_capacity is not None:
+        consumed_capacity = sum(float(capacity.get('CapacityUnits', 0)) for capacity in consumed_capacity)
+    response_bytes = http_response.headers.get('content-length', None)
+    _record('aws', '{}.{}'.format(model.service_model.service_name, model.name), trace_context['started_at'],
+            error=parsed.get('Error', {}).get('Code', None), target=trace_context['target'],
+            status=http_response.status_code, consumed_capacity=consumed_capacity,
+            request_bytes=trace_context.get('request_bytes', None),
+            bytes=int(response_bytes) if response_bytes is not None else None)
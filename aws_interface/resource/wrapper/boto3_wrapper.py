@@ -1,25 +1,124 @@
+import hashlib
 import json
+import os
+import random
 import time
 import tempfile
+import threading
 import botocore
 
-from boto3.dynamodb.conditions import Key
-from boto3.dynamodb.types import TypeDeserializer
-from sys import maxsize
+from decimal import Decimal, InvalidOperation
+
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from cloud.cache import TTLCache
+from resource.query import encode_range_value, range_index_bounds
+from resource.trace import bind, instrument_client
 import cloud.shortuuid as shortuuid
 
 
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_INTERFACE_MAX_POOL_CONNECTIONS', 50))
+
+# Number of counter shards by partition, e.g. AWS_INTERFACE_COUNT_SHARDS='session:16,user:8'.
+# Logs are spread over hourly partitions so their counters are not sharded.
+COUNT_SHARDS = {
+    'session': 8,
+    'user': 8,
+}
+for _partition_shards in filter(None, os.environ.get('AWS_INTERFACE_COUNT_SHARDS', '').split(',')):
+    _partition, _shards = _partition_shards.split(':')
+    COUNT_SHARDS[_partition.strip()] = int(_shards)
+
+# BatchGetItem chunks of large multi-gets are read concurrently on this many threads, shared process-wide.
+BATCH_GET_MAX_WORKERS = int(os.environ.get('AWS_INTERFACE_BATCH_GET_MAX_WORKERS', 8))
+_batch_get_executor = ThreadPoolExecutor(max_workers=BATCH_GET_MAX_WORKERS)
+
+# Range indexed fields by (table_name, partition), stale for at most ttl seconds after create_range_index.
+_range_fields_cache = TTLCache(max_size=1024, ttl=int(os.environ.get('AWS_INTERFACE_RANGE_FIELDS_CACHE_TTL', 10)))
+
+# Clients are thread-safe and shared process-wide, resources are not so they are kept per thread.
+_session_pool = {}
+_client_pool = {}
+_pool_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+def set_max_pool_connections(max_pool_connections):
+    """
+    Change the size of the HTTP connection pool of clients created from now on.
+    Already pooled clients are dropped so they are rebuilt with the new config.
+    :param max_pool_connections:
+    :return:
+    """
+    global MAX_POOL_CONNECTIONS
+    with _pool_lock:
+        MAX_POOL_CONNECTIONS = max_pool_connections
+        _client_pool.clear()
+    _thread_local.resources = {}
+
+
+def set_count_shards(partition, shard_count):
+    COUNT_SHARDS[partition] = shard_count
+
+
+def _get_pool_key(boto3_session, service_name, region_name=None):
+    credentials = boto3_session.get_credentials()
+    if credentials:
+        credentials = credentials.get_frozen_credentials()
+        credentials = (credentials.access_key, credentials.secret_key, credentials.token)
+    region_name = region_name or boto3_session.region_name
+    return credentials, region_name, service_name
+
+
+def get_boto3_client(boto3_session, service_name, region_name=None):
+    key = _get_pool_key(boto3_session, service_name, region_name)
+    client = _client_pool.get(key, None)
+    if client:
+        return client
+    with _pool_lock:
+        client = _client_pool.get(key, None)
+        if not client:
+            config = Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+            client = boto3_session.client(service_name, region_name=region_name, config=config)
+            _client_pool[key] = instrument_client(client)
+    return client
+
+
+def get_boto3_resource(boto3_session, service_name, region_name=None):
+    key = _get_pool_key(boto3_session, service_name, region_name)
+    resources = getattr(_thread_local, 'resources', None)
+    if resources is None:
+        resources = _thread_local.resources = {}
+    resource = resources.get(key, None)
+    if not resource:
+        config = Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+        resource = boto3_session.resource(service_name, region_name=region_name, config=config)
+        instrument_client(resource.meta.client)
+        resources[key] = resource
+    return resource
+
+
 def get_boto3_session(credentials):
     import boto3
     bundle = credentials['aws']
     access_key = bundle['access_key']
     secret_key = bundle['secret_key']
     region_name = bundle.get('region', 'ap-northeast-2')
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region_name,
-    )
+    key = (access_key, secret_key, region_name)
+    session = _session_pool.get(key, None)
+    if session:
+        return session
+    with _pool_lock:
+        session = _session_pool.get(key, None)
+        if not session:
+            session = boto3.Session(
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region_name,
+            )
+            _session_pool[key] = session
     return session
 
 
@@ -28,8 +127,8 @@ class APIGateway:
 
     def __init__(self, boto3_session):
         self.region = boto3_session.region_name
-        self.client = boto3_session.client('apigateway')
-        self.lambda_client = boto3_session.client('lambda')
+        self.client = get_boto3_client(boto3_session, 'apigateway')
+        self.lambda_client = get_boto3_client(boto3_session, 'lambda')
         self.iam_client = IAM(boto3_session)
 
     def get_rest_api_id(self, rest_api_name):
@@ -287,12 +386,31 @@ class APIGateway:
 
 
 class DynamoDB:
+    transact_write_max_items = 100
+    # Transactions overwriting an item are retried this many times when another writer changed it meanwhile
+    transact_write_max_attempts = 3
+    batch_get_max_keys = 100
+    batch_get_max_retries = 8
+    batch_get_backoff_base = 0.05  # seconds
+    # Items written with deterministic inverted query ids carry this version,
+    # older items have random or ambiguous ids and must be re-indexed through a lookup query.
+    index_version = 3
+    ttl_attribute = 'expiresAt'
+
     def __init__(self, boto3_session):
-        self.client = boto3_session.client('dynamodb')
-        self.resource = boto3_session.resource('dynamodb')
+        self.client = get_boto3_client(boto3_session, 'dynamodb')
+        self.resource = get_boto3_resource(boto3_session, 'dynamodb')
 
     def init_table(self, table_name):
         self.create_table(table_name)
+        self.enable_ttl(table_name)
+        if 'rangeQuery-rangeValue' not in self.get_index_names(table_name):  # Tables created before range indexes
+            self.update_table(table_name, index={
+                'hash_key': 'rangeQuery',
+                'hash_key_type': 'S',
+                'sort_key': 'rangeValue',
+                'sort_key_type': 'S'
+            })
         # self.update_table(table_name, index={
         #     'hash_key': 'partition',
         #     'hash_key_type': 'S',
@@ -306,6 +424,25 @@ class DynamoDB:
         #     'sort_key_type': 'N'
         # })
 
+    def get_index_names(self, table_name):
+        table = self.client.describe_table(TableName=table_name)['Table']
+        return [index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])]
+
+    def enable_ttl(self, table_name):
+        """Items with a ttl_attribute (epoch seconds) are deleted by DynamoDB, usually within 48 hours after"""
+        try:
+            response = self.client.update_time_to_live(
+                TableName=table_name,
+                TimeToLiveSpecification={
+                    'Enabled': True,
+                    'AttributeName': self.ttl_attribute,
+                },
+            )
+            return response
+        except Exception as ex:  # Already enabled, or the table is still being created
+            print(ex)
+            return None
+
     def create_table(self, table_name):
         try:
             response = self.client.create_table(
@@ -322,6 +459,12 @@ class DynamoDB:
                     }, {
                         'AttributeName': 'creationDate',
                         'AttributeType': 'N'
+                    }, {
+                        'AttributeName': 'rangeQuery',
+                        'AttributeType': 'S'
+                    }, {
+                        'AttributeName': 'rangeValue',
+                        'AttributeType': 'S'
                     }
                 ],
                 TableName=table_name,
@@ -365,6 +508,20 @@ class DynamoDB:
                         'Projection': {
                             'ProjectionType': 'ALL'
                         }
+                    }, {
+                        'IndexName': 'rangeQuery-rangeValue',
+                        'KeySchema': [
+                            {
+                                'AttributeName': 'rangeQuery',
+                                'KeyType': 'HASH'
+                            }, {
+                                'AttributeName': 'rangeValue',
+                                'KeyType': 'RANGE'
+                            },
+                        ],
+                        'Projection': {
+                            'ProjectionType': 'ALL'
+                        }
                     },
                 ]
             )
@@ -455,7 +612,58 @@ class DynamoDB:
         return self.delete_item(table_name, partition)
 
     def get_partitions(self, table_name):
-        return self.get_items_in_partition(table_name, 'partition-list', limit=maxsize)
+        items = list(self.iter_items_in_partition(table_name, 'partition-list'))
+        return {'Items': items}
+
+    def get_range_fields(self, table_name, partition):
+        range_fields = _range_fields_cache.get((table_name, partition), None)
+        if range_fields is None:
+            item = self.get_partition(table_name, partition) or {}
+            range_fields = []
+            if item.get('partition', None) == 'partition-list':
+                range_fields = item.get('range_fields', [])
+            _range_fields_cache.set((table_name, partition), range_fields)
+        return range_fields
+
+    def create_range_index(self, table_name, partition, field):
+        """
+        Register field of partition as range indexed and index the items already in the partition.
+        Containers which cached the range fields of the partition may still write a few items
+        without range rows until their cache expires, re-saving those items indexes them.
+        """
+        try:
+            self.client.update_item(
+                TableName=table_name,
+                Key={
+                    'id': {
+                        'S': partition,
+                    }
+                },
+                ConditionExpression='attribute_exists(id) AND NOT contains(#R, :f)',
+                UpdateExpression='SET #R = list_append(if_not_exists(#R, :e), :l)',
+                ExpressionAttributeNames={
+                    '#R': 'range_fields',
+                },
+                ExpressionAttributeValues={
+                    ':f': {'S': field},
+                    ':l': {'L': [{'S': field}]},
+                    ':e': {'L': []},
+                },
+            )
+        except botocore.exceptions.ClientError as ex:
+            if ex.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        _range_fields_cache.pop((table_name, partition))
+
+        range_queries = []
+        for item in self.iter_items_in_partition(table_name, partition, page_size=100,
+                                                   projection=['id', 'creationDate', field]):
+            range_queries.extend(self._get_range_queries(partition, item, [field]))
+            if len(range_queries) >= 100:
+                self._batch_put_items(table_name, range_queries)
+                range_queries = []
+        self._batch_put_items(table_name, range_queries)
+        return True
 
     def delete_item(self, table_name, item_id):
         item = self.get_item(table_name, item_id)
@@ -471,91 +679,344 @@ class DynamoDB:
                 }
             }
         )
-        self._add_item_count(table_name, '{}-count'.format(partition), value_to_add=-1)
+        self._add_item_count(table_name, self._get_count_id(partition), value_to_add=-1)
         self._delete_inverted_query(table_name, item_id)
         return response
 
-    def get_item(self, table_name, item_id):
+    def get_item(self, table_name, item_id, consistent_read=False):
         table = self.resource.Table(table_name)
         item = table.get_item(Key={
             'id': item_id
-        })
+        }, ConsistentRead=consistent_read)
         return item
 
     def put_item(self, table_name, partition, item, item_id=None, creation_date=None, indexing=True):
+        """
+        Put the item, increase the partition count and write the inverted queries of the item
+        in a single transaction, so the item and its index never disagree.
+        The transaction limits an item to transact_write_max_items - 2 index rows, one per indexed field
+        and one per range indexed field, bigger items are rejected with ValueError before anything is written.
+        An item put with item_id is first written on the condition that the id is new. When it exists,
+        the stale index rows are deleted in the transaction overwriting it, on the condition that the
+        existing item is still the one read, and the count is left as it is.
+        """
         if not item_id:
             item_id = str(shortuuid.uuid())
         if not creation_date:
             creation_date = int(time.time())
-        table = self.resource.Table(table_name)
         item['id'] = item_id
         item['creationDate'] = creation_date
         item['partition'] = partition
-        response = table.put_item(
-            Item=item,
-        )
-        self._add_item_count(table_name, '{}-count'.format(partition))
         if indexing:
-            self._delete_inverted_query(table_name, item_id)
-            self._put_inverted_query(table_name, partition, item)
-        return response
+            item['_index_version'] = self.index_version
 
-    def get_items(self, table_name, item_ids):
-        keys = list([{'id': {'S': item_id}} for item_id in item_ids])
-        response = self.client.batch_get_item(
-            RequestItems={
-                table_name: {
-                    'Keys': keys,
-                    'ConsistentRead': True
-                }
-            }
-        )
-        type_deserializer = TypeDeserializer()
-        items = response['Responses'][table_name]
+        inverted_queries = []
+        if indexing:
+            range_fields = self.get_range_fields(table_name, partition)
+            inverted_queries = self._get_inverted_queries(partition, item, range_fields)
+        max_index_rows = self.transact_write_max_items - 2
+        if len(inverted_queries) > max_index_rows:
+            raise ValueError('An item can have at most {} indexed fields, item_id: {} has {}'.format(
+                max_index_rows, item_id, len(inverted_queries)))
+
+        old_item = None  # Generated ids are new, other ids are assumed new until the put says otherwise
+        for attempt in range(self.transact_write_max_attempts):
+            transact_items = self._get_put_transact_items(table_name, partition, item, inverted_queries,
+                                                          old_item, indexing)
+            try:
+                return self.client.transact_write_items(
+                    TransactItems=transact_items,
+                )
+            except botocore.exceptions.ClientError as ex:
+                reasons = ex.response.get('CancellationReasons', [])
+                if not reasons or reasons[0].get('Code', None) != 'ConditionalCheckFailed':
+                    raise
+                if attempt + 1 == self.transact_write_max_attempts:
+                    raise
+            old_item = self.get_item(table_name, item_id, consistent_read=True).get('Item', None)
+
+    def _get_put_transact_items(self, table_name, partition, item, inverted_queries, old_item, indexing,
+                                counting=True, condition=None):
+        """
+        Transaction putting item over old_item, None when the item is expected to be new.
+        The put is conditioned on the item read as old_item, so the index rows deleted for it are its own.
+        :param counting: update the partition counts when the item is new or moves to another partition
+        :param condition: (field, value) the existing item must also satisfy
+        """
+        put_request = self._get_put_request(table_name, item)
+        transact_items = [{'Put': put_request}]
+        if old_item is None:
+            put_request['ConditionExpression'] = 'attribute_not_exists(id)'
+            item['_revision'] = 1
+            put_request['Item']['_revision'] = {'N': '1'}
+        else:
+            revision = old_item.get('_revision', None)
+            item['_revision'] = int(revision or 0) + 1
+            put_request['Item']['_revision'] = {'N': str(item['_revision'])}
+            put_request.update(self._get_revision_condition(old_item))
+        if condition:
+            field, value = condition
+            put_request['ConditionExpression'] = '({}) AND #C = :c'.format(put_request['ConditionExpression'])
+            put_request.setdefault('ExpressionAttributeNames', {})['#C'] = field
+            put_request.setdefault('ExpressionAttributeValues', {})[':c'] = TypeSerializer().serialize(value)
+
+        old_partition = (old_item or {}).get('partition', None)
+        if counting and old_partition != partition:
+            transact_items.append({'Update': self._get_item_count_update(
+                table_name, self._get_count_id(partition), expires_at=item.get(self.ttl_attribute, None))})
+            if old_partition:
+                transact_items.append({'Update': self._get_item_count_update(
+                    table_name, self._get_count_id(old_partition), value_to_add=-1)})
+
+        delete_ids, put_rows = [], inverted_queries
+        if old_item is not None and (indexing or old_item.get('_index_version', None)):
+            old_queries = self._get_old_inverted_queries(table_name, old_item)
+            delete_ids, put_rows = self._get_inverted_query_diff(old_queries, inverted_queries)
+        for query_id in delete_ids:
+            transact_items.append({'Delete': {'TableName': table_name, 'Key': {'id': {'S': query_id}}}})
+        for inverted_query in put_rows:
+            transact_items.append({'Put': self._get_put_request(table_name, inverted_query)})
+        if len(transact_items) > self.transact_write_max_items:
+            raise ValueError('Overwriting item_id: {} takes {} writes, more than a transaction holds'.format(
+                item['id'], len(transact_items)))
+        return transact_items
+
+    def _get_revision_condition(self, old_item):
+        """Condition met only by the item read as old_item, every indexed write increases its _revision"""
+        revision = old_item.get('_revision', None)
+        if revision is None:  # Items written before revisions
+            condition = 'attribute_exists(id) AND attribute_not_exists(#R)'
+            values = {}
+        else:
+            condition = '#R = :r'
+            values = {':r': {'N': str(int(revision))}}
+        index_version = old_item.get('_index_version', None)
+        if index_version is None:
+            condition += ' AND attribute_not_exists(#V)'
+        else:
+            condition += ' AND #V = :v'
+            values[':v'] = {'N': str(int(index_version))}
+        options = {
+            'ConditionExpression': condition,
+            'ExpressionAttributeNames': {'#R': '_revision', '#V': '_index_version'},
+        }
+        if values:
+            options['ExpressionAttributeValues'] = values
+        return options
+
+    def _get_old_inverted_queries(self, table_name, old_item):
+        """
+        Index rows of old_item. Their ids are derived from the item since index_version,
+        older items have random ids which are looked up.
+        """
+        if old_item.get('_index_version', None) == self.index_version:
+            partition = old_item.get('partition', None)
+            return self._get_inverted_queries(partition, old_item, self.get_range_fields(table_name, partition))
+        return list(self.iter_items_in_partition(table_name, 'index-{}'.format(old_item['id']), projection=['id']))
+
+    def put_items(self, table_name, partition, items):
+        """
+        Put new items with generated ids, their inverted queries and the partition count with BatchWriteItem.
+        Unlike put_item the writes are not a transaction, the count is increased once for all the items.
+        """
+        if not items:
+            return None
+        creation_date = int(time.time())
+        range_fields = self.get_range_fields(table_name, partition)
+        rows = []
         for item in items:
-            for key, value in item.items():
-                value = type_deserializer.deserialize(value)
-                item[key] = value
+            item['id'] = str(shortuuid.uuid())
+            item['creationDate'] = item.get('creationDate', None) or creation_date
+            item['partition'] = partition
+            item['_index_version'] = self.index_version
+            rows.append(item)
+            rows.extend(self._get_inverted_queries(partition, item, range_fields))
+        self._batch_put_items(table_name, rows)
+        expirations = [item.get(self.ttl_attribute, None) for item in items]
+        expires_at = max(expirations) if None not in expirations else None
+        response = self.client.update_item(
+            **self._get_item_count_update(table_name, self._get_count_id(partition), len(items), expires_at)
+        )
+        return response
 
-        return {'Items': items}
+    def _get_put_request(self, table_name, item):
+        type_serializer = TypeSerializer()
+        return {
+            'TableName': table_name,
+            'Item': {key: type_serializer.serialize(value) for key, value in item.items()},
+        }
 
-    def get_items_in_partition(self, table_name, partition, start_key=None, limit=100, reverse=False):
+    def _batch_put_items(self, table_name, items):
+        if not items:
+            return
+        table = self.resource.Table(table_name)
+        with table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(
+                    Item=item,
+                )
+
+    def get_items(self, table_name, item_ids):
+        """
+        Read any number of items with BatchGetItem, 100 keys per request.
+        Requests run concurrently and their unprocessed keys are retried with exponential backoff.
+        :return: {'Items': items} in the order of item_ids, ids without item are left out
+        """
+        item_ids = list(dict.fromkeys(item_ids))  # Duplicated keys are rejected by BatchGetItem
+        chunks = [item_ids[idx:idx + self.batch_get_max_keys]
+                  for idx in range(0, len(item_ids), self.batch_get_max_keys)]
+        if len(chunks) > 1:
+            results = _batch_get_executor.map(bind(lambda chunk: self._batch_get_items(table_name, chunk)), chunks)
+        else:
+            results = [self._batch_get_items(table_name, chunk) for chunk in chunks]
+        items = {}
+        for result in results:
+            for item in result:
+                items[item['id']] = item
+        return {'Items': [items[item_id] for item_id in item_ids if item_id in items]}
+
+    def _batch_get_items(self, table_name, item_ids):
+        type_deserializer = TypeDeserializer()
+        request_items = {
+            table_name: {
+                'Keys': [{'id': {'S': item_id}} for item_id in item_ids],
+                'ConsistentRead': True
+            }
+        }
+        items = []
+        retries = 0
+        while request_items:
+            response = self.client.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(table_name, []):
+                items.append({key: type_deserializer.deserialize(value) for key, value in item.items()})
+            request_items = response.get('UnprocessedKeys', None)
+            if request_items:
+                if retries >= self.batch_get_max_retries:
+                    raise BaseException('Unprocessed keys remain after {} retries'.format(retries))
+                time.sleep(random.uniform(0, self.batch_get_backoff_base * (2 ** retries)))
+                retries += 1
+        return items
+
+    def get_items_in_partition(self, table_name, partition, start_key=None, limit=100, reverse=False,
+                               start_creation_date=None, filter_expression=None, projection=None):
+        """
+        Read a single page of the partition ordered by creation date.
+        Without limit the page ends where DynamoDB cuts it (1MB),
+        LastEvaluatedKey of the response is set whenever another page may follow.
+        :param projection: list of attribute names to read, None reads whole items
+        """
         scan_index_forward = not reverse
         index_name = 'partition-creationDate'
         table = self.resource.Table(table_name)
-        self.get_items_eq_hash_key(table_name, index_name, 'partition', partition, start_key, limit)
-        if not limit:
-            limit = maxsize
+        key_expression = Key('partition').eq(partition)
+        if start_creation_date is not None:
+            key_expression &= Key('creationDate').gte(start_creation_date)
+        query_options = self._get_projection_options(projection)
+        if limit:
+            query_options['Limit'] = limit
         if start_key:
-            response = table.query(
-                IndexName=index_name,
-                Limit=limit,
-                ConsistentRead=False,
-                ExclusiveStartKey=start_key,
-                KeyConditionExpression=Key('partition').eq(partition),
-                ScanIndexForward=scan_index_forward,
-            )
-        else:
-            response = table.query(
-                IndexName=index_name,
-                Limit=limit,
-                ConsistentRead=False,
-                KeyConditionExpression=Key('partition').eq(partition),
-                ScanIndexForward=scan_index_forward,
-            )
+            query_options['ExclusiveStartKey'] = start_key
+        if filter_expression is not None:
+            query_options['FilterExpression'] = filter_expression
+        response = table.query(
+            IndexName=index_name,
+            ConsistentRead=False,
+            KeyConditionExpression=key_expression,
+            ScanIndexForward=scan_index_forward,
+            **query_options
+        )
         return response
 
-    def get_inverted_queries(self, table_name, partition, field, operand, operation, start_key=None, limit=100, reverse=False):
+    def iter_items_in_partition(self, table_name, partition, reverse=False, start_creation_date=None,
+                                filter_expression=None, projection=None, page_size=None):
+        """
+        Generator of every item of the partition, the next page is queried
+        only once the items of the previous one are consumed.
+        """
+        start_key = None
+        while True:
+            response = self.get_items_in_partition(table_name, partition, start_key, page_size, reverse,
+                                                   start_creation_date, filter_expression, projection)
+            for item in response.get('Items', []):
+                yield item
+            start_key = response.get('LastEvaluatedKey', None)
+            if not start_key:
+                return
+
+    def _get_projection_options(self, projection):
+        if not projection:
+            return {}
+        # Placeholders for every name, attributes like 'name' are reserved words
+        attribute_names = {'#P{}'.format(idx): name for idx, name in enumerate(projection)}
+        return {
+            'ProjectionExpression': ', '.join(attribute_names.keys()),
+            'ExpressionAttributeNames': attribute_names,
+        }
+
+    def get_filter_expression(self, statements):
+        """
+        FilterExpression letting through at least the items satisfying every (field, condition, value)
+        statement, callers still check items themselves. Values are compared as strings to string
+        attributes and as numbers to number attributes, other attribute types are let through.
+        :return: condition or None when no statement can be expressed
+        """
+        operators = {
+            'gt': 'gt',
+            'ls': 'lt',
+            'ge': 'gte',
+            'le': 'lte',
+        }
+        filter_expression = None
+        for field, condition, value in statements:
+            attr = Attr(field)
+            if condition == 'in':
+                expression = attr.contains(value) | attr.attribute_type('M')
+            elif condition in operators:
+                operator = operators[condition]
+                # Type checks come first so that values are never compared to attributes of another type
+                expression = attr.attribute_type('S') & getattr(attr, operator)(str(value))
+                try:
+                    number = Decimal(str(value))
+                    expression |= attr.attribute_type('N') & getattr(attr, operator)(number)
+                except InvalidOperation:
+                    pass
+                expression |= attr.attribute_type('BOOL')
+            else:
+                continue
+            if filter_expression is None:
+                filter_expression = expression
+            else:
+                filter_expression &= expression
+        return filter_expression
+
+    def get_inverted_queries(self, table_name, partition, field, operand, operation, start_key=None, limit=100,
+                             reverse=False, start_creation_date=None):
         if operation == 'in' or operation == 'eq':
             hash_key_name = 'invertedQuery'
             sort_key_name = 'creationDate'
             hash_key = '{}-{}-{}-{}'.format(partition, field, operand, operation)
             index_name = '{}-{}'.format(hash_key_name, sort_key_name)
-            response = self.get_items_eq_hash_key(table_name, index_name, hash_key_name, hash_key, start_key, limit, reverse)
+            key_expression = Key(hash_key_name).eq(hash_key)
+            if start_creation_date is not None:
+                key_expression &= Key(sort_key_name).gte(start_creation_date)
+            response = self.get_items_with_key_expression(table_name, index_name, key_expression,
+                                                          start_key, limit, reverse)
             return response
         else:
             raise BaseException('an operation is must be <in> or <eq>')
 
+    def count_inverted_queries(self, table_name, partition, field, operand, operation, limit=1000):
+        hash_key = '{}-{}-{}-{}'.format(partition, field, operand, operation)
+        table = self.resource.Table(table_name)
+        response = table.query(
+            IndexName='invertedQuery-creationDate',
+            Limit=limit,
+            ConsistentRead=False,
+            KeyConditionExpression=Key('invertedQuery').eq(hash_key),
+            Select='COUNT',
+        )
+        return response.get('Count', 0)
+
     def get_items_eq_hash_key(self, table_name, index_name, hash_key_name, hash_key_value,
                               start_key=None, limit=100, reverse=False):
         key_expression = Key(hash_key_name).eq(hash_key_value)
@@ -585,18 +1046,58 @@ class DynamoDB:
             )
         return response
 
-    def update_item(self, table_name, item_id, item):
-        table = self.resource.Table(table_name)
-        update_date = int(time.time())
+    def update_item(self, table_name, item_id, item, condition=None):
+        """
+        Put item over the existing item and write the index rows of changed fields in a single transaction,
+        on the condition that the existing item is still the one read. Partition counts are left as they are.
+        :param condition: (field, value), the item is only put when its field is equal to value
+        :return: response, None when condition is not met
+        """
         item['id'] = item_id
-        item['_update_date'] = update_date
-        response = table.put_item(
-            TableName=table_name,
-            Item=item,
+        item['_update_date'] = int(time.time())
+        item['_index_version'] = self.index_version
+        for attempt in range(self.transact_write_max_attempts):
+            old_item = self.get_item(table_name, item_id, consistent_read=True).get('Item', None)
+            if condition and (old_item or {}).get(condition[0], None) != condition[1]:
+                return None
+            for field in ('partition', 'creationDate'):
+                if field not in item and field in (old_item or {}):
+                    item[field] = old_item[field]
+            partition = item.get('partition')
+            inverted_queries = self._get_inverted_queries(partition, item, self.get_range_fields(table_name, partition))
+            transact_items = self._get_put_transact_items(table_name, partition, item, inverted_queries,
+                                                          old_item, True, counting=False, condition=condition)
+            try:
+                return self.client.transact_write_items(
+                    TransactItems=transact_items,
+                )
+            except botocore.exceptions.ClientError as ex:
+                reasons = ex.response.get('CancellationReasons', [])
+                if not reasons or reasons[0].get('Code', None) != 'ConditionalCheckFailed':
+                    raise
+                if attempt + 1 == self.transact_write_max_attempts:
+                    if condition:  # Other writers kept changing the item, the claim is theirs
+                        return None
+                    raise
+
+    def add_to_item(self, table_name, partition, item_id, field, value, item=None, creation_date=None):
+        """
+        Add value to field of the item with a single UpdateItem, creating the item when it does not exist.
+        """
+        table = self.resource.Table(table_name)
+        names = {'#v': field, '#p': 'partition', '#c': 'creationDate'}
+        values = {':v': value, ':p': partition, ':c': creation_date or int(time.time())}
+        assignments = ['#p = :p', '#c = if_not_exists(#c, :c)']
+        for idx, (key, item_value) in enumerate((item or {}).items()):
+            names['#f{}'.format(idx)] = key
+            values[':f{}'.format(idx)] = item_value
+            assignments.append('#f{0} = :f{0}'.format(idx))
+        response = table.update_item(
+            Key={'id': item_id},
+            UpdateExpression='SET {} ADD #v :v'.format(', '.join(assignments)),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
         )
-        partition = item.get('partition')
-        self._delete_inverted_query(table_name, item_id)
-        self._put_inverted_query(table_name, partition, item)
         return response
 
     def _put_item_count(self, table_name, count_id, value):
@@ -605,59 +1106,200 @@ class DynamoDB:
 
     def _add_item_count(self, table_name, count_id, value_to_add=1):
         response = self.client.update_item(
-            ExpressionAttributeNames={
+            ReturnValues='ALL_NEW',
+            **self._get_item_count_update(table_name, count_id, value_to_add)
+        )
+        return response
+
+    def _get_item_count_update(self, table_name, count_id, value_to_add=1, expires_at=None):
+        """
+        :param expires_at: expiration of the counted items. Counters of partitions of expiring items,
+        like the hourly log partitions, expire with the last item written so they do not outlive the partition.
+        Items of such partitions are expected to expire in the order they are written.
+        """
+        update = {
+            'ExpressionAttributeNames': {
                 '#A': 'count',
             },
-            ExpressionAttributeValues={
+            'ExpressionAttributeValues': {
                 ':v': {
                     'N': str(value_to_add),
                 }
             },
-            Key={
+            'Key': {
                 'id': {
                     'S': count_id,
                 }
             },
-            ReturnValues='ALL_NEW',
-            TableName=table_name,
-            UpdateExpression='ADD #A :v',
-        )
-        return response
+            'TableName': table_name,
+            'UpdateExpression': 'ADD #A :v',
+        }
+        if expires_at is not None:
+            update['ExpressionAttributeNames']['#E'] = self.ttl_attribute
+            update['ExpressionAttributeValues'][':e'] = {'N': str(int(expires_at))}
+            update['UpdateExpression'] = 'ADD #A :v SET #E = :e'
+        return update
 
     def get_item_count(self, table_name, count_id):
         response = self.get_item(table_name, count_id)
         return response
 
+    def get_partition_count(self, table_name, partition):
+        items = self.get_items(table_name, self._get_count_ids(partition)).get('Items', [])
+        return sum(item.get('count', 0) for item in items)
+
+    def _get_count_ids(self, partition):
+        """
+        Counter shards of the partition. The first shard is the unsharded counter id,
+        so partitions counted before sharding keep their count.
+        Lowering the number of shards of a partition loses the count of removed shards.
+        """
+        shard_count = COUNT_SHARDS.get(partition, 1)
+        count_ids = ['{}-count'.format(partition)]
+        for shard in range(1, shard_count):
+            count_ids.append('{}-count-{}'.format(partition, shard))
+        return count_ids
+
+    def _get_count_id(self, partition):
+        return random.choice(self._get_count_ids(partition))
+
     def _eq_operands(self, value):
         value = str(value)
         return [value]
 
-    def _put_inverted_query(self, table_name, partition, item):
-        table = self.resource.Table(table_name)
+    def _get_inverted_query_diff(self, old_queries, new_queries):
+        """
+        :return: ids of old_queries to delete, new_queries to put
+        """
+        old_queries = {query['id']: query for query in old_queries}
+        new_ids = {query['id'] for query in new_queries}
+        delete_ids = [query_id for query_id in old_queries if query_id not in new_ids]
+        put_rows = [query for query in new_queries if old_queries.get(query['id'], None) != query]
+        return delete_ids, put_rows
+
+    def _get_inverted_queries(self, partition, item, range_fields=()):
         item_id = item.get('id')
         creation_date = item.get('creationDate', int(time.time()))
-        with table.batch_writer() as batch:
-            for field, value in item.items():
-                for operand in self._eq_operands(value):
-                    self._put_inverted_query_field(batch, partition, field, operand, 'eq', item_id, creation_date)
+        inverted_queries = []
+        for field, value in item.items():
+            if not self._is_indexed_field(field):
+                continue
+            for operand in self._eq_operands(value):
+                inverted_query = self._get_inverted_query_field(partition, field, operand, 'eq', item_id, creation_date)
+                inverted_queries.append(inverted_query)
+        inverted_queries.extend(self._get_range_queries(partition, item, range_fields))
+        if self.ttl_attribute in item:  # Inverted queries expire with their item
+            for inverted_query in inverted_queries:
+                inverted_query[self.ttl_attribute] = item[self.ttl_attribute]
+        return inverted_queries
+
+    def _is_indexed_field(self, field):
+        """Internal fields like _index_version and the TTL attribute are never queried, so they get no index rows"""
+        return not field.startswith('_') and field != self.ttl_attribute
+
+    def _get_range_queries(self, partition, item, range_fields):
+        item_id = item.get('id')
+        creation_date = item.get('creationDate', int(time.time()))
+        range_queries = []
+        for field in range_fields:
+            value = item.get(field, None)
+            if not value:  # Falsy values never satisfy range conditions
+                continue
+            range_value = encode_range_value(value)
+            if range_value is None:
+                continue
+            range_query = '{}-{}-range'.format(partition, field)
+            range_queries.append({
+                'id': self._get_index_row_id('range', item_id, field),
+                'partition': 'index-{}'.format(item_id),
+                'rangeQuery': range_query,
+                'invertedQuery': range_query,  # Also read in creation date order, see get_range_queries_since
+                'rangeValue': range_value,
+                'creationDate': creation_date,
+                'item_id': item_id,
+            })
+        return range_queries
+
+    def iter_range_queries(self, table_name, partition, field, condition, value, page_size=1000):
+        """
+        Range rows of field satisfying condition (gt|ge|ls|le) against value, in the order of the range index.
+        Pages are read lazily as rows are consumed, rows only hold creationDate and item_id.
+        """
+        table = self.resource.Table(table_name)
+        for low, high, excluded in range_index_bounds(condition, value):
+            key_expression = Key('rangeQuery').eq('{}-{}-range'.format(partition, field))
+            key_expression &= Key('rangeValue').between(low, high)
+            start_key = None
+            while True:
+                query_options = {'ExclusiveStartKey': start_key} if start_key else {}
+                response = table.query(
+                    IndexName='rangeQuery-rangeValue',
+                    ConsistentRead=False,
+                    KeyConditionExpression=key_expression,
+                    ProjectionExpression='creationDate, item_id, rangeValue',
+                    Limit=page_size,
+                    **query_options
+                )
+                for item in response.get('Items', []):
+                    if item['rangeValue'] == excluded:
+                        continue
+                    yield item
+                start_key = response.get('LastEvaluatedKey', None)
+                if not start_key:
+                    break
+
+    def _get_index_row_id(self, kind, item_id, field, operation=None):
+        """
+        Id of an index row of item_id, derived from the item so it is deleted without a lookup.
+        Item ids and fields may contain any character, so they are hashed instead of joined.
+        """
+        key = json.dumps([item_id, field, operation])
+        return '{}-{}'.format(kind, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get_range_queries_since(self, table_name, partition, field, condition, value, start_creation_date=None,
+                                start_key=None, limit=1000):
+        """
+        Page of the range rows of field satisfying condition, in creation date order.
+        Every range row of the field is read from the invertedQuery index and those out of the range are
+        filtered out, so a page holds fewer than limit rows when some are filtered.
+        Range rows written before they carried invertedQuery are missing until create_range_index runs again.
+        """
+        table = self.resource.Table(table_name)
+        key_expression = Key('invertedQuery').eq('{}-{}-range'.format(partition, field))
+        if start_creation_date is not None:
+            key_expression &= Key('creationDate').gte(start_creation_date)
+        filter_expression = None
+        for low, high, excluded in range_index_bounds(condition, value):
+            expression = Attr('rangeValue').between(low, high)
+            if excluded is not None:
+                expression &= Attr('rangeValue').ne(excluded)
+            filter_expression = expression if filter_expression is None else filter_expression | expression
+        query_options = {'ExclusiveStartKey': start_key} if start_key else {}
+        response = table.query(
+            IndexName='invertedQuery-creationDate',
+            ConsistentRead=False,
+            KeyConditionExpression=key_expression,
+            FilterExpression=filter_expression,
+            ProjectionExpression='creationDate, item_id',
+            Limit=limit,
+            **query_options
+        )
+        return response
 
-    def _put_inverted_query_field(self, table, partition, field, operand, operation, item_id, creation_date):
+    def _get_inverted_query_field(self, partition, field, operand, operation, item_id, creation_date):
         _invertedQuery = '{}-{}-{}-{}'.format(partition, field, operand, operation)
         query = {
-            'id': 'query-{}'.format(shortuuid.uuid()),
+            'id': self._get_index_row_id('query', item_id, field, operation),
             'partition': 'index-{}'.format(item_id),
             'invertedQuery': _invertedQuery,
             'creationDate': creation_date,
             'item_id': item_id,
         }
-        response = table.put_item(
-            Item=query,
-        )
-        return response
+        return query
 
     def _delete_inverted_query(self, table_name, item_id):
         table = self.resource.Table(table_name)
-        items = self.get_items_in_partition(table_name, 'index-{}'.format(item_id), limit=maxsize).get('Items', [])
+        items = list(self.iter_items_in_partition(table_name, 'index-{}'.format(item_id), projection=['id']))
         with table.batch_writer() as batch:
             for item in items:
                 inverted_query_id = item.get('id', None)
@@ -670,7 +1312,7 @@ class DynamoDB:
 
 class Lambda:
     def __init__(self, boto3_session):
-        self.client = boto3_session.client('lambda')
+        self.client = get_boto3_client(boto3_session, 'lambda')
 
     def create_function(self, name, description, runtime, role_arn, handler, zip_file):
         response = self.client.create_function(
@@ -717,11 +1359,23 @@ class Lambda:
         )
         return response
 
+    def invoke_function_async(self, name, payload_bytes):
+        """Queue the invocation, Lambda runs it in the background and retries it on errors"""
+        response = self.client.invoke(
+            FunctionName=name,
+            InvocationType='Event',
+            Payload=payload_bytes,
+        )
+        return response
+
 
 class S3:
+    # Multipart uploads neither completed nor aborted are aborted by S3 this many days after they are started
+    abort_incomplete_multipart_upload_days = 7
+
     def __init__(self, boto3_session):
-        self.client = boto3_session.client('s3')
-        self.resource = boto3_session.resource('s3')
+        self.client = get_boto3_client(boto3_session, 's3')
+        self.resource = get_boto3_resource(boto3_session, 's3')
         self.region = boto3_session.region_name
 
     @classmethod
@@ -741,6 +1395,32 @@ class S3:
             print('create_bucket success')
         except Exception as ex:
             print(ex)
+        self.put_lifecycle_configuration(bucket_name)
+
+    def put_lifecycle_configuration(self, bucket_name):
+        """
+        Let S3 abort abandoned multipart uploads, whose parts are stored and billed until the upload ends.
+        It replaces the lifecycle rules of the bucket.
+        """
+        bucket_name = self.to_dns_name(bucket_name)
+        try:
+            response = self.client.put_bucket_lifecycle_configuration(
+                Bucket=bucket_name,
+                LifecycleConfiguration={
+                    'Rules': [{
+                        'ID': 'abort-incomplete-multipart-uploads',
+                        'Filter': {'Prefix': ''},
+                        'Status': 'Enabled',
+                        'AbortIncompleteMultipartUpload': {
+                            'DaysAfterInitiation': self.abort_incomplete_multipart_upload_days,
+                        },
+                    }],
+                },
+            )
+            return response
+        except Exception as ex:
+            print(ex)
+            return None
 
     def create_bucket(self, bucket_name):
         bucket_name = self.to_dns_name(bucket_name)
@@ -779,6 +1459,98 @@ class S3:
             else:
                 raise
 
+    def get_size(self, bucket_name, file_name):
+        bucket_name = self.to_dns_name(bucket_name)
+        try:
+            response = self.client.head_object(Bucket=bucket_name, Key=file_name)
+            return response['ContentLength']
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def generate_upload_url(self, bucket_name, file_name, expires_in):
+        bucket_name = self.to_dns_name(bucket_name)
+        return self.client.generate_presigned_url('put_object', Params={
+            'Bucket': bucket_name,
+            'Key': file_name,
+        }, ExpiresIn=expires_in)
+
+    def generate_download_url(self, bucket_name, file_name, expires_in, download_name=None):
+        bucket_name = self.to_dns_name(bucket_name)
+        params = {
+            'Bucket': bucket_name,
+            'Key': file_name,
+        }
+        if download_name:
+            params['ResponseContentDisposition'] = 'attachment; filename="{}"'.format(download_name)
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+    def create_multipart_upload(self, bucket_name, file_name):
+        bucket_name = self.to_dns_name(bucket_name)
+        response = self.client.create_multipart_upload(Bucket=bucket_name, Key=file_name)
+        return response['UploadId']
+
+    def generate_upload_part_url(self, bucket_name, file_name, upload_id, part_number, expires_in):
+        bucket_name = self.to_dns_name(bucket_name)
+        return self.client.generate_presigned_url('upload_part', Params={
+            'Bucket': bucket_name,
+            'Key': file_name,
+            'UploadId': upload_id,
+            'PartNumber': part_number,
+        }, ExpiresIn=expires_in)
+
+    def upload_part(self, bucket_name, file_name, upload_id, part_number, binary):
+        bucket_name = self.to_dns_name(bucket_name)
+        response = self.client.upload_part(
+            Bucket=bucket_name,
+            Key=file_name,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=binary,
+        )
+        return response['ETag']
+
+    def complete_multipart_upload(self, bucket_name, file_name, upload_id, parts):
+        """
+        :param parts: list of (part_number, etag)
+        :return: response, None when the upload does not exist or parts are invalid
+        """
+        bucket_name = self.to_dns_name(bucket_name)
+        try:
+            response = self.client.complete_multipart_upload(
+                Bucket=bucket_name,
+                Key=file_name,
+                UploadId=upload_id,
+                MultipartUpload={
+                    'Parts': [{'PartNumber': part_number, 'ETag': etag} for part_number, etag in sorted(parts)]
+                },
+            )
+            return response
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('InvalidPart', 'InvalidPartOrder', 'EntityTooSmall',
+                                               'NoSuchUpload', 'MalformedXML'):
+                print(e)
+                return None
+            raise
+
+    def abort_multipart_upload(self, bucket_name, file_name, upload_id):
+        bucket_name = self.to_dns_name(bucket_name)
+        response = self.client.abort_multipart_upload(Bucket=bucket_name, Key=file_name, UploadId=upload_id)
+        return response
+
+    def download_range(self, bucket_name, file_name, start, end):
+        bucket_name = self.to_dns_name(bucket_name)
+        try:
+            response = self.client.get_object(Bucket=bucket_name, Key=file_name,
+                                              Range='bytes={}-{}'.format(start, end))
+            return response['Body'].read()
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                print("The object does not exist.")
+                return None
+            raise
+
     def delete_bucket(self, bucket_name):
         try:
             response = self.client.delete_bucket(
@@ -799,8 +1571,8 @@ class IAM:
     ]
 
     def __init__(self, boto3_session):
-        self.client = boto3_session.client('iam')
-        self.resource = boto3_session.resource('iam')
+        self.client = get_boto3_client(boto3_session, 'iam')
+        self.resource = get_boto3_resource(boto3_session, 'iam')
 
     def create_role_and_attach_policies(self, role_name):
         self.create_role(role_name)
@@ -884,7 +1656,7 @@ class IAM:
 
 class CostExplorer:
     def __init__(self, boto3_session):
-        self.client = boto3_session.client('ce', 'us-east-1')
+        self.client = get_boto3_client(boto3_session, 'ce', 'us-east-1')
 
     def get_cost_and_usage(self, start, end):
         response = self.client.get_cost_and_usage(
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import cloud.shortuuid as shortuuid
+from resource import get_resource
+
+
+class MemoryBackend:
+    """Mixin of test cases running against a fresh InMemoryResource, listed before the test mixins"""
+    vendor = 'memory'
+
+    def setUp(self):
+        self.resource = get_resource('memory', None, 'test-{}'.format(shortuuid.uuid()))
+        super().setUp()
+
+
+class SQLiteBackend:
+    """Mixin of test cases running against a fresh SQLiteResource in a temporary directory"""
+    vendor = 'sqlite'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        credential = {'sqlite': {'directory': self.directory}}
+        self.resource = get_resource('sqlite', credential, 'test-{}'.format(shortuuid.uuid()))
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        from resource.sqlite import SQLiteResourceAllocator
+        SQLiteResourceAllocator(self.resource.credential, self.resource.app_id).terminate()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class AWSBackend:
+    """Mixin of test cases running against an AWSResource whose table and bucket are created in moto"""
+    vendor = 'aws'
+
+    def setUp(self):
+        import boto3
+        try:
+            from moto import mock_aws
+        except ImportError:
+            self.skipTest('moto is required, pip install "moto[dynamodb,s3]"')
+        from resource.wrapper.boto3_wrapper import DynamoDB, S3
+        environ = {
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+            'AWS_DEFAULT_REGION': 'ap-northeast-2',
+        }
+        patcher = mock.patch.dict(os.environ, environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+
+        app_id = 'test-{}'.format(shortuuid.uuid())
+        boto3_session = boto3.Session()
+        with contextlib.redirect_stdout(io.StringIO()):  # Table and bucket creation report their progress
+            DynamoDB(boto3_session).init_table(app_id)
+            S3(boto3_session).init_bucket(app_id)
+        self.resource = get_resource('aws', None, app_id, boto3_session)
+        super().setUp()
@@ -0,0 +1,227 @@
+import unittest
+from unittest import mock
+
+import botocore
+
+from cloud.log import get_log_bucket_partitions
+import resource.wrapper.boto3_wrapper as boto3_wrapper
+from resource.wrapper.boto3_wrapper import DynamoDB, S3
+from tests.backends import AWSBackend
+
+PARTITION = 'test'
+
+
+class DynamoDBTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.dynamo = DynamoDB(self.resource.boto3_session)
+        self.table_name = self.resource.app_id
+        self.resource.db_create_partition(PARTITION)
+
+    def index_row_ids(self, item_id):
+        rows = self.dynamo.iter_items_in_partition(self.table_name, 'index-{}'.format(item_id), projection=['id'])
+        return sorted(row['id'] for row in rows)
+
+    def ids_equal(self, field, value):
+        items, _ = self.resource.db_query(PARTITION, [(None, (field, 'eq', value))])
+        return [item['id'] for item in items]
+
+    def count(self, partition=PARTITION):
+        """Partition count read from the counters, AWSResource caches counts for a few seconds"""
+        return self.dynamo.get_partition_count(self.table_name, partition)
+
+
+class PutItemTest(AWSBackend, DynamoDBTestMixin, unittest.TestCase):
+    def test_new_item(self):
+        item = {'color': 'red', 'size': 1}
+        self.resource.db_put_item(PARTITION, item)
+        self.assertIn(self.dynamo._get_index_row_id('query', item['id'], 'color', 'eq'),
+                      self.index_row_ids(item['id']))
+        self.assertEqual(self.ids_equal('size', 1), [item['id']])
+        self.assertEqual(self.count(), 1)
+
+    def test_overwrite_replaces_index_without_counting(self):
+        self.resource.db_put_item(PARTITION, {'color': 'red', 'shape': 'round'}, item_id='item1')
+        self.resource.db_put_item(PARTITION, {'color': 'blue', 'size': 2}, item_id='item1')
+
+        self.assertNotIn(self.dynamo._get_index_row_id('query', 'item1', 'shape', 'eq'), self.index_row_ids('item1'))
+        self.assertEqual(self.ids_equal('color', 'red'), [])
+        self.assertEqual(self.ids_equal('shape', 'round'), [])
+        self.assertEqual(self.ids_equal('color', 'blue'), ['item1'])
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.resource.db_get_item('item1')['_revision'], 2)
+
+    def test_overwrite_of_a_changed_item_is_cancelled(self):
+        self.resource.db_put_item(PARTITION, {'color': 'red'}, item_id='item1')
+        stale_item = self.resource.db_get_item('item1')
+        self.resource.db_put_item(PARTITION, {'color': 'green'}, item_id='item1')
+
+        # Deleting the index rows of the stale item would leave the index of the current one behind
+        item = {'id': 'item1', 'creationDate': 1000, 'partition': PARTITION, 'color': 'blue'}
+        transact_items = self.dynamo._get_put_transact_items(
+            self.table_name, PARTITION, item, self.dynamo._get_inverted_queries(PARTITION, item), stale_item, True)
+        with self.assertRaises(botocore.exceptions.ClientError):
+            self.dynamo.client.transact_write_items(TransactItems=transact_items)
+        self.assertEqual(self.ids_equal('color', 'green'), ['item1'])
+
+    def test_concurrent_overwrite_is_retried(self):
+        self.resource.db_put_item(PARTITION, {'color': 'red'}, item_id='item1')
+        get_item = self.dynamo.get_item
+        writes = []
+
+        def get_item_then_overwrite(table_name, item_id, consistent_read=False):
+            response = get_item(table_name, item_id, consistent_read)
+            if not writes:  # Another writer changes the item after it is read
+                writes.append(self.resource.db_put_item(PARTITION, {'color': 'green'}, item_id='item1'))
+            return response
+        self.dynamo.get_item = get_item_then_overwrite
+        self.dynamo.put_item(self.table_name, PARTITION, {'color': 'blue'}, item_id='item1')
+
+        self.assertEqual(self.ids_equal('color', 'blue'), ['item1'])
+        self.assertEqual(self.ids_equal('color', 'green'), [])
+        self.assertEqual(self.count(), 1)
+
+    def test_too_many_index_rows(self):
+        item = {'field{}'.format(idx): idx for idx in range(DynamoDB.transact_write_max_items)}
+        with self.assertRaises(ValueError):
+            self.resource.db_put_item(PARTITION, item)
+        self.assertEqual(self.count(), 0)
+
+
+class UpdateItemTest(AWSBackend, DynamoDBTestMixin, unittest.TestCase):
+    def put(self, item, item_id='item1'):
+        self.resource.db_put_item(PARTITION, item, item_id=item_id)
+        return self.resource.db_get_item(item_id)
+
+    def test_update_moves_index(self):
+        item = self.put({'color': 'red', 'size': 1, 'shape': 'round'})
+        item['color'] = 'blue'
+        item.pop('shape')
+        item['weight'] = 3
+        self.assertTrue(self.resource.db_update_item('item1', item))
+
+        self.assertEqual(self.ids_equal('color', 'red'), [])
+        self.assertEqual(self.ids_equal('color', 'blue'), ['item1'])
+        self.assertEqual(self.ids_equal('shape', 'round'), [])
+        self.assertEqual(self.ids_equal('size', 1), ['item1'])
+        self.assertEqual(self.ids_equal('weight', 3), ['item1'])
+        self.assertEqual(self.count(), 1)
+
+    def test_only_changed_index_rows_are_written(self):
+        item = self.put({'color': 'red', 'size': 1, 'shape': 'round'})
+        item['color'] = 'blue'
+        item.pop('shape')
+        transact_write_items = self.dynamo.client.transact_write_items
+        requests = []
+
+        def record(TransactItems):
+            requests.append(TransactItems)
+            return transact_write_items(TransactItems=TransactItems)
+        self.dynamo.client.transact_write_items = record
+        try:
+            self.dynamo.update_item(self.table_name, 'item1', item)
+        finally:
+            del self.dynamo.client.transact_write_items
+
+        self.assertEqual(len(requests), 1)
+        deletes = [write['Delete']['Key']['id']['S'] for write in requests[0] if 'Delete' in write]
+        puts = [write['Put']['Item']['id']['S'] for write in requests[0] if 'Put' in write]
+        self.assertEqual(deletes, [self.dynamo._get_index_row_id('query', 'item1', 'shape', 'eq')])
+        self.assertEqual(puts, ['item1', self.dynamo._get_index_row_id('query', 'item1', 'color', 'eq')])
+
+    def test_index_row_ids_are_unambiguous(self):
+        self.put({'b-c': 1}, item_id='a')
+        self.put({'c': 2}, item_id='a-b')
+        self.assertEqual(self.ids_equal('b-c', 1), ['a'])
+        self.assertEqual(self.ids_equal('c', 2), ['a-b'])
+
+    def test_items_of_older_index_versions_are_reindexed(self):
+        legacy_item = {'id': 'item1', 'partition': PARTITION, 'creationDate': 1000, 'color': 'red',
+                       '_index_version': 2}
+        legacy_query = {'id': 'query-item1-color-eq', 'partition': 'index-item1', 'creationDate': 1000,
+                        'invertedQuery': '{}-color-red-eq'.format(PARTITION), 'item_id': 'item1'}
+        table = self.dynamo.resource.Table(self.table_name)
+        table.put_item(Item=legacy_item)
+        table.put_item(Item=legacy_query)
+
+        self.assertTrue(self.resource.db_update_item('item1', dict(legacy_item, color='blue')))
+        self.assertEqual(self.ids_equal('color', 'red'), [])
+        self.assertEqual(self.ids_equal('color', 'blue'), ['item1'])
+        self.assertNotIn('query-item1-color-eq', self.index_row_ids('item1'))
+
+    def test_conditional_update_claims_once(self):
+        item = self.put({'status': 'queued'})
+        claimed = dict(item, status='running')
+        self.assertTrue(self.resource.db_update_item('item1', claimed, condition=('status', 'queued')))
+        stale = dict(item, status='done')
+        self.assertFalse(self.resource.db_update_item('item1', stale, condition=('status', 'queued')))
+
+        self.assertEqual(self.resource.db_get_item('item1')['status'], 'running')
+        self.assertEqual(self.ids_equal('status', 'running'), ['item1'])
+        self.assertEqual(self.ids_equal('status', 'done'), [])
+
+    def test_claim_lost_to_a_concurrent_writer(self):
+        item = self.put({'status': 'queued'})
+        get_item = self.dynamo.get_item
+        writes = []
+
+        def get_item_then_claim(table_name, item_id, consistent_read=False):
+            response = get_item(table_name, item_id, consistent_read)
+            if not writes:  # Another worker claims the item after it is read
+                writes.append(self.resource.db_update_item('item1', dict(item, status='running', worker='other'),
+                                                           condition=('status', 'queued')))
+            return response
+        self.dynamo.get_item = get_item_then_claim
+        result = self.dynamo.update_item(self.table_name, 'item1', dict(item, status='running', worker='self'),
+                                         condition=('status', 'queued'))
+
+        self.assertEqual(writes, [True])
+        self.assertIsNone(result)
+        self.assertEqual(self.resource.db_get_item('item1')['worker'], 'other')
+        self.assertEqual(self.ids_equal('worker', 'self'), [])
+
+
+class ShardedCountTest(AWSBackend, DynamoDBTestMixin, unittest.TestCase):
+    def test_first_shard_is_the_unsharded_counter(self):
+        with mock.patch.dict(boto3_wrapper.COUNT_SHARDS, {'session': 4}):
+            self.assertEqual(self.dynamo._get_count_ids('session'),
+                             ['session-count', 'session-count-1', 'session-count-2', 'session-count-3'])
+            self.assertIn(self.dynamo._get_count_id('session'), self.dynamo._get_count_ids('session'))
+        self.assertEqual(self.dynamo._get_count_ids('unsharded'), ['unsharded-count'])
+
+    def test_partition_count_sums_shards(self):
+        with mock.patch.dict(boto3_wrapper.COUNT_SHARDS, {PARTITION: 4}):
+            for idx in range(12):
+                self.resource.db_put_item(PARTITION, {'number': idx})
+            self.resource.db_put_items(PARTITION, [{'number': idx} for idx in range(3)])
+            item_ids = [item['id'] for item in self.resource.db_get_items_in_partition(PARTITION, limit=2)[0]]
+            for item_id in item_ids:
+                self.resource.db_delete_item(item_id)
+            self.assertEqual(self.count(), 13)
+            counters = self.dynamo.get_items(self.table_name, self.dynamo._get_count_ids(PARTITION))['Items']
+            self.assertGreater(len(counters), 1)
+
+    def test_hourly_log_partitions_are_not_sharded(self):
+        self.assertNotIn('log', boto3_wrapper.COUNT_SHARDS)
+        for partition in get_log_bucket_partitions(0):
+            self.assertEqual(self.dynamo._get_count_ids(partition), ['{}-count'.format(partition)])
+
+    def test_counters_expire_with_their_items(self):
+        log_partition = get_log_bucket_partitions(0)[0]
+        self.resource.db_put_items(log_partition, [{'expiresAt': 3000}, {'expiresAt': 2000}])
+        self.resource.db_put_item(log_partition, {'expiresAt': 4000})
+        self.resource.db_put_item(PARTITION, {'number': 1})
+
+        counter = self.dynamo.get_item(self.table_name, '{}-count'.format(log_partition))['Item']
+        self.assertEqual((counter['count'], counter['expiresAt']), (3, 4000))
+        counter = self.dynamo.get_item(self.table_name, '{}-count'.format(PARTITION))['Item']
+        self.assertNotIn('expiresAt', counter)
+
+
+class S3Test(AWSBackend, unittest.TestCase):
+    def test_incomplete_multipart_uploads_are_aborted(self):
+        s3 = S3(self.resource.boto3_session)
+        rules = s3.client.get_bucket_lifecycle_configuration(Bucket=S3.to_dns_name(self.resource.app_id))['Rules']
+        self.assertEqual([rule['AbortIncompleteMultipartUpload'] for rule in rules],
+                         [{'DaysAfterInitiation': S3.abort_incomplete_multipart_upload_days}])
+        self.assertEqual(rules[0]['Status'], 'Enabled')
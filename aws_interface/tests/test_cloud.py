@@ -0,0 +1,323 @@
+import base64
+import contextlib
+import io
+import time
+import unittest
+from unittest import mock
+
+import cloud.lambda_function as lambda_function
+import cloud.log.get_log_series as get_log_series
+import cloud.log.get_logs as get_logs
+from cloud.lambda_function import abstracted_handler, BATCH_MAX_OPERATIONS
+from cloud.storage import PENDING_FILE_PARTITION, PENDING_UPLOAD_EXPIRES_IN
+from tests.backends import AWSBackend, MemoryBackend, SQLiteBackend
+
+
+class CloudTestMixin:
+    """Calls the cloud API like the REST API does, as a registered user"""
+    def setUp(self):
+        super().setUp()
+        self.session_id = self.login('user@example.com')
+
+    def call(self, module_name, **params):
+        params['module_name'] = module_name
+        if 'session_id' not in params:
+            params['session_id'] = self.session_id
+        return abstracted_handler(params, self.resource)
+
+    def login(self, email):
+        self.call('cloud.auth.register', email=email, password='password', session_id=None)
+        response = self.call('cloud.auth.login', email=email, password='password', session_id=None)
+        return response['body']['session_id']
+
+    @contextlib.contextmanager
+    def assertPrints(self, *messages):
+        """Capture what the block prints, from any thread, and check it contains every message"""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            yield
+        for message in messages:
+            self.assertIn(message, output.getvalue())
+
+
+class BatchTestMixin(CloudTestMixin):
+    def test_operations_run_as_the_envelope_user(self):
+        response = self.call('batch', operations=[
+            {'module_name': 'cloud.auth.get_me', 'params': {}},
+            {'module_name': 'cloud.auth.get_me', 'params': {'session_id': 'someone else'}},
+        ])
+        self.assertEqual(response['statusCode'], 200)
+        responses = response['body']['responses']
+        self.assertEqual(len(responses), 2)
+        for operation_response in responses:
+            self.assertEqual(operation_response['statusCode'], 200)
+            self.assertEqual(operation_response['body']['item']['email'], 'user@example.com')
+
+    def test_operations_must_be_a_list(self):
+        for operations in (None, 'cloud.auth.get_me', {'module_name': 'cloud.auth.get_me'}):
+            with self.subTest(operations=operations):
+                self.assertEqual(self.call('batch', operations=operations)['statusCode'], 400)
+
+    def test_too_many_operations(self):
+        operations = [{'module_name': 'cloud.auth.get_me', 'params': {}}] * (BATCH_MAX_OPERATIONS + 1)
+        self.assertEqual(self.call('batch', operations=operations)['statusCode'], 400)
+
+    def test_malformed_operations_fail_alone(self):
+        with self.assertPrints('module_name: batch not in CALLABLE_MODULE_WHITE_LIST'):
+            response = self.call('batch', operations=[
+                'cloud.auth.get_me',
+                {'module_name': 'cloud.auth.get_me', 'params': ['not', 'a', 'dict']},
+                {'module_name': 'batch', 'params': {}},
+                {'module_name': 'cloud.auth.get_me', 'params': {}},
+            ], sequential=True)
+        self.assertEqual(response['statusCode'], 200)
+        status_codes = [operation_response['statusCode'] for operation_response in response['body']['responses']]
+        self.assertEqual(status_codes, [400, 400, 403, 200])
+
+    def test_batches_share_the_executor(self):
+        operations = [{'module_name': 'cloud.auth.get_me', 'params': {}}] * 3
+        with mock.patch.object(lambda_function, '_batch_executor', wraps=lambda_function._batch_executor) as executor:
+            for _ in range(2):
+                self.assertEqual(self.call('batch', operations=operations)['statusCode'], 200)
+        self.assertEqual(executor.map.call_count, 2)
+
+
+class UploadUrlTestMixin(CloudTestMixin):
+    def test_anonymous_requests_get_no_url(self):
+        resource = self.resource
+        with mock.patch.object(resource, 'file_get_upload_url') as get_upload_url, \
+                mock.patch.object(resource, 'file_create_multipart_upload') as create_multipart_upload, \
+                mock.patch.object(resource, 'db_put_item') as put_item:
+            for part_count in (None, 2):
+                with self.subTest(part_count=part_count):
+                    body = self.call('cloud.storage.get_upload_url', part_count=part_count, session_id=None)['body']
+                    self.assertFalse(body['success'])
+                    self.assertEqual(body['message'], 'permission denied')
+        get_upload_url.assert_not_called()
+        create_multipart_upload.assert_not_called()
+        put_item.assert_not_called()
+
+
+class AWSUploadUrlTestMixin(UploadUrlTestMixin):
+    """The URLs are presigned S3 URLs, the HTTP PUT of the client is made with file_upload_bin"""
+    def test_complete_upload(self):
+        body = self.call('cloud.storage.get_upload_url', file_name='file.bin', read_groups=['owner'])['body']
+        self.assertTrue(body['success'], body)
+        self.assertIn(body['file_id'], body['upload_url'])
+        file_id = body['file_id']
+        self.resource.file_upload_bin(file_id, b'hello world')
+
+        # The file is pending until the upload is completed
+        self.assertFalse(self.call('cloud.storage.download_b64', file_id=file_id)['body']['success'])
+
+        body = self.call('cloud.storage.complete_upload', file_id=file_id)['body']
+        self.assertTrue(body['success'], body)
+        self.assertEqual(body['file_size'], 11)
+        body = self.call('cloud.storage.download_b64', file_id=file_id, start=6, end=10)['body']
+        self.assertEqual(base64.b64decode(body['file_b64']), b'world')
+
+    def test_complete_with_invalid_parts(self):
+        body = self.call('cloud.storage.get_upload_url', part_count=1)['body']
+        self.assertTrue(body['success'], body)
+        self.assertEqual(len(body['part_urls']), 1)
+        file_id = body['file_id']
+        etag = self.resource.file_upload_part(file_id, body['upload_id'], 1, b'hello')
+
+        for parts in ([{'part_number': 1, 'etag': '"other"'}], [{'part_number': 2, 'etag': etag}]):
+            with self.subTest(parts=parts), self.assertPrints('InvalidPart'):
+                response = self.call('cloud.storage.complete_upload', file_id=file_id, parts=parts)
+            self.assertEqual(response['statusCode'], 400)
+            self.assertFalse(response['body']['success'])
+        response = self.call('cloud.storage.complete_upload', file_id=file_id, parts=[{'part_number': 1}])
+        self.assertFalse(response['body']['success'])
+
+        # The upload is still pending after failed attempts
+        response = self.call('cloud.storage.complete_upload', file_id=file_id,
+                             parts=[{'part_number': 1, 'etag': etag}])
+        self.assertTrue(response['body']['success'], response['body'])
+
+
+class UploadTestMixin(CloudTestMixin):
+    def start_upload(self, write_groups=None):
+        body = self.call('cloud.storage.create_multipart_upload', file_name='file.bin',
+                         read_groups=['owner'], write_groups=write_groups or [])['body']
+        self.assertTrue(body['success'])
+        return body['file_id']
+
+    def upload_part(self, file_id, part_number, binary, session_id=None):
+        return self.call('cloud.storage.upload_part_b64', file_id=file_id, part_number=part_number,
+                         file_b64=base64.b64encode(binary).decode('utf-8'),
+                         session_id=session_id or self.session_id)['body']
+
+    def test_complete_upload(self):
+        file_id = self.start_upload()
+        parts = []
+        for part_number, binary in ((2, b'world'), (1, b'hello ')):
+            body = self.upload_part(file_id, part_number, binary)
+            self.assertTrue(body['success'], body)
+            parts.append({'part_number': part_number, 'etag': body['etag']})
+
+        body = self.call('cloud.storage.complete_upload', file_id=file_id, parts=parts)['body']
+        self.assertTrue(body['success'], body)
+        self.assertEqual(body['file_size'], 11)
+
+        manifest = self.call('cloud.storage.get_file_manifest', file_id=file_id)['body']
+        self.assertEqual(manifest['chunks'], [{'file_id': file_id, 'start': 0, 'size': 11}])
+        body = self.call('cloud.storage.download_b64', file_id=file_id, start=6, end=10)['body']
+        self.assertEqual(base64.b64decode(body['file_b64']), b'world')
+
+    def test_complete_with_invalid_parts(self):
+        file_id = self.start_upload()
+        etag = self.upload_part(file_id, 1, b'hello')['etag']
+        for parts, message in (([{'part_number': 1, 'etag': '"other"'}], 'Invalid part: 1'),
+                               ([{'part_number': 2, 'etag': etag}], 'Invalid part: 2'),
+                               ([], 'No parts to complete upload')):
+            with self.subTest(parts=parts), self.assertPrints(message):
+                response = self.call('cloud.storage.complete_upload', file_id=file_id, parts=parts)
+            self.assertEqual(response['statusCode'], 400)
+            self.assertFalse(response['body']['success'])
+        response = self.call('cloud.storage.complete_upload', file_id=file_id, parts=[{'part_number': 1}])
+        self.assertFalse(response['body']['success'])
+
+        # The upload is still pending after failed attempts
+        response = self.call('cloud.storage.complete_upload', file_id=file_id,
+                             parts=[{'part_number': 1, 'etag': etag}])
+        self.assertTrue(response['body']['success'])
+
+    def test_pending_upload_is_not_readable(self):
+        file_id = self.start_upload()
+        self.upload_part(file_id, 1, b'hello')
+        self.assertFalse(self.call('cloud.storage.download_b64', file_id=file_id)['body']['success'])
+        self.assertFalse(self.call('cloud.storage.get_file_manifest', file_id=file_id)['body']['success'])
+
+    def test_abort_upload(self):
+        file_id = self.start_upload()
+        etag = self.upload_part(file_id, 1, b'hello')['etag']
+        self.assertTrue(self.call('cloud.storage.abort_upload', file_id=file_id)['body']['success'])
+
+        self.assertIsNone(self.resource.db_get_item(file_id))
+        self.assertEqual(self.resource.db_get_count(PENDING_FILE_PARTITION), 0)
+        body = self.call('cloud.storage.complete_upload', file_id=file_id,
+                         parts=[{'part_number': 1, 'etag': etag}])['body']
+        self.assertFalse(body['success'])
+        self.assertFalse(self.call('cloud.storage.abort_upload', file_id=file_id)['body']['success'])
+
+    def test_only_owner_and_write_groups_upload(self):
+        file_id = self.start_upload()
+        other_session_id = self.login('other@example.com')
+        self.assertEqual(self.upload_part(file_id, 1, b'hello', session_id=other_session_id)['message'],
+                         'permission denied')
+        body = self.call('cloud.storage.abort_upload', file_id=file_id, session_id=other_session_id)['body']
+        self.assertEqual(body['message'], 'permission denied')
+        self.assertTrue(self.upload_part(file_id, 1, b'hello')['success'])
+
+        shared_file_id = self.start_upload(write_groups=['user'])
+        self.assertTrue(self.upload_part(shared_file_id, 1, b'hello', session_id=other_session_id)['success'])
+
+    def test_anonymous_requests_start_no_upload(self):
+        with mock.patch.object(self.resource, 'file_create_multipart_upload') as create_multipart_upload:
+            body = self.call('cloud.storage.create_multipart_upload', session_id=None)['body']
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'permission denied')
+        create_multipart_upload.assert_not_called()
+        self.assertEqual(self.resource.db_get_count(PENDING_FILE_PARTITION), 0)
+
+    def test_pending_uploads_expire(self):
+        file_id = self.start_upload()
+        item = self.resource.db_get_item(file_id)
+        self.assertEqual(item['partition'], PENDING_FILE_PARTITION)
+        self.assertAlmostEqual(item[self.resource.ttl_field], time.time() + PENDING_UPLOAD_EXPIRES_IN, delta=60)
+        self.assertEqual(self.resource.db_get_count('files'), 0)
+
+        etag = self.upload_part(file_id, 1, b'hello')['etag']
+        body = self.call('cloud.storage.complete_upload', file_id=file_id,
+                         parts=[{'part_number': 1, 'etag': etag}])['body']
+        self.assertTrue(body['success'], body)
+        item = self.resource.db_get_item(file_id)
+        self.assertEqual(item['partition'], 'files')
+        self.assertNotIn(self.resource.ttl_field, item)
+        self.assertEqual(self.resource.db_get_count('files'), 1)
+        self.assertEqual(self.resource.db_get_count(PENDING_FILE_PARTITION), 0)
+
+        # Expired uploads cannot be completed, even where the backend has not deleted the item yet
+        file_id = self.start_upload()
+        etag = self.upload_part(file_id, 1, b'hello')['etag']
+        item = self.resource.db_get_item(file_id)
+        item[self.resource.ttl_field] = int(time.time()) - 1
+        self.resource.db_update_item(file_id, item)
+        body = self.call('cloud.storage.complete_upload', file_id=file_id,
+                         parts=[{'part_number': 1, 'etag': etag}])['body']
+        self.assertEqual(body['message'], 'file_id: {} has no pending upload'.format(file_id))
+
+
+class LogTestMixin(CloudTestMixin):
+    def get_logs(self, **params):
+        data = {
+            'params': params,
+            'admin': True,
+        }
+        return get_logs.do(data, self.resource)['body']
+
+    def test_expired_logs_are_not_read(self):
+        logs = [{'event_source': 'test', 'event_name': 'expired', 'event_param': idx} for idx in range(4)]
+        with mock.patch('cloud.log.create_logs.get_log_expiration', return_value=int(time.time()) - 1):
+            self.assertTrue(self.call('cloud.log.create_logs', logs=logs)['body']['success'])
+        logs = [{'event_source': 'test', 'event_name': 'live', 'event_param': idx} for idx in range(2)]
+        self.assertTrue(self.call('cloud.log.create_logs', logs=logs)['body']['success'])
+
+        body = self.get_logs(limit=2)
+        self.assertEqual([item['event_name'] for item in body['items']], ['live', 'live'])
+        body = self.get_logs(limit=2, start_key=body['end_key'])
+        self.assertEqual((body['items'], body['end_key']), ([], None))
+
+    def test_log_series_counts_every_log(self):
+        for event_names in (['a', 'a', 'b'], ['a']):
+            logs = [{'event_source': 'test', 'event_name': event_name} for event_name in event_names]
+            self.assertTrue(self.call('cloud.log.create_logs', logs=logs)['body']['success'])
+
+        for resolution in ('minute', 'hour'):
+            with self.subTest(resolution=resolution):
+                body = get_log_series.do({'params': {'resolution': resolution}, 'admin': True}, self.resource)['body']
+                self.assertTrue(body['success'], body)
+                self.assertEqual([(series['event_name'], series['total']) for series in body['series']],
+                                 [('a', 3), ('b', 1)])
+
+
+class MemoryBatchTest(MemoryBackend, BatchTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteBatchTest(SQLiteBackend, BatchTestMixin, unittest.TestCase):
+    pass
+
+
+class MemoryLogTest(MemoryBackend, LogTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteLogTest(SQLiteBackend, LogTestMixin, unittest.TestCase):
+    pass
+
+
+class AWSLogTest(AWSBackend, LogTestMixin, unittest.TestCase):
+    pass
+
+
+class MemoryUploadTest(MemoryBackend, UploadTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteUploadTest(SQLiteBackend, UploadTestMixin, unittest.TestCase):
+    pass
+
+
+class MemoryUploadUrlTest(MemoryBackend, UploadUrlTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteUploadUrlTest(SQLiteBackend, UploadUrlTestMixin, unittest.TestCase):
+    pass
+
+
+class AWSUploadUrlTest(AWSBackend, AWSUploadUrlTestMixin, unittest.TestCase):
+    pass
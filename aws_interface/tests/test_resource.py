@@ -0,0 +1,343 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from resource.query import match_condition
+from tests.backends import AWSBackend, MemoryBackend, SQLiteBackend
+
+PARTITION = 'test'
+ITEM_COUNT = 60
+
+QUERIES = [
+    [(None, ('mod3', 'eq', 1))],
+    [(None, ('mod2', 'eq', 0)), ('and', ('mod3', 'eq', 2))],
+    [(None, ('mod2', 'eq', 1)), ('or', ('mod5', 'eq', 0))],
+    [(None, ('number', 'gt', 20))],
+    [(None, ('number', 'le', 12)), ('or', ('number', 'ge', 25))],
+    [(None, ('mod2', 'eq', 0)), ('and', ('number', 'ls', 30)), ('or', ('mod7', 'eq', 3))],
+    [(None, ('name', 'ge', 'name-015')), ('and', ('mod3', 'eq', 0))],
+    [(None, ('mod2', 'eq', 5))],
+]
+
+
+def expected_ids(items, instructions):
+    """Items matching instructions, folded from left to right like db_query, in creation order"""
+    matched = []
+    for item in items:
+        result = None
+        for option, (field, condition, value) in instructions:
+            match = match_condition(item, field, condition, value)
+            if result is None:
+                result = match
+            elif option == 'and':
+                result = result and match
+            else:
+                result = result or match
+        if result:
+            matched.append(item)
+    return [item['id'] for item in sorted(matched, key=lambda item: (item['creationDate'], item['id']))]
+
+
+class DbQueryTestMixin:
+    range_indexed = False
+    item_count = ITEM_COUNT
+    queries = QUERIES
+    page_limits = (1, 7)
+
+    def setUp(self):
+        super().setUp()
+        self.resource.db_create_partition(PARTITION)
+        if self.range_indexed:
+            self.resource.db_create_range_index(PARTITION, 'number')
+        items = []
+        for idx in range(1, self.item_count + 1):
+            items.append({
+                'mod2': idx % 2,
+                'mod3': idx % 3,
+                'mod5': idx % 5,
+                'mod7': idx % 7,
+                'number': idx,
+                'name': 'name-{:03d}'.format(idx),
+                # Several items share a creation date so ties are ordered by id
+                'creationDate': 1000 + idx // 3,
+            })
+        self.put_items(items)
+        self.items = self.resource.db_get_items([item['id'] for item in items])
+
+    def put_items(self, items):
+        for item in items:
+            self.resource.db_put_item(PARTITION, item, creation_date=item['creationDate'])
+
+    def query_ids(self, instructions, limit):
+        """Ids of every page of the query"""
+        item_ids = []
+        start_key = None
+        while True:
+            items, start_key = self.resource.db_query(PARTITION, instructions, start_key, limit)
+            item_ids.extend(item['id'] for item in items)
+            if not start_key:
+                return item_ids
+
+    def test_query_matches_predicates(self):
+        for instructions in self.queries:
+            with self.subTest(instructions=instructions):
+                self.assertEqual(self.query_ids(instructions, 100), expected_ids(self.items, instructions))
+
+    def test_query_pages(self):
+        for instructions in self.queries:
+            for limit in self.page_limits:
+                with self.subTest(instructions=instructions, limit=limit):
+                    self.assertEqual(self.query_ids(instructions, limit), expected_ids(self.items, instructions))
+
+    def test_query_partitions(self):
+        other_partition = PARTITION + '-other'
+        self.resource.db_create_partition(other_partition)
+        other_item = {'mod3': 1, 'number': 1000}
+        self.resource.db_put_item(other_partition, other_item, creation_date=5000)
+        instructions = [(None, ('mod3', 'eq', 1))]
+        items, end_key = self.resource.db_query_partitions([[PARTITION], [other_partition]], instructions,
+                                                           limit=100)
+        self.assertEqual([item['id'] for item in items],
+                         expected_ids(self.items, instructions) + [other_item['id']])
+        self.assertIsNone(end_key)
+
+    def test_query_partitions_leaves_out_expired_items(self):
+        ttl_field = self.resource.ttl_field
+        other_partition = PARTITION + '-other'
+        self.resource.db_create_partition(other_partition)
+        live_ids = []
+        for idx, expires_at in enumerate((100, 100, 100, None, 200, 100, 300)):
+            item = {'mod3': 1}
+            if expires_at:
+                item[ttl_field] = expires_at
+            self.resource.db_put_item(other_partition, item, creation_date=5000 + idx)
+            if expires_at != 100:
+                live_ids.append(item['id'])
+
+        for instructions in ([(None, ('mod3', 'eq', 1))], []):
+            with self.subTest(instructions=instructions):
+                # Pages are filled with live items, the expired ones do not take part of the limit
+                items, end_key = self.resource.db_query_partitions([[other_partition]], instructions, limit=2,
+                                                                   live_at=150)
+                self.assertEqual([item['id'] for item in items], live_ids[:2])
+                self.assertIsNotNone(end_key)
+                items, end_key = self.resource.db_query_partitions([[other_partition]], instructions, end_key,
+                                                                   limit=2, live_at=150)
+                self.assertEqual([item['id'] for item in items], live_ids[2:])
+                self.assertIsNone(end_key)
+
+
+class DbPutTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.resource.db_create_partition(PARTITION)
+
+    def test_overwrite_is_counted_once(self):
+        self.resource.db_put_item(PARTITION, {'color': 'red'}, item_id='item1')
+        self.resource.db_put_item(PARTITION, {'color': 'blue'}, item_id='item1')
+        self.assertEqual(self.resource.db_get_count(PARTITION), 1)
+
+        other_partition = PARTITION + '-other'
+        self.resource.db_create_partition(other_partition)
+        self.resource.db_put_item(other_partition, {'color': 'blue'}, item_id='item1')
+        self.assertEqual(self.resource.db_get_count(PARTITION), 0)
+        self.assertEqual(self.resource.db_get_count(other_partition), 1)
+
+    def test_count(self):
+        item_ids = []
+        for idx in range(5):
+            item = {'number': idx}
+            self.resource.db_put_item(PARTITION, item)
+            item_ids.append(item['id'])
+        self.resource.db_put_items(PARTITION, [{'number': idx} for idx in range(3)])
+        self.assertEqual(self.resource.db_get_count(PARTITION), 8)
+        self.resource.db_delete_item(item_ids[0])
+        self.assertEqual(self.resource.db_get_count(PARTITION), 7)
+
+
+class DbUpdateTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.resource.db_create_partition(PARTITION)
+
+    def ids_equal(self, field, value):
+        items, _ = self.resource.db_query(PARTITION, [(None, (field, 'eq', value))])
+        return [item['id'] for item in items]
+
+    def test_update_moves_index(self):
+        item = {'color': 'red', 'size': 1, 'shape': 'round'}
+        self.resource.db_put_item(PARTITION, item)
+        item_id = item['id']
+
+        item = self.resource.db_get_item(item_id)
+        item['color'] = 'blue'
+        item.pop('shape')
+        item['weight'] = 3
+        self.assertTrue(self.resource.db_update_item(item_id, item))
+
+        self.assertEqual(self.ids_equal('color', 'red'), [])
+        self.assertEqual(self.ids_equal('color', 'blue'), [item_id])
+        self.assertEqual(self.ids_equal('shape', 'round'), [])
+        self.assertEqual(self.ids_equal('size', 1), [item_id])
+        self.assertEqual(self.ids_equal('weight', 3), [item_id])
+
+    def test_conditional_update(self):
+        item = {'status': 'queued'}
+        self.resource.db_put_item(PARTITION, item)
+        item_id = item['id']
+
+        claimed = dict(self.resource.db_get_item(item_id), status='running')
+        self.assertTrue(self.resource.db_update_item(item_id, claimed, condition=('status', 'queued')))
+        stale = dict(claimed, status='done')
+        self.assertFalse(self.resource.db_update_item(item_id, stale, condition=('status', 'queued')))
+        self.assertEqual(self.resource.db_get_item(item_id)['status'], 'running')
+        self.assertEqual(self.ids_equal('status', 'running'), [item_id])
+
+
+class DbAddToItemTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.resource.db_create_partition(PARTITION)
+
+    def test_add_to_item(self):
+        self.resource.db_add_to_item(PARTITION, 'counter1', 'count', 2, item={'name': 'a'}, creation_date=1000)
+        self.resource.db_add_to_item(PARTITION, 'counter1', 'count', 3, item={'name': 'b'}, creation_date=2000)
+
+        item = self.resource.db_get_item('counter1')
+        self.assertEqual(item['count'], 5)
+        self.assertEqual(item['name'], 'b')
+        self.assertEqual(item['partition'], PARTITION)
+        self.assertEqual(item['creationDate'], 1000)  # Set by the first write only
+        # Counters are neither indexed nor counted
+        items, _ = self.resource.db_query(PARTITION, [(None, ('name', 'eq', 'b'))])
+        self.assertEqual(items, [])
+        self.assertEqual(self.resource.db_get_count(PARTITION), 0)
+
+    def test_concurrent_adds(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: self.resource.db_add_to_item(PARTITION, 'counter1', 'count', 1),
+                              range(20)))
+        self.assertEqual(self.resource.db_get_item('counter1')['count'], 20)
+
+
+class MemoryDbQueryTest(MemoryBackend, DbQueryTestMixin, unittest.TestCase):
+    pass
+
+
+class MemoryRangeIndexedDbQueryTest(MemoryBackend, DbQueryTestMixin, unittest.TestCase):
+    range_indexed = True
+
+
+class MemoryWideRangeDbQueryTest(MemoryBackend, DbQueryTestMixin, unittest.TestCase):
+    """Ranges wider than range_stream_max_rows are read page by page in creation date order"""
+    range_indexed = True
+
+    def setUp(self):
+        super().setUp()
+        self.resource.range_stream_max_rows = 4
+
+
+class SQLiteDbQueryTest(SQLiteBackend, DbQueryTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteRangeIndexedDbQueryTest(SQLiteBackend, DbQueryTestMixin, unittest.TestCase):
+    range_indexed = True
+
+
+class AWSRangeIndexedDbQueryTest(AWSBackend, DbQueryTestMixin, unittest.TestCase):
+    range_indexed = True
+    item_count = 30  # moto reads the whole table on every query
+    queries = [instructions for instructions in QUERIES
+               if any(condition in ('gt', 'ge', 'ls', 'le') for _, (_, condition, _) in instructions)]
+    page_limits = (7,)
+
+    def put_items(self, items):
+        # moto copies the table on every transaction
+        self.resource.db_put_items(PARTITION, items)
+
+    def test_ranges_are_not_scanned(self):
+        with mock.patch.object(self.resource, 'db_get_items_in_partition_since', side_effect=AssertionError):
+            for max_rows in (4, 1000):
+                self.resource.range_stream_max_rows = max_rows
+                instructions = [(None, ('number', 'gt', 20))]
+                with self.subTest(range_stream_max_rows=max_rows):
+                    self.assertEqual(self.query_ids(instructions, 7), expected_ids(self.items, instructions))
+
+    def test_wide_ranges_are_paged(self):
+        self.resource.range_stream_max_rows = 4
+        self.test_query_pages()
+
+
+class MemoryDbPutTest(MemoryBackend, DbPutTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteDbPutTest(SQLiteBackend, DbPutTestMixin, unittest.TestCase):
+    pass
+
+
+class MemoryDbUpdateTest(MemoryBackend, DbUpdateTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteDbUpdateTest(SQLiteBackend, DbUpdateTestMixin, unittest.TestCase):
+    pass
+
+
+class DbQueryPlanTestMixin:
+    """Plans of Resource.db_query, SQLiteResource compiles queries to SQL instead"""
+    def setUp(self):
+        super().setUp()
+        self.resource.db_create_partition(PARTITION)
+        for idx in range(30):
+            self.resource.db_put_item(PARTITION, {'mod2': idx % 2, 'mod3': idx % 3, 'rare': int(idx == 7),
+                                                  'number': idx})
+
+    def plan_types(self, instructions, explain=False):
+        plan = self.resource.db_query_plan(PARTITION, instructions, explain=explain)
+        return [(step['type'], step['statements'][0][0]) for step in plan['steps']]
+
+    def test_single_index_is_planned_without_counts(self):
+        with mock.patch.object(self.resource, 'db_get_count', side_effect=AssertionError), \
+                mock.patch.object(self.resource, 'db_get_item_count_equal', side_effect=AssertionError):
+            self.assertEqual(self.plan_types([(None, ('mod2', 'eq', 0))]), [('index', 'mod2')])
+            self.assertEqual(self.plan_types([(None, ('mod2', 'eq', 0)), ('and', ('number', 'gt', 3))]),
+                             [('index', 'mod2'), ('filter', 'number')])
+
+    def test_most_selective_index_first(self):
+        instructions = [(None, ('mod2', 'eq', 1)), ('and', ('rare', 'eq', 1))]
+        self.assertEqual(self.plan_types(instructions), [('index', 'rare'), ('index', 'mod2')])
+
+    def test_scan_when_indexes_read_more_than_the_partition(self):
+        instructions = [(None, ('mod2', 'eq', 1)), ('and', ('mod2', 'eq', 1)), ('and', ('mod3', 'eq', 1))]
+        self.assertEqual(self.plan_types(instructions), [('scan', 'mod2')])
+        items, _ = self.resource.db_query(PARTITION, instructions)
+        self.assertEqual(sorted(item['number'] for item in items), [1, 7, 13, 19, 25])
+
+    def test_explained_plan_is_run(self):
+        import cloud.database.query_items as query_items
+        instructions = [(None, ('mod2', 'eq', 1)), ('and', ('rare', 'eq', 1))]
+        data = {'params': {'partition': PARTITION, 'query': instructions, 'explain': True},
+                'user': {'id': 'admin', 'groups': ['admin']}}
+        with mock.patch.object(self.resource, 'db_query_plan', wraps=self.resource.db_query_plan) as plan:
+            body = query_items.do(data, self.resource)['body']
+        self.assertEqual(plan.call_count, 1)
+        self.assertEqual([step['type'] for step in body['explain']['steps']], ['index', 'index'])
+        self.assertEqual([item['number'] for item in body['items']], [7])
+
+
+class MemoryDbQueryPlanTest(MemoryBackend, DbQueryPlanTestMixin, unittest.TestCase):
+    pass
+
+
+class MemoryDbAddToItemTest(MemoryBackend, DbAddToItemTestMixin, unittest.TestCase):
+    pass
+
+
+class SQLiteDbAddToItemTest(SQLiteBackend, DbAddToItemTestMixin, unittest.TestCase):
+    pass
+
+
+class AWSDbAddToItemTest(AWSBackend, DbAddToItemTestMixin, unittest.TestCase):
+    pass